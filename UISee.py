@@ -1,14 +1,21 @@
 from services.mqtt_service import MQTTService
-from db_bootstrap import init_db, parse_sql_and_js, ask_user_for_folders
-import sqlite3
+from db_bootstrap import init_db, parse_sql_and_js, ask_user_for_folders, refresh_widget_search, search_widgets as search_widget_index
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
 import os
 import subprocess
+import threading
 import time
 from datetime import datetime
 from utils.ui_mapper_adapter import UIMQTTAdapter
+from services.mqtt_router import known_topics
+from services.results_sink import ResultsSink, default_results_path
+from services.ssh_pool import run_ssh
+from services.step_plan import compile_steps
+from services.step_scheduler import StepScheduler
+from db_connection import get_manager
+from page_cache import get_page_cache
 from dotenv import load_dotenv
 import re
 
@@ -20,7 +27,8 @@ class UIMapperGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("UI Structure Mapper")
-        self.conn = sqlite3.connect(DB_FILE)
+        self.db = get_manager(DB_FILE)  # All writes go through its writer thread
+        self.page_cache = get_page_cache(DB_FILE)  # Invalidate pages after writing their data
         self.test_creds = {
             "host": os.getenv("SSH_HOST", ""),
             "user": os.getenv("SSH_USER", "")
@@ -32,11 +40,13 @@ class UIMapperGUI:
             "port": os.getenv("MQTT_PORT", "1883")
         }
 
-        self.mqtt_adapter = UIMQTTAdapter(self.test_creds) 
+        self.mqtt_adapter = UIMQTTAdapter(self.test_creds, self.mqtt_creds)  # Connects on first use
+        self.mqtt_adapter.client.add_state_listener(self.show_mqtt_state)
         self.ssh_process = None
         self.configured_inputs = []
         self.command_queue = []
         self.mqtt_output_buffer = []
+        self.mqtt_routed_topics = []  # Topics routed to show_mqtt_message, see subscribe_mqtt
 
         # self.tabs = {
         #    "All": tk.Listbox(self.root, height=10),
@@ -54,11 +64,17 @@ class UIMapperGUI:
 
 
         self.init_function_map_table()
+        self.db.write(init_db)  # Apply pending schema migrations to an existing database
         self.setup_ui()
         self.fetch_configured_inputs()
         self.load_pages()
         self.mqtt_topics = set()
 
+    @property
+    def conn(self):
+        # Looked up on each use: rebuild_db closes the connections handed out before the swap
+        return self.db.connection()
+
     def setup_ui(self):
         self.output_console = tk.Text(self.root, height=6, bg="black", fg="lime", insertbackground="white")
         self.output_console.pack(fill=tk.X, padx=5, pady=(0, 5))
@@ -158,8 +174,7 @@ class UIMapperGUI:
             host = host_entry.get().strip()
             user = user_entry.get().strip()
             if host and user:
-                cur.execute("INSERT INTO ssh_targets (host, user) VALUES (?, ?)", (host, user))
-                self.conn.commit()
+                self.db.write("INSERT INTO ssh_targets (host, user) VALUES (?, ?)", (host, user))
                 messagebox.showinfo("Saved", f"Saved {user}@{host} to DB.")
 
         ttk.Button(win, text="Connect", command=launch_ssh).pack(pady=5)
@@ -186,10 +201,9 @@ class UIMapperGUI:
         self.conn.commit()
 
     def log_command_history(self, command, result):
-        cur = self.conn.cursor()
-        cur.execute("INSERT INTO command_history (command, result, timestamp) VALUES (?, ?, ?)",
-                    (command, result, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        self.conn.commit()
+        # Fire and forget: callers include the queue runner, which must not wait on the DB
+        self.db.write("INSERT INTO command_history (command, result, timestamp) VALUES (?, ?, ?)",
+                      (command, result, datetime.now().strftime('%Y-%m-%d %H:%M:%S')), wait=False)
 
     def subscribe_mqtt(self):
         win = tk.Toplevel(self.root)
@@ -221,8 +235,14 @@ class UIMapperGUI:
             self.mqtt_creds["host"] = host_entry.get()
             self.mqtt_creds["port"] = port_entry.get()
             try:
-                self.mqtt_adapter.client.subscribe("#")
-                self.output_console.insert(tk.END, f"\n[MQTT Subscribed] Topic: #\n")
+                # Only the topics the parser found in the JS files, not the whole broker ("#")
+                self.mqtt_adapter.client.unroute(self.mqtt_routed_topics, self.show_mqtt_message)
+                self.mqtt_adapter.client.remove_state_listener(self.show_mqtt_state)
+                client = self.mqtt_adapter.set_broker(self.mqtt_creds)
+                client.add_state_listener(self.show_mqtt_state)
+                self.mqtt_routed_topics = known_topics(DB_FILE)
+                client.route(self.mqtt_routed_topics, self.show_mqtt_message)
+                self.output_console.insert(tk.END, f"\n[MQTT Subscribed] {len(self.mqtt_routed_topics)} topics from parsed JS files\n")
             except Exception as e:
                 self.output_console.insert(tk.END, f"[MQTT ERROR] {str(e)}\n")
             win.destroy()
@@ -238,9 +258,20 @@ class UIMapperGUI:
         ttk.Button(win, text="Subscribe", command=save_and_subscribe).pack(pady=5)
         ttk.Button(win, text="Test MQTT Connection", command=test_connection).pack(pady=5)
 
+    def show_mqtt_message(self, message):
+        """Router handler for subscribed topics; runs on the MQTT network thread."""
+        line = f"{message.topic}: {message.text}"
+        self.mqtt_output_buffer.append(line)
+        self.root.after(0, lambda: self.output_console.insert(tk.END, f"\n[MQTT MSG] {line}"))
+
+    def show_mqtt_state(self, state, detail):
+        """Connection state listener; runs on the MQTT threads."""
+        self.root.after(0, lambda: self.output_console.insert(tk.END, f"\n[MQTT {state.upper()}] {detail}"))
+
     def send_mqtt_command(self, cmd):
         self.output_console.insert(tk.END, f"\n[MQTT IN] {cmd}")
-        response = self.mqtt_adapter.send_command_and_wait(cmd.split("=")[0], cmd.split("=")[1])
+        path, value = cmd.split("=", 1)
+        response = self.mqtt_adapter.send_command_and_wait(path, value)
         if response["success"]:
             self.output_console.insert(tk.END, f"\n[MQTT OUT] {response['response']}")
             self.log_command_history(cmd, response['response'])
@@ -332,7 +363,7 @@ class UIMapperGUI:
             messagebox.showinfo("Exported", f"BVT Test exported to:\n{file_path}")
 
     def connect_to_test_controller(self):
-        cur = self.conn.cursor() if self.conn else sqlite3.connect(DB_FILE).cursor()
+        cur = self.conn.cursor()
         cur.execute("SELECT host, user FROM ssh_credentials ORDER BY id DESC LIMIT 1")
         row = cur.fetchone()
 
@@ -343,12 +374,17 @@ class UIMapperGUI:
             creds["user"] = user_entry.get()
             self.test_creds = creds
 
-            cur.execute("DELETE FROM ssh_credentials")
-            cur.execute("INSERT INTO ssh_credentials (host, user) VALUES (?, ?)", (creds['host'], creds['user']))
-            self.conn.commit()
+            def save_credentials(conn):
+                conn.execute("DELETE FROM ssh_credentials")
+                conn.execute("INSERT INTO ssh_credentials (host, user) VALUES (?, ?)", (creds['host'], creds['user']))
+
+            self.db.write(save_credentials)
 
-            #recreate MQTT adapter with our updated credentials
-            self.mqtt_adapter = UIMQTTAdapter(self.test_creds)
+            #recreate MQTT adapter with our updated credentials (the MQTT client itself is shared)
+            self.mqtt_adapter.client.remove_state_listener(self.show_mqtt_state)
+            self.mqtt_adapter.close()
+            self.mqtt_adapter = UIMQTTAdapter(self.test_creds, self.mqtt_creds)
+            self.mqtt_adapter.client.add_state_listener(self.show_mqtt_state)
             
             ssh_cmd = f"ssh {creds['user']}@{creds['host']}"
             subprocess.Popen(["cmd.exe", "/k", ssh_cmd])
@@ -374,16 +410,24 @@ class UIMapperGUI:
             messagebox.showwarning("Not Connected", "Please connect to a test controller first.")
             return
 
+        def show_line(stream, line):
+            self.root.after(0, self.output_console.insert, tk.END, f"{line}\n")
+
+        def stream(cmd):
+            # Lines appear as the command prints them, so long diagnostics and tail-style commands are usable
+            try:
+                result = run_ssh(self.test_creds['host'], self.test_creds['user'], cmd, subscribers=(show_line,))
+                if result.truncated:
+                    self.root.after(0, self.output_console.insert, tk.END, "[stopped: output limit reached]\n")
+            except Exception as e:
+                self.root.after(0, self.output_console.insert, tk.END, f"\nError: {str(e)}")
+
         def execute():
             cmd = command_entry.get().strip()
             if not cmd:
                 return
-            ssh_cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} {cmd}"
-            try:
-                result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
-                self.output_console.insert(tk.END, f"\n$ {cmd}\n{result.stdout}{result.stderr}")
-            except Exception as e:
-                self.output_console.insert(tk.END, f"\nError: {str(e)}")
+            self.output_console.insert(tk.END, f"\n$ {cmd}\n")
+            threading.Thread(target=stream, args=(cmd,), daemon=True).start()
 
         win = tk.Toplevel(self.root)
         win.title("Run Remote Command")
@@ -402,16 +446,9 @@ class UIMapperGUI:
         with open(js_path, 'r', encoding='utf-8') as f:
             content = f.read()
 
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        cur.execute("DELETE FROM js_functions WHERE page_name = ?", (page_name,))
-
         matches = re.findall(r'(?:function|var)\s+([a-zA-Z0-9_]+)\s*=?\s*function\s*\((.*?)\)', content)
-        for fn_name, args in matches:
-            cur.execute("INSERT INTO js_functions (page_name, function_name, parameters) VALUES (?, ?, ?)",
-                        (page_name, fn_name, args.strip()))
-        conn.commit()
-        conn.close()
+        self.db.write(lambda conn: self._replace_js_functions(conn, page_name, matches))
+        self.page_cache.invalidate(page_name)
 
         messagebox.showinfo("Success", f"{len(matches)} functions assigned to page '{page_name}'.")
         self.apply_filters()
@@ -434,61 +471,43 @@ class UIMapperGUI:
         search_text = self.search_entry.get().lower()
         selected_type = self.type_filter.get()
 
-        self.widget_tree.delete(*self.widget_tree.get_children())
         self.details_text.delete(1.0, tk.END)
 
-        cur = self.conn.cursor()
+        # Loaded once per page; filtering below runs in memory
+        page = self.page_cache.get(self.page_name)
 
-        # Get widgets for the current page
-        cur.execute("""
-            SELECT id, widget_type, widget_name, widget_index,
-                   widget_config_id, widget_id FROM widgets
-            WHERE page_name = ?
-        """, (self.page_name,))
-        rows = cur.fetchall()
+        fn_results = page.functions
+        self.function_string = ", ".join(fn_results[:3]) + ("..." if len(fn_results) > 3 else "")
 
-        # Get all JS functions for the page
-        cur.execute("SELECT function_name FROM js_functions WHERE page_name = ?", (self.page_name,))
-        fn_results = [row[0] for row in cur.fetchall()]
-        function_string = ", ".join(fn_results[:3]) + ("..." if len(fn_results) > 3 else "")
-
-        for row in rows:
-            db_id, widget_type, widget_name, widget_index, config_id, widget_id = row
-            if (selected_type == "All" or widget_type.lower() == selected_type.lower()) and \
-               (search_text in widget_name.lower() or search_text in widget_type.lower()):
-                self.widget_tree.insert('', tk.END, values=(widget_type, widget_name, widget_index, function_string),
-                                        tags=(db_id, config_id, widget_id))
+        # widget_tree is a gui.virtual_tree.VirtualTreeview: only the visible rows become Tk items
+        self.widget_tree.set_rows(page.filter_widgets(search_text, selected_type))
 
         self.details_text.insert(tk.END, f"Widgets on page: {self.page_name}\n")
 
         # Navigation info
-        cur.execute("SELECT function FROM navigations WHERE target_page = ?", (self.page_name,))
-        navs = cur.fetchall()
-        if navs:
+        if page.navigations:
             self.details_text.insert(tk.END, "\nNavigation Paths:\n")
-            for row in navs:
-                nav = row[0]
-                if search_text in nav.lower() or not search_text:
-                    self.details_text.insert(tk.END, f"- {nav}\n")
+            for nav in page.filter_navigations(search_text):
+                self.details_text.insert(tk.END, f"- {nav}\n")
 
         # Page configuration
-        cur.execute("SELECT tag, value FROM page_details WHERE page_name = ?", (self.page_name,))
-        page_tags = cur.fetchall()
+        page_tags = page.page_details
         if page_tags:
             self.details_text.insert(tk.END, "\nPage Configuration:\n")
             for tag, value in page_tags:
                 self.details_text.insert(tk.END, f"{tag}: {value}\n")
 
 
-    def on_widget_select(self, event):
-        selected_item = self.widget_tree.focus()
-        values = self.widget_tree.item(selected_item, 'values')
-        tags = self.widget_tree.item(selected_item, 'tags')
-        if not values or len(tags) < 3:
+    def widget_tree_values(self, row):
+        """Column values of one widget_tree row (a page_cache.WidgetRow)."""
+        return row.widget_type, row.widget_name, row.widget_index, getattr(self, "function_string", "")
+
+    def on_widget_select(self, event=None):
+        row = self.widget_tree.selected_row()
+        if row is None:
             return
 
-        widget_type, widget_name, widget_index, _ = values
-        db_id, config_id, widget_id = tags
+        db_id, widget_type, widget_name, widget_index, config_id, widget_id = row
 
         widget_data = {
             "db_id": db_id,
@@ -603,43 +622,9 @@ class UIMapperGUI:
         messagebox.showinfo("Copied", f"Copied to clipboard:\n{path}")
 
     def preview_full_page(self):
-        preview_win = tk.Toplevel(self.root)
-        preview_win.title(f"Preview: {self.page_name}")
-
-        canvas = tk.Canvas(preview_win, bg="#f0f0f0")
-        scrollbar = tk.Scrollbar(preview_win, orient=tk.VERTICAL, command=canvas.yview)
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        scroll_frame = ttk.Frame(canvas)
-        scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        cur = self.conn.cursor()
-        cur.execute("""
-            SELECT id, widget_type, widget_name FROM widgets WHERE page_name = ?
-        """, (self.page_name,))
-        widgets = cur.fetchall()
-
-        row = 0
-        for db_id, widget_type, widget_name in widgets:
-            display = widget_name or f"Widget_{db_id}"
-            widget_type = widget_type.lower()
-
-            if widget_type == "button":
-                w = ttk.Button(scroll_frame, text=display,
-                               command=lambda name=widget_name: self.generate_bvt_sequence(name))
-            elif widget_type == "textbox":
-                w = ttk.Entry(scroll_frame)
-                w.insert(0, display)
-            elif widget_type == "label":
-                w = ttk.Label(scroll_frame, text=display)
-            else:
-                w = ttk.Label(scroll_frame, text=f"[{widget_type}] {display}")
-            w.grid(row=row, column=0, padx=10, pady=5, sticky="w")
-            row += 1
+        # Draws only the rows in view and fetches them in chunks, so large pages open instantly
+        from gui.preview_full_page import PreviewPage
+        PreviewPage(self.root, self.conn, self.page_name, self.generate_bvt_sequence).open()
 
     def generate_bvt_sequence(self, widget_name):
         lines = []
@@ -681,9 +666,7 @@ class UIMapperGUI:
     def fetch_configured_inputs(self):
         # This function would realistically query the controller or cached JS to get configured inputs
         try:
-            result = subprocess.run("ssh {}@{} ec get_input_config".format(
-                self.test_creds['user'], self.test_creds['host']),
-                shell=True, capture_output=True, text=True)
+            result = run_ssh(self.test_creds['host'], self.test_creds['user'], "ec get_input_config")
             if result.stdout:
                 data = json.loads(result.stdout.strip())
                 self.configured_inputs = [d['name'] for d in data if 'name' in d]
@@ -715,6 +698,29 @@ class UIMapperGUI:
 
         ttk.Button(win, text="Send", command=send_input).pack(pady=10)
 
+    def compile_queue(self, steps, skip_post_wait=False):
+        """Compile and validate a test queue once before running it. :return: StepPlan, or None after showing errors."""
+        plan = compile_steps(steps, DB_FILE, skip_post_wait=skip_post_wait)
+        if plan.errors:
+            messagebox.showerror("Invalid Test Queue", plan.describe_issues())
+            return None
+        if plan.warnings:
+            self.output_console.insert(tk.END, f"\n[QUEUE] {plan.describe_issues()}\n")
+        return plan
+
+    def run_steps_in_console(self, steps):
+        """Run a queue step by step on the UI thread, echoing each step and its result to the console."""
+        plan = self.compile_queue(steps)
+        if plan is None:
+            return
+        scheduler = StepScheduler(self.mqtt_adapter, self.test_creds)
+        for step in plan:
+            self.output_console.insert(tk.END, f"\n[STEP] {step.kind.upper()} - {step.label}\n")
+            self.root.update()
+            result = scheduler.run_step(step)
+            detail = result.get("output") or result.get("response") or result.get("error") or ""
+            self.output_console.insert(tk.END, f"{result.get('status')}: {detail}\n")
+
     def run_ssh_command(self, command):
         if not self.test_creds or not self.test_creds.get("host") or not self.test_creds.get("user"):
             messagebox.showwarning("Not Connected", "Connect to a test controller first.")
@@ -722,10 +728,9 @@ class UIMapperGUI:
 
         host = self.test_creds.get("host")
         user = self.test_creds.get("user")
-        ssh_cmd = f"ssh {user}@{host} '{command}'"
 
         try:
-            result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
+            result = run_ssh(host, user, command)
             return result.stdout.strip() or result.stderr.strip()
         except Exception as e:
             return f"SSH Error: {str(e)}"
@@ -768,9 +773,8 @@ class UIMapperGUI:
 
             ec_command = f"echo '{widget_path}={value}' > /dev/ttyGS0"
 
-            ssh_cmd = f"ssh {user}@{host} \"{ec_command}\""
             try:
-                result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
+                result = run_ssh(host, user, ec_command)
                 output = result.stdout + result.stderr
                 self.output_console.insert(tk.END, f"\n[EC SIMULATION]\n{output}")
             except Exception as e:
@@ -863,6 +867,14 @@ class UIMapperGUI:
                 topics.add(match)
         return topics
 
+    def _replace_js_functions(self, conn, page_name, matches):
+        """Write job: replace a page's JS functions and refresh its search rows."""
+        cur = conn.cursor()
+        cur.execute("DELETE FROM js_functions WHERE page_name = ?", (page_name,))
+        cur.executemany("INSERT INTO js_functions (page_name, function_name, parameters) VALUES (?, ?, ?)",
+                        [(page_name, fn_name, args.strip()) for fn_name, args in matches])
+        refresh_widget_search(cur, [page_name])
+
     def register_js_file(self, js_path):
         if not js_path:
             return
@@ -871,22 +883,19 @@ class UIMapperGUI:
         with open(js_path, 'r', encoding='utf-8') as f:
             content = f.read()
 
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM js_functions WHERE page_name = ?", (page_name,))
-
         matches = re.findall(r'(?:function|var)\s+([a-zA-Z0-9_]+)\s*=?\s*function\s*\((.*?)\)', content)
-        for fn_name, args in matches:
-            cur.execute("INSERT INTO js_functions (page_name, function_name, parameters) VALUES (?, ?, ?)",
-                        (page_name, fn_name, args.strip()))
-        self.conn.commit()
-
         topics_found = self.extract_mqtt_topics(content)
         self.mqtt_topics.update(topics_found)
 
-        messagebox.showinfo("Success", f"{len(matches)} functions assigned to page '{page_name}'.\n{len(topics_found)} MQTT topics detected.")
+        def assign(conn):
+            self._replace_js_functions(conn, page_name, matches)
+            conn.executemany("INSERT OR IGNORE INTO mqtt_topics (page_name, topic) VALUES (?, ?)",
+                             [(page_name, topic) for topic in topics_found])
 
-        for topic in topics_found:
-            cur.execute("INSERT INTO mqtt_topics (page_name, topic) VALUES (?, ?)", (page_name, topic))
+        self.db.write(assign)
+        self.page_cache.invalidate(page_name)
+
+        messagebox.showinfo("Success", f"{len(matches)} functions assigned to page '{page_name}'.\n{len(topics_found)} MQTT topics detected.")
 
         self.apply_filters()
 
@@ -1003,9 +1012,7 @@ class UIMapperGUI:
             query = query.strip().lower()
             if not query:
                 return
-            cur = self.conn.cursor()
-            cur.execute("SELECT page_name, widget_name FROM widgets")
-            matches = [(p, w) for p, w in cur.fetchall() if query in w.lower() or query in p.lower()]
+            matches = [(p, w) for _, p, w, _ in search_widget_index(self.conn, query, limit=200)]
 
             if not matches:
                 messagebox.showinfo("No Results", "No matching widgets found.")
@@ -1081,25 +1088,7 @@ class UIMapperGUI:
             ttk.Button(modal, text="Add", command=submit).pack(pady=5)
 
         def run_sequence():
-            for typ, val in steps:
-                self.output_console.insert(tk.END, f"\n[STEP] {typ.upper()} - {val}\n")
-                if typ == "mqtt":
-                    path, v = val.split("=")
-                    result = self.mqtt_adapter.send_command_and_wait(path.strip(), v.strip())
-                    self.output_console.insert(tk.END, f"Result: {result}\n")
-                elif typ == "ssh":
-                    cmd = val.strip()
-                    full_cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} '{cmd}'"
-                    try:
-                        out = subprocess.run(full_cmd, shell=True, capture_output=True, text=True)
-                        self.output_console.insert(tk.END, out.stdout + out.stderr)
-                    except Exception as e:
-                        self.output_console.insert(tk.END, f"SSH ERROR: {str(e)}\n")
-                elif typ == "wait":
-                    secs = int(val.split()[0])
-                    self.output_console.insert(tk.END, f"Waiting {secs} seconds...\n")
-                    self.root.update()
-                    time.sleep(secs)
+            self.run_steps_in_console(steps)
 
         def show_page_details():
             details_win = tk.Toplevel(win)
@@ -1143,18 +1132,18 @@ class UIMapperGUI:
                 if not function:
                     messagebox.showwarning("Missing", "Select a valid function")
                     return
-                cur.execute("DELETE FROM widget_function_map WHERE page_name=? AND widget_name=? AND property=?",
-                            (selected_page.get(), selected_widget.get(), selected_property.get()))
-                cur.execute("INSERT INTO widget_function_map (page_name, widget_name, property, function_name) VALUES (?, ?, ?, ?)",
-                            (selected_page.get(), selected_widget.get(), selected_property.get(), function))
-                self.conn.commit()
+                self.db.write("""
+                    INSERT INTO widget_function_map (page_name, widget_name, property, function_name) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (page_name, widget_name, property) DO UPDATE SET function_name = excluded.function_name
+                """, (selected_page.get(), selected_widget.get(), selected_property.get(), function))
+                self.page_cache.invalidate(selected_page.get())
                 messagebox.showinfo("Mapped", f"Mapped to function: {function}")
                 fn_win.destroy()
 
             def delete_mapping():
-                cur.execute("DELETE FROM widget_function_map WHERE page_name=? AND widget_name=? AND property=?",
-                            (selected_page.get(), selected_widget.get(), selected_property.get()))
-                self.conn.commit()
+                self.db.write("DELETE FROM widget_function_map WHERE page_name=? AND widget_name=? AND property=?",
+                              (selected_page.get(), selected_widget.get(), selected_property.get()))
+                self.page_cache.invalidate(selected_page.get())
                 messagebox.showinfo("Removed", "Mapping removed.")
                 fn_win.destroy()
 
@@ -1357,45 +1346,23 @@ class UIMapperGUI:
 
 
         def run_timed_sequence():
-            results = []
             repeat_count = max(1, repeat_var.get())
-            for repeat_index in range(repeat_count):
-                for step in steps:
-                    start_time = datetime.now()
-                    time.sleep(step.get("pre_wait", 2))
-                    result = {
-                        "repeat": repeat_index + 1,
-                        "type": step["type"],
-                        "start": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "command": step.get("command", step.get("value", ""))
-                    }
-                    try:
-                        if step["type"] == "wait":
-                            time.sleep(step["value"])
-                            result["status"] = "waited"
-                            result["output"] = f"Waited {step['value']} seconds"
-                        elif step["type"] == "mqtt":
-                            r = self.mqtt_adapter.send_command_and_wait(*step["command"].split("="))
-                            result.update(r)
-                        elif step["type"] == "ssh":
-                            ssh_cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} \"{step['command']}\""
-                            proc = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
-                            result["status"] = "success" if proc.returncode == 0 else "fail"
-                            result["output"] = proc.stdout.strip() + proc.stderr.strip()
-                    except Exception as e:
-                        result["status"] = "error"
-                        result["output"] = str(e)
-                    if not skip_post_wait.get():
-                        time.sleep(step.get("post_wait", 2))
-                    result["end"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    result["duration_sec"] = (datetime.strptime(result["end"], "%Y-%m-%d %H:%M:%S") - start_time).total_seconds()
-                    results.append(result)
-
-            export_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
-            if export_path:
-                with open(export_path, "w") as f:
-                    json.dump(results, f, indent=2)
-                messagebox.showinfo("Export Complete", f"Results exported to:\n{export_path}")
+            plan = self.compile_queue(steps, skip_post_wait.get())
+            if plan is None:
+                return
+            path = filedialog.asksaveasfilename(title="Record Results To", defaultextension=".jsonl",
+                                                filetypes=[("JSON Lines", "*.jsonl")]) or default_results_path()
+
+            def step_done(r):
+                sink.record(r)
+                log_message(f"{r['type']} {r['command']}: {r.get('status')} in {r['duration_sec']}s")
+
+            # Results go to disk as each step finishes instead of piling up until the end
+            with ResultsSink(path, {"plan": plan.fingerprint(), "steps": len(plan), "repeat_count": repeat_count}) as sink:
+                # Steps advance on their reply, exit or condition; only wait steps sleep
+                StepScheduler(self.mqtt_adapter, self.test_creds).run(plan, repeat_count, on_result=step_done,
+                                                                      keep_results=False)
+            messagebox.showinfo("Run Complete", f"Results recorded to:\n{sink.path}")
 
         controls = tk.Frame(win)
         controls.pack(fill=tk.X, padx=10, pady=5)
@@ -1427,13 +1394,13 @@ class UIMapperGUI:
 
         step_frame = scrollable_step_frame  # hook it into the original references
 
-        steps.append({"type": "mqtt", "command": "Page.Widgets.Pump1.IsSet=1", "pre_wait": 2, "post_wait": 2})
+        steps.append({"type": "mqtt", "command": "Page.Widgets.Pump1.IsSet=1"})
         outputs.append("[MQTT] Would publish to topic 'exec' with command: Page.Widgets.Pump1.IsSet=1")
 
         steps.append({"type": "wait", "value": 10})
         outputs.append("[WAIT] Would wait 10 seconds.")
 
-        steps.append({"type": "ssh", "command": "ec simin a_tra1 55.5", "pre_wait": 2, "post_wait": 2})
+        steps.append({"type": "ssh", "command": "ec simin a_tra1 55.5"})
         outputs.append("[SSH] Would send 'ec simin a_tra1 55.5' to remote controller")
 
         refresh_steps()
@@ -1471,8 +1438,9 @@ class UIMapperGUI:
                 ttk.Label(modal, text="Value:").pack(anchor="w")
                 value_entry = ttk.Entry(modal)
                 value_entry.pack(fill=tk.X)
-                path_entry.insert(0, step["command"].split("=")[0])
-                value_entry.insert(0, step["command"].split("=")[1])
+                path, _, value = step["command"].partition("=")
+                path_entry.insert(0, path)
+                value_entry.insert(0, value)
 
                 def apply():
                     step["command"] = f"{path_entry.get()}={value_entry.get()}"
@@ -1648,32 +1616,7 @@ class UIMapperGUI:
             ttk.Button(modal, text="Add", command=submit).pack(pady=5)
 
         def run_sequence():
-            for step in steps:
-                typ = step.get("type")
-                self.output_console.insert(tk.END, f"\n[STEP] {typ.upper()}\n")
-                if typ == "mqtt":
-                    cmd = step["command"]
-                    path, v = cmd.split("=")
-                    result = self.mqtt_adapter.send_command_and_wait(path.strip(), v.strip())
-                    self.output_console.insert(tk.END, f"Result: {result}\n")
-                elif typ == "ssh":
-                    cmd = step["command"]
-                    full_cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} '{cmd}'"
-                    try:
-                        out = subprocess.run(full_cmd, shell=True, capture_output=True, text=True)
-                        self.output_console.insert(tk.END, out.stdout + out.stderr)
-                    except Exception as e:
-                        self.output_console.insert(tk.END, f"SSH ERROR: {str(e)}\n")
-                elif typ == "wait":
-                    secs = step.get("value", 1)
-                    self.output_console.insert(tk.END, f"Waiting {secs} seconds...\n")
-                    self.root.update()
-                    time.sleep(secs)
-                elif typ == "simin":
-                    name, value = step["command"].split()
-                    cmd = f"ec -s simin {name} {value}"
-                    output = self.run_ssh_command(cmd)
-                    self.output_console.insert(tk.END, f"{output}\n")
+            self.run_steps_in_console(steps)
 
         def save_queue():
             file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
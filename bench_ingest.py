@@ -0,0 +1,140 @@
+"""
+Benchmark WidgetConfig decoding on a synthetic UIPages corpus.
+
+Compares the old two-pass decode (json.loads for Name/ButtonType/WidgetIndex,
+then extract_resources parsing the same string again) with the single-pass
+decode_widget_config, on the stdlib decoder and on the accelerated backend,
+then times a full ingest of the corpus into a scratch database and reports its
+size (set UISEE_WIDGET_CONFIG to compare the widget_config storage modes).
+
+Usage: python bench_ingest.py [--widgets 50000] [--pages 500] [--workers N]
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+from db_bootstrap import decode_widget_config, parse_sql_file, sync_sources, WIDGET_CONFIG_STORAGE
+from utils.json_backend import JSON_BACKEND
+from utils.sql_tokenizer import iter_insert_statements
+
+BUTTON_TYPES = ("Momentary", "Toggle", "Label", "Slider", "Image")
+
+
+def _widget_config(page, index, rng):
+    resources = [
+        {"tag": "Name", "value": f"P{page}W{index}"},
+        {"tag": "ButtonType", "value": rng.choice(BUTTON_TYPES)},
+        {"tag": "WidgetIndex", "value": str(index)},
+        {"tag": "Text", "value": f"Widget {index} on page {page}"},
+        {"tag": "X", "value": str(rng.randint(0, 800))},
+        {"tag": "Y", "value": str(rng.randint(0, 480))},
+        {"tag": "Width", "value": str(rng.randint(20, 200))},
+        {"tag": "Height", "value": str(rng.randint(20, 120))},
+        {"tag": "OnRelease", "value": f"NavigateTo(Page{rng.randint(0, 99)})"},
+        {"tag": "Image", "value": f"img/button_{rng.randint(0, 50)}.png"},
+    ]
+    return json.dumps({"Resources": {"resource": resources}})
+
+
+def build_corpus(root, widget_count, page_count, seed=0):
+    """Write page_count .sql files holding widget_count widgets in total."""
+    rng = random.Random(seed)
+    sql_folder = os.path.join(root, "sql")
+    js_folder = os.path.join(root, "js")
+    os.makedirs(sql_folder)
+    os.makedirs(js_folder)
+
+    widget_id = 0
+    per_page = -(-widget_count // page_count)
+    for page in range(page_count):
+        with open(os.path.join(sql_folder, f"Page{page}.sql"), "w", encoding="utf-8") as f:
+            page_config = json.dumps({"Resources": {"resource": [{"tag": "Title", "value": f"Page {page}"}]}})
+            f.write('INSERT INTO "PagesInstalled" ("PageName", "PageID", "PageConfig") '
+                    f"VALUES ('Page{page}', {page}, '{page_config}');\n")
+            for index in range(min(per_page, widget_count - widget_id)):
+                widget_id += 1
+                config = _widget_config(page, index, rng).replace('"', '""')
+                f.write('INSERT INTO "WidgetsInstalled" ("WidgetConfigID", "WidgetID", "WidgetConfig") '
+                        f"VALUES ({widget_id}, {widget_id}, '{config}');\n")
+        with open(os.path.join(js_folder, f"Page{page}.js"), "w", encoding="utf-8") as f:
+            f.write(f"function onLoad{page}() {{ NavigateTo(Page{(page + 1) % page_count}); }}\n")
+    return sql_folder, js_folder
+
+
+def _two_pass_decode(config_str):
+    """The decode ingestion used before decode_widget_config: one parse per consumer."""
+    widget_type = widget_name = widget_index = ""
+    try:
+        config_data = json.loads(config_str)
+        for entry in config_data.get("Resources", {}).get("resource", []):
+            tag = entry.get("tag")
+            if tag == "Name":
+                widget_name = entry.get("value")
+            elif tag == "ButtonType":
+                widget_type = entry.get("value")
+            elif tag == "WidgetIndex":
+                widget_index = entry.get("value")
+    except Exception:
+        pass
+    try:
+        config = json.loads(config_str)
+        resources = config.get("Resources", {}).get("resource", [])
+        tags = [(entry.get("tag"), entry.get("value")) for entry in resources if "tag" in entry]
+    except Exception:
+        tags = []
+    return widget_name, widget_type, widget_index, tags
+
+
+def _timed(label, func, *args, baseline=None):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    speedup = f"  ({baseline / elapsed:.2f}x)" if baseline else ""
+    print(f"  {label:<34} {elapsed:8.3f}s{speedup}")
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WidgetConfig decoding and ingestion.")
+    parser.add_argument("--widgets", type=int, default=50000, help="Number of synthetic widgets.")
+    parser.add_argument("--pages", type=int, default=500, help="Number of synthetic pages.")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes for the full ingest.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="uisee_bench_") as root:
+        sql_folder, js_folder = build_corpus(root, args.widgets, args.pages)
+        sql_files = sorted(os.path.join(sql_folder, name) for name in os.listdir(sql_folder))
+        configs = [values[2].replace('""', '"')
+                   for path in sql_files
+                   for _, _, values in iter_insert_statements(path, tables=("WidgetsInstalled",))]
+        print(f"Corpus: {len(configs)} widgets on {len(sql_files)} pages, JSON backend: {JSON_BACKEND}")
+
+        print("Decode stage:")
+        base, expected = _timed("two-pass (json)", lambda: [_two_pass_decode(c) for c in configs])
+        _, single = _timed("single-pass (json)",
+                           lambda: [decode_widget_config(c, loads=json.loads) for c in configs], baseline=base)
+        _, fast = _timed(f"single-pass ({JSON_BACKEND})",
+                         lambda: [decode_widget_config(c) for c in configs], baseline=base)
+        assert single == expected and fast == expected, "decoders disagree"
+
+        print("Parse stage (tokenize + decode, one process):")
+        _timed(f"parse_sql_file ({JSON_BACKEND})", lambda: [parse_sql_file(p) for p in sql_files])
+
+        print("Full ingest:")
+        db_path = os.path.join(root, "bench.db")
+        conn = sqlite3.connect(db_path)
+        try:
+            _timed("sync_sources", sync_sources, sql_folder, js_folder, conn, args.workers)
+        finally:
+            conn.close()
+        label = f"database size ({WIDGET_CONFIG_STORAGE} configs)"
+        print(f"  {label:<34} {os.path.getsize(db_path) / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Check that none of the GUI's hot queries (db_bootstrap.HOT_QUERIES) does a full
+table scan, by running EXPLAIN QUERY PLAN against a database at the current
+schema version.
+
+Usage: python check_query_plans.py [path/to/ui_map.db]
+With no path, a scratch database is built from db_bootstrap.init_db and
+database/shema.sql. An existing database is copied before it is migrated, so
+the file itself is never modified. Exits with status 1 if any query scans.
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+
+from db_bootstrap import init_db, find_full_scans, explain_hot_queries, SCHEMA_VERSION
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "shema.sql")
+
+
+def _check(label, conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    print(f"{label} (schema version {version}):")
+    for name, plan in explain_hot_queries(conn).items():
+        print(f"  {name}: {' | '.join(plan)}")
+
+    scans = find_full_scans(conn)
+    for name in scans:
+        print(f"  FULL SCAN: {name}")
+    if version != SCHEMA_VERSION:
+        print(f"  expected schema version {SCHEMA_VERSION}")
+        return False
+    return not scans
+
+
+def main():
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="uisee_plans_") as root:
+        db_path = os.path.join(root, "init_db.db")
+        conn = sqlite3.connect(db_path)
+        try:
+            init_db(conn)
+            ok &= _check("init_db", conn)
+        finally:
+            conn.close()
+
+        db_path = os.path.join(root, "shema.db")
+        conn = sqlite3.connect(db_path)
+        try:
+            with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
+                conn.executescript(f.read())
+            ok &= _check("database/shema.sql", conn)
+        finally:
+            conn.close()
+
+        if len(sys.argv) > 1:
+            db_path = os.path.join(root, "existing.db")
+            shutil.copyfile(sys.argv[1], db_path)
+            conn = sqlite3.connect(db_path)
+            try:
+                init_db(conn)
+                ok &= _check(f"{sys.argv[1]} after migration", conn)
+            finally:
+                conn.close()
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,33 +4,51 @@ CREATE TABLE IF NOT EXISTS pages (
     name TEXT UNIQUE
 );
 
--- Widgets table
-CREATE TABLE IF NOT EXISTS widgets (
+-- Interned widget tag names
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE
+);
+
+-- Widgets; widget_config is zlib-compressed, plain text or NULL (UISEE_WIDGET_CONFIG)
+CREATE TABLE IF NOT EXISTS widget_store (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    page_name TEXT,
+    page_id INTEGER REFERENCES pages(id),
     widget_type TEXT,
     widget_name TEXT,
     widget_index TEXT,
-    widget_config TEXT,
+    widget_config BLOB,
     widget_config_id INTEGER,
-    widget_id INTEGER
+    widget_id INTEGER,
+    source_id INTEGER
 );
 
--- Widget tag/value metadata
-CREATE TABLE IF NOT EXISTS widget_details (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    widget_id INTEGER,
-    tag TEXT,
+-- Widget tag/value metadata, clustered by widget
+CREATE TABLE IF NOT EXISTS widget_tags (
+    widget_id INTEGER REFERENCES widget_store(id),
+    id INTEGER,
+    tag_id INTEGER REFERENCES tags(id),
     value TEXT,
-    FOREIGN KEY (widget_id) REFERENCES widgets(id)
-);
+    PRIMARY KEY (widget_id, id)
+) WITHOUT ROWID;
+
+-- The original widgets/widget_details layout, for reads
+CREATE VIEW IF NOT EXISTS widgets AS
+    SELECT w.id, p.name AS page_name, w.widget_type, w.widget_name, w.widget_index,
+           w.widget_config, w.widget_config_id, w.widget_id, w.source_id
+    FROM widget_store w LEFT JOIN pages p ON p.id = w.page_id;
+
+CREATE VIEW IF NOT EXISTS widget_details AS
+    SELECT d.id, d.widget_id, t.name AS tag, d.value
+    FROM widget_tags d LEFT JOIN tags t ON t.id = d.tag_id;
 
 -- Page-level tags
 CREATE TABLE IF NOT EXISTS page_details (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     page_name TEXT,
     tag TEXT,
-    value TEXT
+    value TEXT,
+    source_id INTEGER
 );
 
 -- JS functions found per page
@@ -38,14 +56,16 @@ CREATE TABLE IF NOT EXISTS js_functions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     page_name TEXT,
     function_name TEXT,
-    parameters TEXT
+    parameters TEXT,
+    source_id INTEGER
 );
 
 -- Navigation function mapping
 CREATE TABLE IF NOT EXISTS navigations (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     function TEXT,
-    target_page TEXT
+    target_page TEXT,
+    source_id INTEGER
 );
 
 -- Mapping between widget props and JS functions
@@ -63,3 +83,34 @@ CREATE TABLE IF NOT EXISTS mqtt_topics (
     page_name TEXT,
     topic TEXT
 );
+
+-- Manifest of parsed SQL/JS files; source_id columns above point here
+CREATE TABLE IF NOT EXISTS source_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE,
+    kind TEXT,
+    mtime REAL,
+    size INTEGER,
+    content_hash TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_widget_store_source ON widget_store(source_id);
+CREATE INDEX IF NOT EXISTS idx_page_details_source ON page_details(source_id);
+CREATE INDEX IF NOT EXISTS idx_navigations_source ON navigations(source_id);
+CREATE INDEX IF NOT EXISTS idx_js_functions_source ON js_functions(source_id);
+
+-- Schema version 1: covering indexes for the GUI lookups (see db_bootstrap.MIGRATIONS)
+CREATE INDEX IF NOT EXISTS idx_widget_store_page_widget ON widget_store(page_id, widget_name, widget_type, widget_index, widget_config_id, widget_id);
+CREATE INDEX IF NOT EXISTS idx_js_functions_page ON js_functions(page_name, function_name, parameters);
+CREATE INDEX IF NOT EXISTS idx_navigations_target ON navigations(target_page, function);
+CREATE INDEX IF NOT EXISTS idx_page_details_page ON page_details(page_name, tag, value);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_widget_function_map_key ON widget_function_map(page_name, widget_name, property);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mqtt_topics_page_topic ON mqtt_topics(page_name, topic);
+
+-- Schema version 2: full-text widget search, rowid = widgets.id (see db_bootstrap.refresh_widget_search)
+CREATE VIRTUAL TABLE IF NOT EXISTS widget_search USING fts5(page_name, widget_name, widget_type, details, functions, prefix='2 3');
+CREATE VIRTUAL TABLE IF NOT EXISTS widget_search_vocab USING fts5vocab(widget_search, 'row');
+
+-- Schema version 3: normalised widget storage behind the widgets/widget_details views
+
+PRAGMA user_version = 3;
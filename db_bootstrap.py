@@ -1,20 +1,83 @@
 import os
 import re
-import json
+import difflib
+import zlib
+import hashlib
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from db_connection import connect, close_manager
+from page_cache import get_page_cache
+from utils.json_backend import json_loads
+from utils.sql_tokenizer import iter_insert_statements
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 DB_FILE = "ui_map.db"
 
+# Tables whose rows are derived from a single source file (see source_files)
+SOURCE_TABLES = ("widget_store", "page_details", "navigations", "js_functions")
+
+# How widget_store keeps the raw WidgetConfig JSON: "zlib" (compressed), "text",
+# or "none" to drop it and rely on the exploded widget_details tags.
+WIDGET_CONFIG_STORAGE = os.getenv("UISEE_WIDGET_CONFIG", "zlib").lower()
+
 def extract_resources(config_str):
     try:
-        config = json.loads(config_str)
+        config = json_loads(config_str)
         resources = config.get("Resources", {}).get("resource", [])
         return [(entry.get("tag"), entry.get("value")) for entry in resources if "tag" in entry]
     except Exception:
         return []
 
+def decode_widget_config(config_str, loads=None):
+    """
+    Decode a WidgetConfig blob once and pull out everything ingestion needs.
+
+    :param loads: JSON decoder to use; defaults to the fastest one installed.
+    :return: (widget_name, widget_type, widget_index, [(tag, value), ...]).
+             Fields missing from the config come back as "" and a config that
+             cannot be decoded yields an empty tag list.
+    """
+    widget_type = widget_name = widget_index = ""
+    tags = []
+
+    try:
+        config = (loads or json_loads)(config_str)
+        for entry in config.get("Resources", {}).get("resource", []):
+            tag = entry.get("tag")
+            if tag == "Name":
+                widget_name = entry.get("value")
+            elif tag == "ButtonType":
+                widget_type = entry.get("value")
+            elif tag == "WidgetIndex":
+                widget_index = entry.get("value")
+            if "tag" in entry:
+                tags.append((tag, entry.get("value")))
+    except Exception:
+        tags = []
+
+    return widget_name, widget_type, widget_index, tags
+
+def encode_widget_config(config_str, storage=None):
+    """Turn a WidgetConfig string into its stored form (see WIDGET_CONFIG_STORAGE)."""
+    storage = storage or WIDGET_CONFIG_STORAGE
+    if storage == "none" or config_str is None:
+        return None
+    if storage == "zlib":
+        return zlib.compress(config_str.encode("utf-8"))
+    return config_str
+
+def decode_stored_config(value):
+    """Inverse of encode_widget_config: the WidgetConfig string, or None if it was dropped."""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+def _ensure_column(cur, table, column, decl):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
 def init_db(conn=None):
     should_close = False
     internal_conn = conn
@@ -25,11 +88,31 @@ def init_db(conn=None):
                 os.remove(DB_FILE)
             except PermissionError:
                 raise RuntimeError("Cannot delete ui_map.db because it is currently in use.")
-        internal_conn = sqlite3.connect(DB_FILE)
+        internal_conn = connect(DB_FILE)
         should_close = True
 
     cur = internal_conn.cursor()
+    cur.execute("SELECT count(*) FROM sqlite_master")
+    if cur.fetchone()[0] == 0:
+        # Brand-new file: start directly at the current layout
+        _create_tables(cur)
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    elif cur.execute("PRAGMA user_version").fetchone()[0] < NORMALISED_SCHEMA_VERSION:
+        # Older migrations are written against the original layout
+        _create_legacy_tables(cur)
+    internal_conn.commit()
+
+    migrate_db(internal_conn)
+    _create_tables(cur)
+    _create_indexes(cur)
+    internal_conn.commit()
 
+    if should_close:
+        if not conn:  # Only close if we opened it
+            internal_conn.close()
+
+def _create_legacy_tables(cur):
+    """Create the pre-normalisation layout that migrations 1-3 start from."""
     cur.execute("""CREATE TABLE IF NOT EXISTS pages (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT UNIQUE
@@ -43,20 +126,23 @@ def init_db(conn=None):
         widget_index TEXT,
         widget_config TEXT,
         widget_config_id INTEGER,
-        widget_id INTEGER
+        widget_id INTEGER,
+        source_id INTEGER
     )""")
 
     cur.execute("""CREATE TABLE IF NOT EXISTS navigations (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         function TEXT,
-        target_page TEXT
+        target_page TEXT,
+        source_id INTEGER
     )""")
 
     cur.execute("""CREATE TABLE IF NOT EXISTS page_details (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         page_name TEXT,
         tag TEXT,
-        value TEXT
+        value TEXT,
+        source_id INTEGER
     )""")
 
     cur.execute("""CREATE TABLE IF NOT EXISTS widget_details (
@@ -71,102 +157,827 @@ def init_db(conn=None):
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         page_name TEXT,
         function_name TEXT,
-        parameters TEXT
+        parameters TEXT,
+        source_id INTEGER
     )""")
 
-    internal_conn.commit()
-    if should_close:
-        if not conn:  # Only close if we opened it
-            internal_conn.close()
+    cur.execute("""CREATE TABLE IF NOT EXISTS widget_function_map (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_name TEXT,
+        widget_name TEXT,
+        property TEXT,
+        function_name TEXT
+    )""")
 
-def parse_sql_and_js(sql_folder, js_folder, conn=None):
-    internal_conn = conn or sqlite3.connect(DB_FILE)
-    cur = internal_conn.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS mqtt_topics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_name TEXT,
+        topic TEXT
+    )""")
+
+    # Manifest of parsed source files, used to re-ingest only what changed
+    cur.execute("""CREATE TABLE IF NOT EXISTS source_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT UNIQUE,
+        kind TEXT,
+        mtime REAL,
+        size INTEGER,
+        content_hash TEXT
+    )""")
+
+    # Databases built before the manifest existed lack the source_id columns
+    for table in ("widgets", "page_details", "navigations", "js_functions"):
+        _ensure_column(cur, table, "source_id", "INTEGER")
+
+# Normalised widget storage: integer page ids, interned tag names and an encoded
+# config. The widgets and widget_details views keep the original column layout,
+# so reads written against the old tables work unchanged; writes go to the tables.
+TAGS_TABLE = """CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE
+)"""
+
+WIDGET_STORE_TABLE = """CREATE TABLE IF NOT EXISTS widget_store (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    page_id INTEGER REFERENCES pages(id),
+    widget_type TEXT,
+    widget_name TEXT,
+    widget_index TEXT,
+    widget_config BLOB,
+    widget_config_id INTEGER,
+    widget_id INTEGER,
+    source_id INTEGER
+)"""
+
+# Clustered by widget, so a widget's tags are one range read without a separate index
+WIDGET_TAGS_TABLE = """CREATE TABLE IF NOT EXISTS widget_tags (
+    widget_id INTEGER REFERENCES widget_store(id),
+    id INTEGER,
+    tag_id INTEGER REFERENCES tags(id),
+    value TEXT,
+    PRIMARY KEY (widget_id, id)
+) WITHOUT ROWID"""
+
+WIDGETS_VIEW = """CREATE VIEW IF NOT EXISTS widgets AS
+    SELECT w.id, p.name AS page_name, w.widget_type, w.widget_name, w.widget_index,
+           w.widget_config, w.widget_config_id, w.widget_id, w.source_id
+    FROM widget_store w LEFT JOIN pages p ON p.id = w.page_id"""
+
+WIDGET_DETAILS_VIEW = """CREATE VIEW IF NOT EXISTS widget_details AS
+    SELECT d.id, d.widget_id, t.name AS tag, d.value
+    FROM widget_tags d LEFT JOIN tags t ON t.id = d.tag_id"""
+
+WIDGET_SEARCH_TABLES = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS widget_search USING fts5("
+    "page_name, widget_name, widget_type, details, functions, prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS widget_search_vocab USING fts5vocab(widget_search, 'row')",
+)
+
+# Covers the widgets view's per-page lookups (see HOT_QUERIES)
+WIDGET_STORE_INDEX = ("CREATE INDEX IF NOT EXISTS idx_widget_store_page_widget ON widget_store"
+                      "(page_id, widget_name, widget_type, widget_index, widget_config_id, widget_id)")
+
+# Secondary indexes of the current layout; rebuild_db creates them after the bulk load
+INDEXES = tuple(
+    f"CREATE INDEX IF NOT EXISTS idx_{table}_source ON {table}(source_id)" for table in SOURCE_TABLES
+) + (
+    WIDGET_STORE_INDEX,
+    "CREATE INDEX IF NOT EXISTS idx_js_functions_page ON js_functions(page_name, function_name, parameters)",
+    "CREATE INDEX IF NOT EXISTS idx_navigations_target ON navigations(target_page, function)",
+    "CREATE INDEX IF NOT EXISTS idx_page_details_page ON page_details(page_name, tag, value)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_widget_function_map_key ON widget_function_map"
+    "(page_name, widget_name, property)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_mqtt_topics_page_topic ON mqtt_topics(page_name, topic)",
+)
+
+def _create_tables(cur):
+    """Create every table and view of the current layout, without secondary indexes."""
+    cur.execute("""CREATE TABLE IF NOT EXISTS pages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE
+    )""")
+    cur.execute(TAGS_TABLE)
+    cur.execute(WIDGET_STORE_TABLE)
+    cur.execute(WIDGET_TAGS_TABLE)
+
+    cur.execute("""CREATE TABLE IF NOT EXISTS navigations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        function TEXT,
+        target_page TEXT,
+        source_id INTEGER
+    )""")
+
+    cur.execute("""CREATE TABLE IF NOT EXISTS page_details (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_name TEXT,
+        tag TEXT,
+        value TEXT,
+        source_id INTEGER
+    )""")
+
+    cur.execute("""CREATE TABLE IF NOT EXISTS js_functions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_name TEXT,
+        function_name TEXT,
+        parameters TEXT,
+        source_id INTEGER
+    )""")
+
+    cur.execute("""CREATE TABLE IF NOT EXISTS widget_function_map (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_name TEXT,
+        widget_name TEXT,
+        property TEXT,
+        function_name TEXT
+    )""")
+
+    cur.execute("""CREATE TABLE IF NOT EXISTS mqtt_topics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_name TEXT,
+        topic TEXT
+    )""")
+
+    # Manifest of parsed source files, used to re-ingest only what changed
+    cur.execute("""CREATE TABLE IF NOT EXISTS source_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT UNIQUE,
+        kind TEXT,
+        mtime REAL,
+        size INTEGER,
+        content_hash TEXT
+    )""")
+
+    cur.execute(WIDGETS_VIEW)
+    cur.execute(WIDGET_DETAILS_VIEW)
+    for statement in WIDGET_SEARCH_TABLES:
+        cur.execute(statement)
+
+def _create_indexes(cur):
+    for statement in INDEXES:
+        cur.execute(statement)
+
+# One widget_search row per widget: its page, name, type, every widget_details
+# tag/value and the JS functions registered for its page.
+WIDGET_SEARCH_INSERT = """
+    INSERT INTO widget_search (rowid, page_name, widget_name, widget_type, details, functions)
+    SELECT w.id, w.page_name, w.widget_name, w.widget_type,
+           (SELECT group_concat(d.tag || ' ' || coalesce(d.value, ''), ' ')
+              FROM widget_details d WHERE d.widget_id = w.id),
+           (SELECT group_concat(f.function_name, ' ')
+              FROM js_functions f WHERE f.page_name = w.page_name)
+"""
+
+# Schema migrations, applied in order. PRAGMA user_version holds the number of
+# migrations already applied, so each one runs exactly once per database.
+MIGRATIONS = (
+    # 1: covering indexes for the GUI lookups, and one row per mapping/topic
+    (
+        "CREATE INDEX IF NOT EXISTS idx_widgets_page_widget ON widgets"
+        "(page_name, widget_name, widget_type, widget_index, widget_config_id, widget_id)",
+        "CREATE INDEX IF NOT EXISTS idx_js_functions_page ON js_functions(page_name, function_name, parameters)",
+        "CREATE INDEX IF NOT EXISTS idx_navigations_target ON navigations(target_page, function)",
+        "CREATE INDEX IF NOT EXISTS idx_page_details_page ON page_details(page_name, tag, value)",
+        "DROP INDEX IF EXISTS idx_widget_details_widget",
+        "CREATE INDEX IF NOT EXISTS idx_widget_details_widget_tag ON widget_details(widget_id, tag, value)",
+        # Keep the most recent mapping/topic before enforcing uniqueness
+        "DELETE FROM widget_function_map WHERE id NOT IN ("
+        "SELECT MAX(id) FROM widget_function_map GROUP BY page_name, widget_name, property)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_widget_function_map_key ON widget_function_map"
+        "(page_name, widget_name, property)",
+        "DELETE FROM mqtt_topics WHERE id NOT IN (SELECT MAX(id) FROM mqtt_topics GROUP BY page_name, topic)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_mqtt_topics_page_topic ON mqtt_topics(page_name, topic)",
+    ),
+    # 2: full-text widget search, rowid = widgets.id (see refresh_widget_search)
+    WIDGET_SEARCH_TABLES + (
+        "DELETE FROM widget_search",
+        WIDGET_SEARCH_INSERT + "FROM widgets w",
+    ),
+    # 3: normalised widget storage; widgets/widget_details become views
+    (
+        TAGS_TABLE,
+        WIDGET_STORE_TABLE,
+        WIDGET_TAGS_TABLE,
+        "INSERT OR IGNORE INTO pages (name) SELECT DISTINCT page_name FROM widgets WHERE page_name IS NOT NULL",
+        "INSERT OR IGNORE INTO tags (name) SELECT DISTINCT tag FROM widget_details",
+        """INSERT INTO widget_store (id, page_id, widget_type, widget_name, widget_index,
+                                     widget_config, widget_config_id, widget_id, source_id)
+           SELECT w.id, p.id, w.widget_type, w.widget_name, w.widget_index,
+                  encode_widget_config(w.widget_config), w.widget_config_id, w.widget_id, w.source_id
+           FROM widgets w LEFT JOIN pages p ON p.name = w.page_name""",
+        """INSERT INTO widget_tags (widget_id, id, tag_id, value)
+           SELECT d.widget_id, d.id, t.id, d.value
+           FROM widget_details d LEFT JOIN tags t ON t.name IS d.tag""",
+        "DROP TABLE widget_details",
+        "DROP TABLE widgets",
+        WIDGET_STORE_INDEX,
+        WIDGETS_VIEW,
+        WIDGET_DETAILS_VIEW,
+    ),
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# First version with widget_store/widget_tags; older databases keep the legacy tables
+NORMALISED_SCHEMA_VERSION = 3
+
+def migrate_db(conn):
+    """
+    Apply the schema migrations the database has not seen yet.
+
+    All pending migrations run in one transaction together with the
+    user_version bump, so a failure leaves the database at its old version.
+    :return: the schema version before migrating.
+    """
+    cur = conn.cursor()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    # Migration 3 stores existing configs the same way ingestion does
+    conn.create_function("encode_widget_config", 1, encode_widget_config, deterministic=True)
+    conn.commit()
+    try:
+        cur.execute("BEGIN")
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return version
+
+# Queries issued by the GUI on every page/widget selection; none may scan a table
+HOT_QUERIES = {
+    "apply_filters widgets": (
+        "SELECT id, widget_type, widget_name, widget_index, widget_config_id, widget_id "
+        "FROM widgets WHERE page_name = ?", ("",)),
+    "apply_filters js_functions": ("SELECT function_name FROM js_functions WHERE page_name = ?", ("",)),
+    "apply_filters navigations": ("SELECT function FROM navigations WHERE target_page = ?", ("",)),
+    "apply_filters page_details": ("SELECT tag, value FROM page_details WHERE page_name = ?", ("",)),
+    "preview count": ("SELECT count(*) FROM widgets WHERE page_name = ?", ("",)),
+    "preview widgets": (
+        "SELECT id, widget_type, widget_name, widget_index, widget_config_id, widget_id "
+        "FROM widgets WHERE page_name = ? ORDER BY widget_index ASC, id ASC LIMIT ? OFFSET ?", ("", 200, 0)),
+    "WidgetModal widget_details": ("SELECT tag, value FROM widget_details WHERE widget_id = ?", (0,)),
+    "WidgetModal js_functions": (
+        "SELECT function_name, parameters FROM js_functions WHERE page_name = ?", ("",)),
+    "CommandBuilder widgets": ("SELECT widget_name FROM widgets WHERE page_name = ?", ("",)),
+    "CommandBuilder properties": (
+        "SELECT tag FROM widget_details WHERE widget_id IN ("
+        "SELECT id FROM widgets WHERE page_name = ? AND widget_name = ?)", ("", "")),
+    "manage_mapping lookup": (
+        "SELECT function_name FROM widget_function_map "
+        "WHERE page_name=? AND widget_name=? AND property=?", ("", "", "")),
+    "manage_mapping delete": (
+        "DELETE FROM widget_function_map WHERE page_name=? AND widget_name=? AND property=?", ("", "", "")),
+    "mqtt_topics per page": ("SELECT DISTINCT topic FROM mqtt_topics WHERE page_name = ?", ("",)),
+}
+
+def explain_hot_queries(conn):
+    """:return: {query name: [EXPLAIN QUERY PLAN detail lines]} for HOT_QUERIES."""
+    cur = conn.cursor()
+    plans = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+        plans[name] = [row[3] for row in cur.fetchall()]
+    return plans
+
+def find_full_scans(conn):
+    """:return: {query name: plan} for every hot query whose plan scans a whole table or index."""
+    return {name: plan for name, plan in explain_hot_queries(conn).items()
+            if any(detail.startswith("SCAN ") for detail in plan)}
+
+# Column order assumed when an INSERT statement has no column list
+PAGES_INSTALLED_COLUMNS = ("pagename", "pageid", "pageconfig")
+WIDGETS_INSTALLED_COLUMNS = ("widgetconfigid", "widgetid", "widgetconfig")
+NAVIGATE_TO_PATTERN = re.compile(r"NavigateTo\((\w+)\)")
+JS_FUNCTION_PATTERN = re.compile(r'(?:function|var)\s+([a-zA-Z0-9_]+)\s*=?\s*function\s*\((.*?)\)')
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def _page_name_for(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def parse_sql_file(path):
+    """
+    Parse one UIPages .sql file into plain row tuples.
+
+    The file is streamed through the INSERT tokenizer rather than read whole.
+    Runs inside the worker processes, so it must not touch the database.
+    :return: (page_name, page_detail_rows, widget_rows) where each widget row is
+             ((page_name, widget_type, widget_name, widget_index, widget_config,
+               widget_config_id, widget_id), [(tag, value), ...]).
+    """
+    page_name = _page_name_for(path)
+    page_rows = []
+    widget_rows = []
+
+    for table, columns, values in iter_insert_statements(path, tables=("PagesInstalled", "WidgetsInstalled")):
+        columns = [column.lower() for column in columns]
 
-    # SQL parsing
-    for filename in os.listdir(sql_folder):
-        if not filename.endswith(".sql"):
+        # PagesInstalled
+        if table.lower() == "pagesinstalled":
+            record = dict(zip(columns or PAGES_INSTALLED_COLUMNS, values))
+            json_str = record.get("pageconfig")
+            if not isinstance(json_str, str):
+                continue
+            json_str = json_str.replace('""', '"')
+            for tag, value in extract_resources(json_str):
+                page_rows.append((record.get("pagename"), tag, value))
+            continue
+
+        # WidgetsInstalled
+        record = dict(zip(columns or WIDGETS_INSTALLED_COLUMNS, values))
+        config_str = record.get("widgetconfig")
+        if not isinstance(config_str, str):
             continue
+        config_str = config_str.replace('""', '"')
+        widget_name, widget_type, widget_index, tags = decode_widget_config(config_str)
+
+        widget_rows.append((
+            (page_name, widget_type, widget_name, widget_index,
+             config_str, record.get("widgetconfigid"), record.get("widgetid")),
+            tags
+        ))
+
+    return page_name, page_rows, widget_rows
+
+
+def parse_js_file(path):
+    """
+    Parse one JS file into (navigation_rows, function_rows): NavigateTo(...) targets
+    and every function/var-function definition.
+    """
+    page_name = _page_name_for(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    navigation_rows = [(f"NavigateTo({target_page})", target_page)
+                       for target_page in NAVIGATE_TO_PATTERN.findall(content)]
+    function_rows = [(page_name, fn_name, args.strip())
+                     for fn_name, args in JS_FUNCTION_PATTERN.findall(content)]
+    return navigation_rows, function_rows
+
+
+def _list_files(folder, extension):
+    return [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(extension)]
+
+
+def _parse_in_pool(parse_func, paths, workers):
+    """Yield parse results in input order, fanning the files out over a process pool."""
+    if workers <= 1 or len(paths) < 2:
+        yield from map(parse_func, paths)
+        return
+
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parse_func, paths, chunksize=chunksize)
+
+
+def _next_row_id(cur, table):
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    row = cur.fetchone()
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    return max(row[0] if row else 0, cur.fetchone()[0]) + 1
+
+
+# Rows buffered per table before each executemany
+WRITE_BATCH_SIZE = 20000
+
+
+def _page_id(cur, page_name):
+    cur.execute("INSERT OR IGNORE INTO pages (name) VALUES (?)", (page_name,))
+    cur.execute("SELECT id FROM pages WHERE name = ?", (page_name,))
+    return cur.fetchone()[0]
+
+
+def _write_sql_results(cur, results, batch_size=WRITE_BATCH_SIZE):
+    # Widget ids are assigned here so widget_tags can be bulk-loaded alongside them.
+    next_widget_id = _next_row_id(cur, "widget_store")
+    next_detail_id = _next_row_id(cur, "widget_tags")
+    cur.execute("SELECT name, id FROM tags")
+    tag_ids = dict(cur.fetchall())
+    next_tag_id = max(tag_ids.values(), default=0) + 1
+    new_tags = []
+    page_details = []
+    widgets = []
+    details = []
+
+    def tag_id(tag):
+        nonlocal next_tag_id
+        known = tag_ids.get(tag)
+        if known is None:
+            known = tag_ids[tag] = next_tag_id
+            new_tags.append((known, tag))
+            next_tag_id += 1
+        return known
+
+    def flush():
+        cur.executemany("INSERT INTO tags (id, name) VALUES (?, ?)", new_tags)
+        cur.executemany("INSERT INTO page_details (page_name, tag, value, source_id) VALUES (?, ?, ?, ?)",
+                        page_details)
+        cur.executemany("""INSERT INTO widget_store (
+            id, page_id, widget_type, widget_name, widget_index,
+            widget_config, widget_config_id, widget_id, source_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", widgets)
+        cur.executemany("INSERT INTO widget_tags (widget_id, id, tag_id, value) VALUES (?, ?, ?, ?)", details)
+        for rows in (new_tags, page_details, widgets, details):
+            rows.clear()
+
+    for source_id, (page_name, page_rows, widget_rows) in results:
+        page_id = _page_id(cur, page_name)
+        page_details.extend(row + (source_id,) for row in page_rows)
+
+        for (_, widget_type, widget_name, widget_index, config, config_id, widget_id), tags in widget_rows:
+            widgets.append((next_widget_id, page_id, widget_type, widget_name, widget_index,
+                            encode_widget_config(config), config_id, widget_id, source_id))
+            for tag, value in tags:
+                details.append((next_widget_id, next_detail_id, tag_id(tag), value))
+                next_detail_id += 1
+            next_widget_id += 1
+
+        if len(details) + len(widgets) + len(page_details) >= batch_size:
+            flush()
+    flush()
+
+
+def _write_js_results(cur, results, batch_size=WRITE_BATCH_SIZE):
+    navigations = []
+    functions = []
+
+    def flush():
+        cur.executemany("INSERT INTO navigations (function, target_page, source_id) VALUES (?, ?, ?)", navigations)
+        cur.executemany("""
+            INSERT INTO js_functions (page_name, function_name, parameters, source_id)
+            VALUES (?, ?, ?, ?)
+        """, functions)
+        navigations.clear()
+        functions.clear()
+
+    for source_id, (navigation_rows, function_rows) in results:
+        navigations.extend(row + (source_id,) for row in navigation_rows)
+        functions.extend(row + (source_id,) for row in function_rows)
+        if len(navigations) + len(functions) >= batch_size:
+            flush()
+    flush()
+
+
+def file_content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scan_sources(sql_folder, js_folder):
+    """Return {path: (kind, mtime, size)} for every source file in the two folders."""
+    sources = {}
+    for kind, folder, extension in (("sql", sql_folder, ".sql"), ("js", js_folder, ".js")):
+        for path in _list_files(folder, extension):
+            stat = os.stat(path)
+            sources[os.path.abspath(path)] = (kind, stat.st_mtime, stat.st_size)
+    return sources
+
+
+def _delete_source_rows(cur, stale):
+    """Remove every row ingested from the given {source_id: (path, kind)} files."""
+    if not stale:
+        return
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS stale_sources (id INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM stale_sources")
+    cur.executemany("INSERT INTO stale_sources (id) VALUES (?)", [(source_id,) for source_id in stale])
+
+    cur.executemany("DELETE FROM pages WHERE name = ?",
+                    [(_page_name_for(path),) for path, kind in stale.values() if kind == "sql"])
+    cur.execute("""
+        DELETE FROM widget_search WHERE rowid IN (
+            SELECT id FROM widget_store WHERE source_id IN (SELECT id FROM stale_sources)
+        )
+    """)
+    cur.execute("""
+        DELETE FROM widget_tags WHERE widget_id IN (
+            SELECT id FROM widget_store WHERE source_id IN (SELECT id FROM stale_sources)
+        )
+    """)
+    for table in SOURCE_TABLES:
+        cur.execute(f"DELETE FROM {table} WHERE source_id IN (SELECT id FROM stale_sources)")
+    cur.execute("DELETE FROM stale_sources")
+
+
+def _delete_untracked_rows(cur):
+    # Rows parsed before the manifest existed cannot be attributed to a file,
+    # so the first incremental sync replaces them wholesale.
+    cur.execute("DELETE FROM widget_search")
+    cur.execute("DELETE FROM widget_tags WHERE widget_id IN (SELECT id FROM widget_store WHERE source_id IS NULL)")
+    for table in SOURCE_TABLES:
+        cur.execute(f"DELETE FROM {table} WHERE source_id IS NULL")
+    cur.execute("DELETE FROM pages")
+
+
+def refresh_widget_search(cur, page_names):
+    """Rebuild the widget_search rows of every widget on the given pages."""
+    page_names = list(page_names)
+    if not page_names:
+        return
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS search_pages (name TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM search_pages")
+    cur.executemany("INSERT OR IGNORE INTO search_pages (name) VALUES (?)", [(name,) for name in page_names])
+
+    cur.execute("""
+        DELETE FROM widget_search WHERE rowid IN (
+            SELECT id FROM widgets WHERE page_name IN (SELECT name FROM search_pages)
+        )
+    """)
+    cur.execute(WIDGET_SEARCH_INSERT + "FROM widgets w WHERE w.page_name IN (SELECT name FROM search_pages)")
+    cur.execute("DELETE FROM search_pages")
+
+
+SEARCH_TERM_PATTERN = re.compile(r"[^\W_]+")  # Same word split as the FTS5 tokenizer
+
+# bm25 column weights: page_name, widget_name, widget_type, details, functions
+SEARCH_WEIGHTS = (2.0, 10.0, 4.0, 1.0, 1.0)
+
+
+def _close_terms(cur, term, count=3):
+    """Indexed terms that look like a misspelling of term (same first letter)."""
+    cur.execute("SELECT term FROM widget_search_vocab WHERE term >= ? AND term < ?",
+                (term[0], chr(ord(term[0]) + 1)))
+    return difflib.get_close_matches(term, [row[0] for row in cur.fetchall()], n=count, cutoff=0.75)
+
+
+def search_widgets(conn, query, limit=20, page_name=None):
+    """
+    Ranked full-text search over widgets (see the widget_search table).
+
+    Every word of the query must match as a prefix of some indexed word. When
+    that finds nothing, each word is widened to the closest indexed spellings.
+    :param page_name: Only return widgets on this page.
+    :return: list of (db_id, page_name, widget_name, widget_type), best match first.
+    """
+    terms = [term.lower() for term in SEARCH_TERM_PATTERN.findall(query or "")]
+    if not terms:
+        return []
+
+    cur = conn.cursor()
+    sql = f"""
+        SELECT w.id, w.page_name, w.widget_name, w.widget_type
+        FROM widget_search s JOIN widgets w ON w.id = s.rowid
+        WHERE widget_search MATCH ? {"AND w.page_name = ?" if page_name is not None else ""}
+        ORDER BY bm25(widget_search, {", ".join(str(weight) for weight in SEARCH_WEIGHTS)})
+        LIMIT ?
+    """
+    params = (page_name,) if page_name is not None else ()
+
+    match = " AND ".join(f'"{term}"*' for term in terms)
+    cur.execute(sql, (match,) + params + (limit,))
+    rows = cur.fetchall()
+    if rows:
+        return rows
+
+    # Fuzzy fallback: accept close spellings of each word
+    alternatives = []
+    for term in terms:
+        options = [f'"{term}"*'] + [f'"{close}"' for close in _close_terms(cur, term)]
+        alternatives.append("(" + " OR ".join(options) + ")")
+    cur.execute(sql, (" AND ".join(alternatives),) + params + (limit,))
+    return cur.fetchall()
 
-        page_name = os.path.splitext(filename)[0]
-        with open(os.path.join(sql_folder, filename), 'r', encoding='utf-8') as f:
-            content = f.read()
-
-            cur.execute("INSERT OR IGNORE INTO pages (name) VALUES (?)", (page_name,))
-
-            # PagesInstalled
-            for match in re.finditer(
-                r'INSERT INTO\s+"?PagesInstalled"?\s*\(\s*"PageName"\s*,\s*"PageID"\s*,\s*"PageConfig"\s*\)\s*VALUES\s*\(\s*\'(.*?)\'\s*,\s*(\d+)\s*,\s*\'(.*?)\'\s*\);?',
-                content, re.DOTALL | re.IGNORECASE):
-                page_name_sql, _, json_str = match.groups()
-                json_str = json_str.replace('""', '"')
-                for tag, value in extract_resources(json_str):
-                    cur.execute("INSERT INTO page_details (page_name, tag, value) VALUES (?, ?, ?)",
-                                (page_name_sql, tag, value))
-
-            # WidgetsInstalled
-            for match in re.finditer(
-                r'INSERT INTO\s+"?WidgetsInstalled"?\s*\(\s*"WidgetConfigID"\s*,\s*"WidgetID"\s*,\s*"WidgetConfig"\s*\)\s*VALUES\s*\(\s*(\d+)\s*,\s*(\d+)\s*,\s*\'(.*?)\'\s*\);?',
-                content, re.DOTALL | re.IGNORECASE):
-                widget_config_id, widget_id, config_str = match.groups()
-                config_str = config_str.replace('""', '"')
-                widget_type = widget_name = widget_index = ""
-
-                try:
-                    config_data = json.loads(config_str)
-                    for entry in config_data.get("Resources", {}).get("resource", []):
-                        tag = entry.get("tag")
-                        if tag == "Name":
-                            widget_name = entry.get("value")
-                        elif tag == "ButtonType":
-                            widget_type = entry.get("value")
-                        elif tag == "WidgetIndex":
-                            widget_index = entry.get("value")
-                except:
-                    pass
-
-                cur.execute("""INSERT INTO widgets (
-                    page_name, widget_type, widget_name, widget_index,
-                    widget_config, widget_config_id, widget_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)""", (
-                    page_name, widget_type, widget_name, widget_index,
-                    config_str, widget_config_id, widget_id
-                ))
-                db_widget_id = cur.lastrowid
-
-                for tag, value in extract_resources(config_str):
-                    cur.execute("INSERT INTO widget_details (widget_id, tag, value) VALUES (?, ?, ?)",
-                                (db_widget_id, tag, value))
+
+def sync_sources(sql_folder, js_folder, conn=None, workers=None):
+    """
+    Bring the database in line with the SQL and JS folders, re-ingesting only the
+    files that were added, changed or removed since the last parse.
+
+    Files whose mtime and size match the source_files manifest are skipped without
+    being read; otherwise the content hash decides whether the file really changed.
+    :return: dict with the added/changed/removed/unchanged file counts.
+    """
+    internal_conn = conn or connect(DB_FILE)
+    init_db(internal_conn)
+    cur = internal_conn.cursor()
+    workers = workers or DEFAULT_WORKERS
+
+    try:
+        cur.execute("SELECT id, path, kind, mtime, size, content_hash FROM source_files")
+        manifest = {path: (source_id, kind, mtime, size, content_hash)
+                    for source_id, path, kind, mtime, size, content_hash in cur.fetchall()}
+        if not manifest:
+            _delete_untracked_rows(cur)
+
+        sources = _scan_sources(sql_folder, js_folder)
+        stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        stale = {}
+        pending = {"sql": [], "js": []}
+
+        for path, (kind, mtime, size) in sources.items():
+            known = manifest.get(path)
+            if known and known[2] == mtime and known[3] == size:
+                stats["unchanged"] += 1
+                continue
+
+            content_hash = file_content_hash(path)
+            if known and known[4] == content_hash:
+                # Touched but identical: just refresh the stat fields
+                cur.execute("UPDATE source_files SET mtime = ?, size = ? WHERE id = ?", (mtime, size, known[0]))
+                stats["unchanged"] += 1
+                continue
+
+            if known:
+                source_id = known[0]
+                stale[source_id] = (path, known[1])
+                cur.execute("UPDATE source_files SET kind = ?, mtime = ?, size = ?, content_hash = ? WHERE id = ?",
+                            (kind, mtime, size, content_hash, source_id))
+                stats["changed"] += 1
+            else:
+                cur.execute("INSERT INTO source_files (path, kind, mtime, size, content_hash) VALUES (?, ?, ?, ?, ?)",
+                            (path, kind, mtime, size, content_hash))
+                source_id = cur.lastrowid
+                stats["added"] += 1
+            pending[kind].append((source_id, path))
+
+        removed = {known[0]: (path, known[1]) for path, known in manifest.items() if path not in sources}
+        stats["removed"] = len(removed)
+        _delete_source_rows(cur, {**stale, **removed})
+
+        # Pages whose widgets or JS functions change need their search rows rebuilt
+        touched_pages = {_page_name_for(path) for path, _ in removed.values()}
+        touched_pages.update(_page_name_for(path) for paths in pending.values() for _, path in paths)
+        cur.executemany("DELETE FROM source_files WHERE id = ?", [(source_id,) for source_id in removed])
+
+        # SQL parsing
+        sql_ids = [source_id for source_id, _ in pending["sql"]]
+        sql_paths = [path for _, path in pending["sql"]]
+        _write_sql_results(cur, zip(sql_ids, _parse_in_pool(parse_sql_file, sql_paths, workers)))
 
         # JS parsing: NavigateTo AND all functions
-        for filename in os.listdir(js_folder):
-            if not filename.endswith(".js"):
+        js_ids = [source_id for source_id, _ in pending["js"]]
+        js_paths = [path for _, path in pending["js"]]
+        _write_js_results(cur, zip(js_ids, _parse_in_pool(parse_js_file, js_paths, workers)))
+
+        refresh_widget_search(cur, touched_pages)
+
+        internal_conn.commit()
+        return stats
+    except Exception:
+        internal_conn.rollback()
+        raise
+    finally:
+        if not conn:  # Only close if we opened it
+            internal_conn.close()
+
+
+# Pragmas for a throwaway build file: no rollback journal, no fsync, exclusive lock.
+# A crash mid-build only loses the build file, never ui_map.db.
+# Scoped to main so the old database attached for _copy_user_tables is left alone.
+BULK_BUILD_PRAGMAS = (
+    ("main.journal_mode", "OFF"),
+    ("main.synchronous", "OFF"),
+    ("main.locking_mode", "EXCLUSIVE"),
+    ("main.cache_size", -256 * 1024),  # KiB
+    ("temp_store", "MEMORY"),
+)
+
+
+# Tables rebuilt from the source folders; every other table holds user data
+DERIVED_TABLES = set(SOURCE_TABLES) | {"pages", "tags", "widget_tags", "source_files",
+                                       "widgets", "widget_details"}  # Pre-normalisation names
+
+
+def _copy_user_tables(cur, old_path):
+    """Carry user-authored tables (mappings, SSH targets, history...) over from old_path."""
+    cur.execute("ATTACH DATABASE ? AS old", (old_path,))
+    try:
+        cur.execute("SELECT name, sql FROM old.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+        for name, create_sql in cur.fetchall():
+            if name in DERIVED_TABLES or name.startswith("widget_search") or \
+                    create_sql.upper().startswith("CREATE VIRTUAL"):
                 continue
+            cur.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?", (name,))
+            if not cur.fetchone():
+                cur.execute(create_sql)
 
-            page_name = os.path.splitext(filename)[0]
+            cur.execute(f'PRAGMA main.table_info("{name}")')
+            new_columns = [row[1] for row in cur.fetchall()]
+            cur.execute(f'PRAGMA old.table_info("{name}")')
+            old_columns = {row[1] for row in cur.fetchall()}
+            columns = ", ".join(f'"{column}"' for column in new_columns if column in old_columns)
+            # Newest first, so the unique keys keep the latest mapping/topic of a legacy database
+            cur.execute(f'INSERT OR IGNORE INTO main."{name}" ({columns}) '
+                        f'SELECT {columns} FROM old."{name}" ORDER BY rowid DESC')
+        cur.connection.commit()
+    finally:
+        cur.execute("DETACH DATABASE old")
 
-            with open(os.path.join(js_folder, filename), 'r', encoding='utf-8') as f:
-                content = f.read()
 
-                # NavigateTo(...) detection
-                for match in re.finditer(r"NavigateTo\((\w+)\)", content):
-                    target_page = match.group(1)
-                    cur.execute("INSERT INTO navigations (function, target_page) VALUES (?, ?)",
-                                (f"NavigateTo({target_page})", target_page))
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
-                # All function types
-                all_functions = re.findall(
-                    r'(?:function|var)\s+([a-zA-Z0-9_]+)\s*=?\s*function\s*\((.*?)\)', content)
-                for fn_name, args in all_functions:
-                    cur.execute("""
-                        INSERT INTO js_functions (page_name, function_name, parameters)
-                        VALUES (?, ?, ?)
-                    """, (page_name, fn_name, args.strip()))
 
+def rebuild_db(sql_folder, js_folder, db_path=DB_FILE, workers=None):
+    """
+    Build a fresh database from the SQL and JS folders and swap it in atomically.
 
-    internal_conn.commit()
-    if not conn:  # Only close if we opened it
-        internal_conn.close()
+    Rows are bulk-loaded into "<db_path>.build" with no secondary indexes and no
+    journal. The indexes and search rows are built once the data is in, user
+    tables such as widget_function_map are copied from the old database, then
+    the finished file is renamed over db_path. Readers only
+    ever see the old database or the complete new one.
+    :return: dict with the number of sql and js files ingested.
+    """
+    workers = workers or DEFAULT_WORKERS
+    build_path = db_path + ".build"
+    for suffix in ("", "-journal"):
+        _remove_if_exists(build_path + suffix)
+
+    conn = sqlite3.connect(build_path)
+    try:
+        for name, value in BULK_BUILD_PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        cur = conn.cursor()
+        _create_tables(cur)
+
+        sources = _scan_sources(sql_folder, js_folder)
+        pending = {"sql": [], "js": []}
+        for path, (kind, mtime, size) in sorted(sources.items()):
+            cur.execute("INSERT INTO source_files (path, kind, mtime, size, content_hash) VALUES (?, ?, ?, ?, ?)",
+                        (path, kind, mtime, size, file_content_hash(path)))
+            pending[kind].append((cur.lastrowid, path))
+
+        # SQL parsing
+        sql_ids = [source_id for source_id, _ in pending["sql"]]
+        sql_paths = [path for _, path in pending["sql"]]
+        _write_sql_results(cur, zip(sql_ids, _parse_in_pool(parse_sql_file, sql_paths, workers)))
+
+        # JS parsing: NavigateTo AND all functions
+        js_ids = [source_id for source_id, _ in pending["js"]]
+        js_paths = [path for _, path in pending["js"]]
+        _write_js_results(cur, zip(js_ids, _parse_in_pool(parse_js_file, js_paths, workers)))
+        conn.commit()
+
+        # Indexes and the search table are built in one pass over the loaded rows
+        _create_indexes(cur)
+        cur.execute(WIDGET_SEARCH_INSERT + "FROM widgets w")
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+        if os.path.exists(db_path):
+            _copy_user_tables(cur, db_path)
+        conn.execute("ANALYZE")
+        conn.commit()
+    except Exception:
+        conn.close()
+        _remove_if_exists(build_path)
+        raise
+    conn.close()
+
+    _swap_in(build_path, db_path)
+    return {kind: len(paths) for kind, paths in pending.items()}
+
+
+def _swap_in(build_path, db_path):
+    # Our own handles on the old file would block the rename on Windows
+    close_manager(db_path)
+    get_page_cache(db_path).clear()
+
+    if os.path.exists(db_path):
+        # Fold the old write-ahead log into the old file first: a WAL left next to
+        # the new file would otherwise be replayed into it.
+        old = sqlite3.connect(db_path)
+        try:
+            old.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            old.close()
+
+    try:
+        os.replace(build_path, db_path)
+    except PermissionError:
+        raise RuntimeError(f"Cannot replace {db_path} because it is currently in use. "
+                           f"The rebuilt database was left at {build_path}.")
+    for suffix in ("-wal", "-shm"):
+        try:
+            _remove_if_exists(db_path + suffix)
+        except OSError:
+            pass  # Still held open elsewhere; the log was emptied above
+
+
+def parse_sql_and_js(sql_folder, js_folder, conn=None, workers=None):
+    """
+    Parse the UIPages SQL folder and the Scripts JS folder into the database.
+
+    Files are parsed in parallel by a process pool; the calling thread is the only
+    writer and bulk-loads the returned rows with executemany in a single transaction.
+    Only files that changed since the last parse are re-ingested (see sync_sources).
+    :param workers: Number of parser processes (default: one per CPU, 1 disables the pool).
+    """
+    return sync_sources(sql_folder, js_folder, conn=conn, workers=workers)
 
 def ask_user_for_folders():
     root = tk.Tk()
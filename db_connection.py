@@ -0,0 +1,179 @@
+# db_connection.py
+
+"""
+Shared access to ui_map.db.
+
+Every connection is opened in WAL mode with the pragmas below, so readers never
+block on the writer. ConnectionManager hands each thread its own connection for
+reads, closed again when the thread exits, and funnels all writes through a single writer thread so concurrent
+writers (GUI, test-queue threads, background logging) cannot collide with
+"database is locked".
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import Future
+
+DB_FILE = "ui_map.db"
+
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -64 * 1024),  # Negative values are KiB: 64 MiB
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),  # Milliseconds
+)
+
+
+def configure_connection(conn):
+    """Apply PRAGMAS to an open connection and return it."""
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def connect(path=DB_FILE, **kwargs):
+    """Open a connection to path with PRAGMAS applied."""
+    return configure_connection(sqlite3.connect(path, **kwargs))
+
+
+class _ThreadConnection:
+    """Thread-local holder; when its thread exits the holder is collected and the connection closed."""
+
+    __slots__ = ("conn", "generation", "__weakref__")
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+
+
+def _close_thread_connection(connections, conn):
+    # May run on any thread (whichever collects the holder), so no locks: set.discard is atomic
+    connections.discard(conn)
+    conn.close()
+
+
+class ConnectionManager:
+    """Per-thread read connections plus one serialised writer for a database file."""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._connections = set()  # Open read connections, for close()
+        self._lock = threading.Lock()
+        self._jobs = None
+        self._writer = None
+        self._generation = 0  # Bumped by close(); connections from an older generation are closed
+
+    def connection(self):
+        """Return the calling thread's connection, opening it on first use or after close()."""
+        holder = getattr(self._local, "holder", None)
+        if holder is None or holder.generation != self._generation:
+            # Only this thread uses it; check_same_thread=False lets close() and the finalizer reach it
+            conn = connect(self.path, check_same_thread=False)
+            with self._lock:
+                holder = _ThreadConnection(conn, self._generation)
+                self._connections.add(conn)
+            weakref.finalize(holder, _close_thread_connection, self._connections, conn)
+            self._local.holder = holder
+        return holder.conn
+
+    def read(self, sql, params=()):
+        """Run a query on the calling thread's connection and return all rows."""
+        return self.connection().execute(sql, params).fetchall()
+
+    def write(self, job, params=(), wait=True):
+        """
+        Queue a write for the writer thread, starting it if needed.
+
+        :param job: SQL statement, or a callable taking the writer's connection.
+                    Either runs inside one transaction that is committed on
+                    success and rolled back if it raises.
+        :param params: Parameters for a SQL statement job.
+        :param wait: Block until the write is committed and return its result
+                     (or re-raise its exception); otherwise return a Future.
+        """
+        if threading.current_thread() is self._writer:
+            raise RuntimeError("write() called from inside a write job; use the job's connection instead.")
+
+        if callable(job):
+            func = job
+        else:
+            def func(conn):
+                return conn.execute(job, params).rowcount
+
+        future = Future()
+        with self._lock:
+            if self._writer is None:
+                # Each writer drains its own queue, so one started after close() never sees the old one's jobs
+                self._jobs = queue.Queue()
+                self._writer = threading.Thread(target=self._write_loop, args=(self._jobs,),
+                                                name="ui_map.db writer", daemon=True)
+                self._writer.start()
+            self._jobs.put((func, future))
+        return future.result() if wait else future
+
+    def _write_loop(self, jobs):
+        conn = connect(self.path)
+        try:
+            while True:
+                item = jobs.get()
+                if item is None:
+                    return
+                func, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = func(conn)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            conn.close()
+
+    def close(self):
+        """
+        Finish queued writes, stop the writer and close every connection handed out.
+        The manager stays usable: each thread reopens its connection on next use and
+        the next write starts a new writer, so holders never see a dead manager.
+        """
+        with self._lock:
+            self._generation += 1
+            writer, self._writer = self._writer, None
+            connections, self._connections = self._connections, set()
+            if writer is not None:
+                self._jobs.put(None)
+        if writer is not None:
+            writer.join()
+
+        for conn in list(connections):
+            conn.close()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(path=DB_FILE):
+    """Return the process-wide ConnectionManager for path."""
+    key = os.path.abspath(path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(path)
+        return manager
+
+
+def close_manager(path=DB_FILE):
+    """Close every handle the shared manager for path holds; it reopens them on next use."""
+    with _managers_lock:
+        manager = _managers.get(os.path.abspath(path))
+    if manager is not None:
+        manager.close()
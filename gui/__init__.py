@@ -20,5 +20,6 @@ from .toolbar_controls import ToolbarControls
 from .widget_modal import WidgetModal   
 from .mirror_mode import MirrorModeController
 from .preview_full_page import PreviewPage
+from .virtual_tree import VirtualTreeview
 
 # Add more imports here as more modules are created (e.g., mirror_mode, preview_page, etc.)
@@ -2,12 +2,13 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-import subprocess
-import time
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from services.step_plan import compile_steps
+from services.step_scheduler import StepScheduler
+
 env_path = Path("config/.env")
 if env_path.exists():
     load_dotenv(dotenv_path=env_path)
@@ -295,24 +296,17 @@ class CommandBuilder:
 
 
     def run_sequence(self):
-        for step_type, val in self.steps:
-            self.output_console.insert(tk.END, f"\n[STEP] {step_type.upper()} - {val}\n")
-            self.root.update()
+        # Parsed and checked against the widget tables once, before anything is sent
+        plan = compile_steps(self.steps)
+        if plan.issues:
+            self.output_console.insert(tk.END, f"\n[PLAN] {plan.describe_issues()}\n")
+        if plan.errors:
+            return
 
-            if step_type == "mqtt":
-                path, v = val.split("=")
-                result = self.mqtt_adapter.send_command_and_wait(path.strip(), v.strip())
-                self.output_console.insert(tk.END, f"{result}\n")
-
-            elif step_type == "ssh":
-                cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} '{val.strip()}'"
-                try:
-                    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                    self.output_console.insert(tk.END, output.stdout + output.stderr)
-                except Exception as e:
-                    self.output_console.insert(tk.END, f"SSH ERROR: {str(e)}\n")
-
-            elif step_type == "wait":
-                secs = int(val.split()[0])
-                self.output_console.insert(tk.END, f"Waiting {secs} seconds...\n")
-                time.sleep(secs)
+        scheduler = StepScheduler(self.mqtt_adapter, self.test_creds)
+        for step in plan:
+            self.output_console.insert(tk.END, f"\n[STEP] {step.kind.upper()} - {step.label}\n")
+            self.root.update()
+            result = scheduler.run_step(step)
+            detail = result.get("output") or result.get("response") or result.get("error") or ""
+            self.output_console.insert(tk.END, f"{result.get('status')}: {detail}\n")
@@ -1,19 +1,19 @@
 import os
 import json
 import re
-import time
-import sqlite3
-import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
 
-from services.mqtt_service import MQTTService
 from services.parser_service import ParserService
 from utils.ui_mapper_adapter import UIMQTTAdapter
-from db_bootstrap import init_db, parse_sql_and_js, ask_user_for_folders
+from services.ssh_pool import run_ssh
+from services.ssh_stream import stream_command
+from db_bootstrap import init_db, parse_sql_and_js, sync_sources, ask_user_for_folders
+from db_connection import get_manager
+from page_cache import get_page_cache
 
 # Optional but incorrect import in your version:
 # from pip._vendor.rich.control import i  <-- remove this line, it does nothing and throws an error
@@ -25,12 +25,14 @@ else:
     print(".env file not found at config/.env")
 
 DB_FILE = "ui_map.db"
+CONFIG_FETCH_TIMEOUT = 30  # Seconds allowed for reading the controller's config files
 
 class UIMapperGUI:
     def __init__(self, root, conn):
         self.root = root
         self.root.title("UI Structure Mapper")
         self.conn = conn
+        self.db = get_manager(DB_FILE)  # All writes go through its writer thread
 
         self.test_creds = {
             "host": os.getenv("SSH_HOST", ""),
@@ -44,8 +46,8 @@ class UIMapperGUI:
             "port": os.getenv("MQTT_PORT", "1883")
         }
 
-        self.mqtt_adapter = UIMQTTAdapter(self.test_creds)
-        self.client = MQTTService()
+        self.mqtt_adapter = UIMQTTAdapter(self.test_creds, self.mqtt_creds)  # Connects on first use
+        self.client = self.mqtt_adapter.client  # Same shared connection, not a second socket
         self.parser_service = ParserService(self.root, self.conn)
 
         self.command_queue = []
@@ -54,6 +56,7 @@ class UIMapperGUI:
 
         self.init_function_map_table()
         self.init_mqtt_topic_table()
+        self.db.write(init_db)  # Apply pending schema migrations to an existing database
         self.setup_ui()
 
     def init_function_map_table(self):
@@ -103,10 +106,11 @@ class UIMapperGUI:
                 return
 
             cmd = "cat /usr/share/ConfigFiles/*.json"
-            stdin, stdout, stderr = self.ssh_service.ssh_client.exec_command(cmd)
+            channel = self.ssh_service.ssh_client.get_transport().open_session()
+            result = stream_command(channel, cmd, timeout=CONFIG_FETCH_TIMEOUT)
 
-            raw = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
+            raw = result.stdout.strip()
+            error = result.stderr.strip()
 
             if error:
                 self.output_console.insert(tk.END, f"[CONFIG] Failed to fetch config files:\n{error}\n")
@@ -201,8 +205,8 @@ class UIMapperGUI:
                 "password": pass_var.get()
             })
             try:
-                self.mqtt_adapter.client.connect(**self.mqtt_creds)
-                self.mqtt_adapter.client.subscribe("exec")
+                self.client = self.mqtt_adapter.set_broker(self.mqtt_creds)
+                self.client.subscribe("exec")
                 self.output_console.insert(tk.END, "[MQTT] Subscribed to topic 'exec'\n")
                 popup.destroy()
             except Exception as e:
@@ -215,8 +219,7 @@ class UIMapperGUI:
         if not cmd:
             return
         try:
-            ssh_cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} \"{cmd}\""
-            out = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
+            out = run_ssh(self.test_creds['host'], self.test_creds['user'], cmd)
             self.output_console.insert(tk.END, f"\n[SIMIN]\n{out.stdout}{out.stderr}\n")
             self.output_console.see(tk.END)
         except Exception as e:
@@ -256,26 +259,21 @@ class UIMapperGUI:
         self.mirror_mode.toggle_mirror_mode()
 
     def reparse_files(self):
-        confirm = messagebox.askyesno("Reparse Files", "This will create a new database version and reload.\nContinue?")
+        confirm = messagebox.askyesno("Reparse Files", "This will re-ingest changed SQL/JS files and reload.\nContinue?")
         if not confirm:
             return
 
         try:
             sql_path, js_path = ask_user_for_folders()
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            new_db_path = f"ui_map_{timestamp}.db"
-
-            if self.conn:
-                self.conn.close()
-
-            self.conn = sqlite3.connect(new_db_path)
-            self.active_db_file = new_db_path
-
-            init_db(conn=self.conn)
-            parse_sql_and_js(sql_path, js_path, conn=self.conn)
-
-            messagebox.showinfo("Success", f"New DB created:\n{new_db_path}")
-            self.output_console.insert(tk.END, f"[DB] New database loaded: {new_db_path}\n")
+            stats = self.db.write(lambda conn: sync_sources(sql_path, js_path, conn=conn))
+            if stats["added"] or stats["changed"] or stats["removed"]:
+                # A JS file also changes the navigations shown on the pages it targets
+                get_page_cache(DB_FILE).clear()
+
+            summary = (f"{stats['added']} added, {stats['changed']} changed, "
+                       f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+            messagebox.showinfo("Success", f"Database updated:\n{summary}")
+            self.output_console.insert(tk.END, f"[DB] Reparsed source files: {summary}\n")
             if hasattr(self, "load_pages"):
                 self.load_pages()
 
@@ -287,14 +285,10 @@ class UIMapperGUI:
 if __name__ == '__main__':
     sql_path, js_path = ask_user_for_folders()
 
-    db_path = "ui_map.db"
-    conn = sqlite3.connect(db_path)
-
-    init_db(conn=conn)
-    parse_sql_and_js(sql_path, js_path, conn=conn)
+    db = get_manager(DB_FILE)
+    db.write(lambda conn: parse_sql_and_js(sql_path, js_path, conn=conn))
 
     root = tk.Tk()
-    app = UIMapperGUI(root, conn)
-    app.conn = conn  # make sure app uses the already-initialized connection
+    app = UIMapperGUI(root, db.connection())
     root.mainloop()
 
@@ -1,100 +1,172 @@
 # gui/preview_page.py
 
 import tkinter as tk
-from tkinter import ttk
-from tkinter import messagebox
+from collections import OrderedDict
+
+
+ROW_HEIGHT = 36        # Canvas pixels per widget row
+CHUNK_SIZE = 200       # Rows fetched per query while scrolling
+MAX_CHUNKS = 8         # Fetched chunks kept in memory
+RENDER_MARGIN = 20     # Rows drawn above and below the visible area
 
 
 class PreviewPage:
+    """
+    Scrollable preview of every widget on a page.
+
+    Widgets are drawn as canvas items, and only for the rows currently in view
+    (plus a small margin); rows scrolled far away are deleted again. Rows are
+    fetched from the database in chunks of CHUNK_SIZE as they come into view,
+    and one tooltip window is shared by all rows. Memory and open time
+    therefore stay bounded however many widgets the page has.
+    """
+
     def __init__(self, root, conn, page_name, bvt_callback=None):
         self.root = root
         self.conn = conn
         self.page_name = page_name
         self.bvt_callback = bvt_callback
+        self.chunks = OrderedDict()
+        self.drawn = set()
+        self.row_count = 0
 
     def open(self):
         preview_win = tk.Toplevel(self.root)
         preview_win.title(f"Preview: {self.page_name}")
 
-        canvas = tk.Canvas(preview_win, bg="#f0f0f0")
-        scrollbar = tk.Scrollbar(preview_win, orient=tk.VERTICAL, command=canvas.yview)
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        scroll_frame = ttk.Frame(canvas)
-        scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
+        self.canvas = tk.Canvas(preview_win, bg="#f0f0f0", width=420, height=600, yscrollincrement=ROW_HEIGHT)
+        scrollbar = tk.Scrollbar(preview_win, orient=tk.VERTICAL, command=self._yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
 
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         cur = self.conn.cursor()
-        cur.execute("""
-            SELECT id, widget_type, widget_name, widget_index, widget_config_id, widget_id
-            FROM widgets
-            WHERE page_name = ?
-            ORDER BY widget_index ASC
-        """, (self.page_name,))
-        widgets = cur.fetchall()
-
-        for row_num, (db_id, widget_type, widget_name, widget_index, config_id, widget_id) in enumerate(widgets):
-            display = widget_name or f"Widget_{db_id}"
-            widget_type = widget_type.lower()
-
-            # Wrap widget in a framed box
-            box = ttk.Frame(scroll_frame, padding=5, relief="solid")
-            box.grid(row=row_num, column=0, padx=10, pady=5, sticky="w")
-
-            # Create widget and insert into the frame
-            if widget_type == "button":
-                w = ttk.Button(
-                    box,
-                    text=display,
-                    command=(lambda name=widget_name: self.bvt_callback(name)) if self.bvt_callback else None
-                )
-            elif widget_type == "textbox":
-                w = ttk.Entry(box)
-                w.insert(0, display)
-            elif widget_type == "label":
-                w = ttk.Label(box, text=display)
-            else:
-                w = ttk.Label(box, text=f"[{widget_type}] {display}")
-            w.pack()
-
-            # Tooltip metadata string
-            meta_text = (
-                f"Widget Name: {widget_name or 'Unnamed'}\n"
-                f"Type: {widget_type}\n"
-                f"Index: {widget_index or 'N/A'}\n"
-                f"Widget ID: {widget_id}\n"
-                f"Config ID: {config_id}\n"
-                f"Page: {self.page_name}"
-            )
-
-            self._attach_tooltip(w, meta_text)
-
-    def _attach_tooltip(self, widget, text):
-        tooltip = tk.Toplevel(widget)
-        tooltip.wm_overrideredirect(True)
-        tooltip.withdraw()
-        tooltip_label = tk.Label(
-            tooltip,
-            text=text,
+        cur.execute("SELECT count(*) FROM widgets WHERE page_name = ?", (self.page_name,))
+        self.row_count = cur.fetchone()[0]
+        self.canvas.configure(scrollregion=(0, 0, 0, self.row_count * ROW_HEIGHT))
+
+        self._build_tooltip(preview_win)
+        self.canvas.bind("<Configure>", lambda e: self._render())
+        self.canvas.bind("<MouseWheel>", lambda e: self._yview("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self._yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self._yview("scroll", 1, "units"))
+        self.canvas.bind("<Motion>", self._on_motion)
+        self.canvas.bind("<Leave>", lambda e: self.tooltip.withdraw())
+        self.canvas.tag_bind("button", "<Button-1>", self._on_button_click)
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self._render()
+
+    # ---------- Rows ----------
+    def _row(self, row_num):
+        """Return one (db_id, widget_type, widget_name, widget_index, config_id, widget_id) row."""
+        chunk_num, position = divmod(row_num, CHUNK_SIZE)
+        chunk = self.chunks.get(chunk_num)
+        if chunk is None:
+            cur = self.conn.cursor()
+            cur.execute("""
+                SELECT id, widget_type, widget_name, widget_index, widget_config_id, widget_id
+                FROM widgets
+                WHERE page_name = ?
+                ORDER BY widget_index ASC, id ASC
+                LIMIT ? OFFSET ?
+            """, (self.page_name, CHUNK_SIZE, chunk_num * CHUNK_SIZE))
+            chunk = self.chunks[chunk_num] = cur.fetchall()
+            while len(self.chunks) > MAX_CHUNKS:
+                self.chunks.popitem(last=False)
+        self.chunks.move_to_end(chunk_num)
+        return chunk[position] if position < len(chunk) else None
+
+    def _visible_rows(self):
+        top = int(self.canvas.canvasy(0)) // ROW_HEIGHT
+        bottom = int(self.canvas.canvasy(self.canvas.winfo_height())) // ROW_HEIGHT + 1
+        return max(0, top - RENDER_MARGIN), min(self.row_count, bottom + RENDER_MARGIN)
+
+    def _render(self):
+        first, last = self._visible_rows()
+        for row_num in [n for n in self.drawn if n < first or n >= last]:
+            self.canvas.delete(f"row{row_num}")
+            self.drawn.discard(row_num)
+        for row_num in range(first, last):
+            if row_num not in self.drawn:
+                self._draw_row(row_num)
+
+    def _draw_row(self, row_num):
+        row = self._row(row_num)
+        if row is None:
+            return
+        db_id, widget_type, widget_name, widget_index, config_id, widget_id = row
+        display = widget_name or f"Widget_{db_id}"
+        widget_type = (widget_type or "").lower()
+
+        x, y = 10, row_num * ROW_HEIGHT + 5
+        tags = (f"row{row_num}", "widget")
+        # Framed box around every widget, like the old per-widget ttk.Frame
+        self.canvas.create_rectangle(x, y, x + 380, y + ROW_HEIGHT - 10, outline="#808080", tags=tags)
+        if widget_type == "button":
+            self.canvas.create_rectangle(x + 5, y + 3, x + 200, y + ROW_HEIGHT - 13, fill="#e1e1e1",
+                                         outline="#adadad", tags=tags + ("button",))
+            self.canvas.create_text(x + 102, y + (ROW_HEIGHT - 10) // 2, text=display,
+                                    tags=tags + ("button",))
+        elif widget_type == "textbox":
+            self.canvas.create_rectangle(x + 5, y + 3, x + 200, y + ROW_HEIGHT - 13, fill="white",
+                                         outline="#7a7a7a", tags=tags)
+            self.canvas.create_text(x + 9, y + (ROW_HEIGHT - 10) // 2, text=display, anchor="w", tags=tags)
+        elif widget_type == "label":
+            self.canvas.create_text(x + 5, y + (ROW_HEIGHT - 10) // 2, text=display, anchor="w", tags=tags)
+        else:
+            self.canvas.create_text(x + 5, y + (ROW_HEIGHT - 10) // 2, text=f"[{widget_type}] {display}",
+                                    anchor="w", tags=tags)
+        self.drawn.add(row_num)
+
+    def _row_at(self, event):
+        row_num = int(self.canvas.canvasy(event.y)) // ROW_HEIGHT
+        return row_num if 0 <= row_num < self.row_count else None
+
+    def _on_button_click(self, event):
+        row_num = self._row_at(event)
+        row = self._row(row_num) if row_num is not None else None
+        if row is not None and self.bvt_callback:
+            self.bvt_callback(row[2])
+
+    # ---------- Tooltip ----------
+    def _build_tooltip(self, parent):
+        self.tooltip = tk.Toplevel(parent)
+        self.tooltip.wm_overrideredirect(True)
+        self.tooltip.withdraw()
+        self.tooltip_label = tk.Label(
+            self.tooltip,
             justify='left',
             background="#ffffe0",
             relief="solid",
             borderwidth=1,
             font=("tahoma", "8", "normal")
         )
-        tooltip_label.pack(ipadx=1)
-
-        def on_enter(event):
-            x = event.x_root + 10
-            y = event.y_root + 10
-            tooltip.geometry(f"+{x}+{y}")
-            tooltip.deiconify()
-
-        def on_leave(event):
-            tooltip.withdraw()
-
-        widget.bind("<Enter>", on_enter)
-        widget.bind("<Leave>", on_leave)
+        self.tooltip_label.pack(ipadx=1)
+        self.tooltip_row = None
+
+    def _on_motion(self, event):
+        row_num = self._row_at(event)
+        y = self.canvas.canvasy(event.y)
+        row = self._row(row_num) if row_num is not None else None
+        if row is None or not self.canvas.find_overlapping(event.x, y, event.x, y):
+            self.tooltip.withdraw()
+            self.tooltip_row = None
+            return
+
+        if row_num != self.tooltip_row:
+            db_id, widget_type, widget_name, widget_index, config_id, widget_id = row
+            # Tooltip metadata string
+            self.tooltip_label.configure(text=(
+                f"Widget Name: {widget_name or 'Unnamed'}\n"
+                f"Type: {(widget_type or '').lower()}\n"
+                f"Index: {widget_index or 'N/A'}\n"
+                f"Widget ID: {widget_id}\n"
+                f"Config ID: {config_id}\n"
+                f"Page: {self.page_name}"
+            ))
+            self.tooltip_row = row_num
+        self.tooltip.geometry(f"+{event.x_root + 10}+{event.y_root + 10}")
+        self.tooltip.deiconify()
@@ -4,13 +4,16 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
 from datetime import datetime
-import subprocess
-import time
 import threading
 
 from dotenv import load_dotenv
 from pathlib import Path
 
+from services.fleet_runner import FleetRunner, load_inventory
+from services.results_sink import ResultsSink, default_results_path, resume_points
+from services.step_plan import as_step_dict, compile_steps, load_template
+from services.step_scheduler import StepScheduler
+
 env_path = Path("config/.env")
 if env_path.exists():
     load_dotenv(dotenv_path=env_path)
@@ -70,6 +73,8 @@ class TestQueueBuilder:
         ttk.Button(controls, text="Delete Step", command=self._delete_selected_step).pack(side=tk.LEFT, padx=5)
         ttk.Button(controls, text="Save as Template", command=self._save_as_template).pack(side=tk.LEFT, padx=5)
         ttk.Button(controls, text="Load Template", command=self._load_template).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Resume Run...", command=self._resume_run).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Run on Fleet...", command=self._run_on_fleet).pack(side=tk.LEFT, padx=5)
 
         # Thread-safe repeat
         self.repeat_var = tk.StringVar(value="1")
@@ -239,8 +244,7 @@ class TestQueueBuilder:
     def _load_template(self):
         path = filedialog.askopenfilename(filetypes=[("JSON Files", "*.json")])
         if path:
-            with open(path, "r") as f:
-                self.steps = json.load(f)
+            self.steps = load_template(path)
             self.last_template_path = path
             self._refresh_step_list()
             self.progress["maximum"] = len(self.steps)
@@ -283,78 +287,150 @@ class TestQueueBuilder:
             self.log_console.see(tk.END)
             self.log_console.configure(state="disabled")
 
-    def _run_timed_sequence(self):
-        results = []
+    def _compile_plan(self):
+        """Compile and validate the queue once; errors are shown and stop the run. :return: StepPlan or None."""
+        plan = compile_steps(self.steps, skip_post_wait=getattr(self, "skip_post_wait_val", False))
+        for issue in plan.warnings:
+            self._log_message(f"Step {issue.index + 1}: {issue.message}")
+        if plan.errors:
+            messagebox.showerror("Invalid Test Queue", plan.describe_issues())
+            return None
+        return plan
+
+    def _open_results_sink(self, plan, repeat_count, prefix="test_results", devices=None):
+        """Ask where to record results before the run starts; cancelling records under RESULTS_DIR."""
+        path = filedialog.asksaveasfilename(
+            title="Record Results To",
+            defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("All files", "*.*")],
+            initialfile=f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        ) or default_results_path(prefix)
+        run_info = {"template": self.last_template_path, "plan": plan.fingerprint(), "steps": len(plan),
+                    "repeat_count": repeat_count}
+        if devices is not None:
+            run_info["devices"] = [{key: value for key, value in device.items() if key != "password"}
+                                   for device in devices]
+        return ResultsSink(path, run_info)
+
+    def _run_timed_sequence(self, resume_path=None):
         repeat_count = getattr(self, "repeat_count_value", 1)
-        skip_post_wait = getattr(self, "skip_post_wait_val", False)
-        total = len(self.steps) * repeat_count
+        plan = self._compile_plan()
+        if plan is None:
+            return
+        start, done = (0, 0), 0
+        if resume_path:
+            header, points = resume_points(resume_path)
+            if header is None or header.get("plan") != plan.fingerprint():
+                messagebox.showerror("Cannot Resume", "Load the template this run was started with, then resume.")
+                return
+            repeat_count = header.get("repeat_count", repeat_count)
+            point = points.get(None, {"repeat": 0, "step": 0, "done": 0})
+            start, done = (point["repeat"], point["step"]), point["done"]
+            sink = ResultsSink(resume_path, resume=True)
+        else:
+            sink = self._open_results_sink(plan, repeat_count)
+        total = len(plan) * repeat_count
         self.progress["maximum"] = total
-        self.progress["value"] = 0
-
-        for repeat_index in range(repeat_count):
-            for step in self.steps:
-                start_time = datetime.now()
-                time.sleep(step.get("pre_wait", 2))
-                result = {
-                    "repeat": repeat_index + 1,
-                    "type": step["type"],
-                    "start": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "command": step.get("command", step.get("value", ""))
-                }
-                try:
-                    if step["type"] == "wait":
-                        time.sleep(step["value"])
-                        result["status"] = "waited"
-                        result["output"] = f"Waited {step['value']} seconds"
-                    elif step["type"] == "mqtt":
-                        if "=" in step["command"]:
-                            path, value = step["command"].split("=", 1)
-                            r = self.mqtt_adapter.send_command_and_wait(path.strip(), value.strip())
-                            result.update(r)
-                        else:
-                            result["status"] = "invalid"
-                            result["output"] = f"Invalid MQTT command: {step['command']}"
-
-                    elif step["type"] == "ssh":
-                        ssh_cmd = f"ssh {self.test_creds['user']}@{self.test_creds['host']} \"{step['command']}\""
-                        proc = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
-                        result["status"] = "success" if proc.returncode == 0 else "fail"
-                        result["output"] = proc.stdout.strip() + proc.stderr.strip()
-                except Exception as e:
-                    result["status"] = "error"
-                    result["output"] = str(e)
-
-                if not skip_post_wait:
-                    time.sleep(step.get("post_wait", 2))
-                result["end"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                result["duration_sec"] = (datetime.strptime(result["end"], "%Y-%m-%d %H:%M:%S") - start_time).total_seconds()
-                results.append(result)
-                self.progress["value"] += 1
-                self.progress.update()
-
-        export_path = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON Files", "*.json")],
-            initialfile=f"test_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        )
-        if export_path:
-            with open(export_path, "w") as f:
-                json.dump(results, f, indent=2)
-            messagebox.showinfo("Export Complete", f"Results exported to:\n{export_path}")
+        self.progress["value"] = done
+        counts = {}
+
+        def step_done(result):
+            nonlocal done
+            # Written to disk as it completes; nothing accumulates in memory however many repeats run
+            sink.record(result)
+            counts[result.get("status")] = counts.get(result.get("status"), 0) + 1
+            done += 1
+            self._log_message(f"{result['type']} {result['command']}: {result.get('status')} in {result['duration_sec']}s")
+            self.progress["value"] += 1
+            self.progress.update()
+
+        try:
+            # Each step advances as soon as its reply, exit or condition arrives (see StepScheduler)
+            StepScheduler(self.mqtt_adapter, self.test_creds).run(plan, repeat_count, on_result=step_done,
+                                                                  start=start, keep_results=False)
+        finally:
+            # Without a summary record the file can still be resumed
+            finished = done >= total
+            sink.close({"statuses": counts} if finished else None)
+        messagebox.showinfo("Run Complete" if finished else "Run Stopped", f"Results recorded to:\n{sink.path}")
+
+    def _resume_run(self):
+        """Continue an interrupted run of the loaded template from its results file."""
+        path = filedialog.askopenfilename(title="Select Results of the Interrupted Run",
+                                          filetypes=[("JSON Lines", "*.jsonl"), ("All files", "*.*")])
+        if path:
+            self._run_timed_sequence(resume_path=path)
+
+    def _run_on_fleet(self):
+        """Run the current steps on every controller in an inventory file, showing per-device progress."""
+        plan = self._compile_plan()
+        if plan is None:
+            return
+        path = filedialog.askopenfilename(title="Select Device Inventory", filetypes=[("JSON Files", "*.json")])
+        if not path:
+            return
+        try:
+            devices = load_inventory(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Inventory Error", str(e))
+            return
+
+        win = tk.Toplevel(self.root)
+        win.title(f"Fleet Run - {len(devices)} devices")
+        tree = ttk.Treeview(win, columns=("progress", "status", "last"), height=min(len(devices), 25))
+        tree.heading("#0", text="Device")
+        tree.heading("progress", text="Steps")
+        tree.heading("status", text="Status")
+        tree.heading("last", text="Last Step")
+        tree.column("last", width=360)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for device in devices:
+            tree.insert("", tk.END, iid=device["name"], text=device["name"], values=("-", "queued", ""))
+
+        repeat_count = getattr(self, "repeat_count_value", 1)
+        sink = self._open_results_sink(plan, repeat_count, prefix="fleet_results", devices=devices)
+
+        def on_progress(name, done, total, result):
+            if result is not None:
+                sink.record(result, device=name)
+            self.root.after(0, show_progress, name, done, total, result)
+
+        runner = FleetRunner(devices, mqtt_creds=getattr(self.app, "mqtt_creds", None), on_progress=on_progress)
+        stop_button = ttk.Button(win, text="Stop", command=runner.stop)
+        stop_button.pack(pady=(0, 10))
+
+        def show_progress(name, done, total, result):
+            last = "" if result is None else f"{result['command']}: {result.get('status')} ({result['duration_sec']}s)"
+            status = "running" if done < total else "done"
+            tree.item(name, values=(f"{done}/{total}", status, last))
+
+        def finished(report):
+            stop_button.configure(state="disabled")
+            for name, entry in report["devices"].items():
+                values = tree.item(name, "values")
+                tree.item(name, values=(values[0], entry["status"], entry.get("error", values[2])))
+            summary = ", ".join(f"{count} {status}" for status, count in report["summary"].items() if count)
+            self._log_message(f"Fleet run finished in {report['duration_sec']}s: {summary}")
+            messagebox.showinfo("Fleet Run Complete", f"{summary}\nResults recorded to:\n{sink.path}")
+
+        def run():
+            report = None
+            try:
+                report = runner.run(plan, repeat_count, keep_results=False)
+            finally:
+                completed = report is not None and all(
+                    entry["done"] == len(plan) * repeat_count for entry in report["devices"].values())
+                sink.close(report if completed else None)
+            self.root.after(0, finished, report)
+
+        threading.Thread(target=run, daemon=True).start()
 
     def import_steps_from_command_builder(self):
         if self.command_builder and hasattr(self.command_builder, "steps"):
-            for typ, cmd in self.command_builder.steps:
-                if typ == "mqtt":
-                    self.steps.append({"type": "mqtt", "command": cmd, "pre_wait": 1, "post_wait": 1})
-                    self.outputs.append(f"[MQTT] Queued command: {cmd}")
-                elif typ == "wait":
-                    secs = int(cmd.split()[0])
-                    self.steps.append({"type": "wait", "value": secs})
-                    self.outputs.append(f"[WAIT] {secs} seconds")
-                elif typ == "ssh":
-                    self.steps.append({"type": "ssh", "command": cmd, "pre_wait": 1, "post_wait": 1})
-                    self.outputs.append(f"[SSH] Queued: {cmd}")
+            for builder_step in self.command_builder.steps:
+                step = as_step_dict(builder_step)
+                self.steps.append(step)
+                self.outputs.append(f"[{step['type'].upper()}] Queued: {step.get('command', step.get('value'))}")
             self._refresh_step_list()
             messagebox.showinfo("Imported", "Steps imported from Command Builder.")
         else:
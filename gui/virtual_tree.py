@@ -0,0 +1,143 @@
+# gui/virtual_tree.py
+
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTreeview(ttk.Frame):
+    """
+    Treeview that only materialises the visible window of rows.
+
+    A fixed pool of `height` Treeview items is created once; scrolling rewrites
+    their values from the row list instead of inserting one item per row, so
+    showing a 10k-row page costs the same Tk work as a 30-row one. Rows are
+    plain Python objects; `display(row)` returns the column values for one row.
+    Clicking a column heading sorts the rows by that column.
+    """
+
+    def __init__(self, master, columns, display, height=30, on_select=None, **tree_options):
+        super().__init__(master)
+        self.columns = tuple(columns)
+        self.display = display
+        self.height = height
+        self.on_select = on_select
+        self.rows = []
+        self.offset = 0
+        self.selected_index = None
+        self.sort_column = None
+        self.sort_reverse = False
+
+        # Selection is drawn with a tag: Tk's own selection would stay on a slot
+        # while its row scrolls away, and would fire <<TreeviewSelect>> on every redraw.
+        self.tree = ttk.Treeview(self, columns=self.columns, show="headings", height=height,
+                                 selectmode="none", **tree_options)
+        self.tree.tag_configure("selected", background="#3875d7", foreground="white")
+        for column in self.columns:
+            self.tree.heading(column, text=column, command=lambda c=column: self.sort_by(c))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.slots = [self.tree.insert('', tk.END, iid=f"slot{i}") for i in range(height)]
+        for slot in self.slots:
+            self.tree.detach(slot)
+
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1))
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<Return>", self._on_activate)
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self.height))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self.height))
+
+    def set_rows(self, rows):
+        """Replace the rows, keeping the current sort order, and scroll to the top."""
+        self.rows = list(rows)
+        if self.sort_column is not None:
+            self._sort()
+        self.offset = 0
+        self.selected_index = None
+        self._render()
+
+    def sort_by(self, column):
+        """Sort by column, toggling the direction when it is already the sort column."""
+        self.sort_reverse = self.sort_column == column and not self.sort_reverse
+        self.sort_column = column
+        selected = self.selected_row()
+        self._sort()
+        self.selected_index = next((i for i, row in enumerate(self.rows) if row is selected), None)
+        self._render()
+
+    def _sort(self):
+        index = self.columns.index(self.sort_column)
+
+        def key(row):
+            value = self.display(row)[index]
+            return (value is None, str(value).lower() if value is not None else "")
+
+        self.rows.sort(key=key, reverse=self.sort_reverse)
+
+    def selected_row(self):
+        """:return: the selected row object, or None."""
+        if self.selected_index is None or self.selected_index >= len(self.rows):
+            return None
+        return self.rows[self.selected_index]
+
+    def scroll(self, delta):
+        self._scroll_to(self.offset + delta)
+        return "break"
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.rows) - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.rows)))
+        elif unit == "pages":
+            self.scroll(int(amount) * self.height)
+        else:
+            self.scroll(int(amount))
+
+    def _on_click(self, event):
+        self.tree.focus_set()
+        slot = self.tree.identify_row(event.y)
+        if slot in self.slots:
+            self.selected_index = self.offset + self.slots.index(slot)
+            self._render()
+            self._on_activate(event)
+
+    def _on_activate(self, event):
+        if self.on_select and self.selected_row() is not None:
+            self.on_select(self.selected_row())
+
+    def _move_selection(self, delta):
+        if not self.rows:
+            return "break"
+        index = 0 if self.selected_index is None else self.selected_index + delta
+        self.selected_index = max(0, min(index, len(self.rows) - 1))
+        if self.selected_index < self.offset:
+            self.offset = self.selected_index
+        elif self.selected_index >= self.offset + self.height:
+            self.offset = self.selected_index - self.height + 1
+        self._render()
+        return "break"
+
+    def _render(self):
+        visible = self.rows[self.offset:self.offset + self.height]
+        for position, slot in enumerate(self.slots):
+            if position < len(visible):
+                selected = self.offset + position == self.selected_index
+                self.tree.item(slot, values=self.display(visible[position]), tags=("selected",) if selected else ())
+                self.tree.move(slot, '', position)
+            else:
+                self.tree.detach(slot)
+
+        if self.rows:
+            self.scrollbar.set(self.offset / len(self.rows), (self.offset + len(visible)) / len(self.rows))
+        else:
+            self.scrollbar.set(0, 1)
@@ -2,6 +2,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
+from db_bootstrap import decode_stored_config
 
 class WidgetModal:
     def __init__(self, app, conn):
@@ -86,12 +87,17 @@ class WidgetModal:
         messagebox.showinfo("Snapshot Created", "Snapshot data printed to console (future TikTest use).")
 
     def _export_snapshot(self, widget_data, tags):
+        cur = self.conn.cursor()
+        cur.execute("SELECT widget_config FROM widgets WHERE id = ?", (widget_data["db_id"],))
+        row = cur.fetchone()
         snapshot = {
             "widget_name": widget_data["widget_name"],
             "widget_type": widget_data["widget_type"],
             "widget_id": widget_data["widget_id"],
             "config_id": widget_data["config_id"],
-            "tags": tags
+            "tags": tags,
+            # Stored compressed unless UISEE_WIDGET_CONFIG says otherwise
+            "widget_config": decode_stored_config(row[0]) if row else None
         }
         file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
         if file_path:
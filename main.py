@@ -9,9 +9,10 @@ import threading
 import logging
 import json
 import time
-import sqlite3
+import multiprocessing
 
-from db_bootstrap import init_db, parse_sql_and_js
+from db_bootstrap import init_db, parse_sql_and_js, rebuild_db
+from db_connection import get_manager
 
 from gui.core import UIMapperGUI
 
@@ -67,10 +68,7 @@ class UISeeLauncher:
 
     def save_widget_tree_snapshot(self):
         try:
-            conn = sqlite3.connect(DB_FILE)
-            cur = conn.cursor()
-            cur.execute("SELECT page_name, widget_type, widget_name, widget_index FROM widgets")
-            rows = cur.fetchall()
+            rows = get_manager(DB_FILE).read("SELECT page_name, widget_type, widget_name, widget_index FROM widgets")
             snapshot = {}
             for page_name, widget_type, widget_name, widget_index in rows:
                 snapshot.setdefault(page_name, []).append({
@@ -85,16 +83,10 @@ class UISeeLauncher:
             logging.info(f"Widget tree snapshot saved: {filepath}")
         except Exception as e:
             logging.warning(f"Snapshot error: {e}")
-        finally:
-            if conn:
-                conn.close()
 
     def auto_login_if_needed(self, app):
         try:
-            conn = sqlite3.connect(DB_FILE)
-            cur = conn.cursor()
-            cur.execute("SELECT value FROM page_details WHERE tag='Name' AND value='login'")
-            result = cur.fetchone()
+            result = get_manager(DB_FILE).read("SELECT value FROM page_details WHERE tag='Name' AND value='login'")
             if result:
                 if not self.auto_login_credentials.get("username"):
                     username = tk.simpledialog.askstring("Login Required", "Enter Admin Username:")
@@ -107,37 +99,38 @@ class UISeeLauncher:
                 logging.info("Auto login injected for 'login' page.")
         except Exception as e:
             logging.warning(f"Auto-login failed: {e}")
-        finally:
-            if conn:
-                conn.close()
 
     def launch_gui(self, close_splash):
         self.root.deiconify()
         close_splash()
-        app = UIMapperGUI(self.root)
+        app = UIMapperGUI(self.root, get_manager(DB_FILE).connection())
         self.auto_login_if_needed(app)
         app.load_pages()
         logging.info("UI loaded.")
 
-    def start(self, reparse=False):
+    def start(self, reparse=False, workers=None, full_rebuild=False):
         def post_splash(close_splash):
             def backend_task():
-                if reparse or not os.path.exists(DB_FILE):
+                if reparse or full_rebuild or not os.path.exists(DB_FILE):
                     sql_path, js_path = self.ask_user_for_folders()
                     if not sql_path or not js_path:
                         return
-                    if os.path.exists(DB_FILE):
-                        try:
-                            os.remove(DB_FILE)
-                        except PermissionError:
-                            print("Cannot delete ui_map.db  it's currently in use.")
-                            exit(1)
 
-                    conn = sqlite3.connect(DB_FILE)
-                    init_db(conn)
-                    parse_sql_and_js(sql_path, js_path, conn)
-
-                    logging.info("Database re-parsed and loaded.")
+                    if full_rebuild or not os.path.exists(DB_FILE):
+                        # Bulk-built into a side file and renamed over ui_map.db when complete
+                        stats = rebuild_db(sql_path, js_path, DB_FILE, workers=workers)
+                        logging.info(f"Database rebuilt: {stats}")
+                    else:
+                        # Existing databases are updated in place: only changed files are re-ingested
+                        def resync(conn):
+                            init_db(conn)
+                            return parse_sql_and_js(sql_path, js_path, conn, workers=workers)
+
+                        stats = get_manager(DB_FILE).write(resync)
+                        logging.info(f"Database re-parsed and loaded: {stats}")
+                else:
+                    # Bring an existing database up to the current schema version
+                    get_manager(DB_FILE).write(init_db)
 
                 self.save_widget_tree_snapshot()
                 self.root.after(0, lambda: self.launch_gui(close_splash))
@@ -150,12 +143,17 @@ class UISeeLauncher:
 def main():
     parser = argparse.ArgumentParser(description="Launch the UI Structure Mapper")
     parser.add_argument("--reparse", action="store_true", help="Force re-parse of SQL and JS folders")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Rebuild the database from scratch instead of re-ingesting changed files")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parser processes to use with --reparse (default: one per CPU, 1 disables the pool)")
     args = parser.parse_args()
 
     launcher = UISeeLauncher()
     launcher.setup_logging()
     logging.info("Starting UI Mapper Launcher")
-    launcher.start(reparse=args.reparse)
+    launcher.start(reparse=args.reparse, workers=args.workers, full_rebuild=args.full_rebuild)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,124 @@
+# page_cache.py
+
+"""
+In-memory page models for the widget browser.
+
+A PageModel holds everything apply_filters shows for one page (widgets, JS
+functions, navigations and page tags), loaded with four queries the first time
+the page is opened. Filtering by search text or widget type then runs on the
+model alone, so typing in the filter box issues no SQL.
+
+PageCache keeps the most recently used pages, bounded by page count. Code that
+writes page data (JS assignment, mapping edits, re-parsing) must invalidate the
+pages it touched.
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from db_connection import DB_FILE, get_manager
+
+PAGE_CACHE_SIZE = 32  # Pages kept in memory per database
+
+WidgetRow = namedtuple("WidgetRow", "db_id widget_type widget_name widget_index config_id widget_id")
+
+
+class PageModel:
+    """Read-only snapshot of one page, with lower-cased keys for filtering."""
+
+    __slots__ = ("page_name", "widgets", "functions", "navigations", "page_details", "_keys")
+
+    def __init__(self, page_name, widgets, functions, navigations, page_details):
+        self.page_name = page_name
+        self.widgets = tuple(WidgetRow(*row) for row in widgets)
+        self.functions = tuple(functions)
+        self.navigations = tuple(navigations)
+        self.page_details = tuple(page_details)
+        self._keys = tuple(((row.widget_type or "").lower(), (row.widget_name or "").lower())
+                           for row in self.widgets)
+
+    def filter_widgets(self, search_text="", widget_type="All"):
+        """:return: widgets whose name or type contains search_text, of the given type ("All" for any)."""
+        search_text = search_text.lower()
+        widget_type = widget_type.lower()
+        return [row for row, (type_key, name_key) in zip(self.widgets, self._keys)
+                if (widget_type == "all" or type_key == widget_type) and
+                (search_text in name_key or search_text in type_key)]
+
+    def filter_navigations(self, search_text=""):
+        search_text = search_text.lower()
+        return [nav for nav in self.navigations if not search_text or search_text in (nav or "").lower()]
+
+
+class PageCache:
+    """LRU cache of PageModel objects for one database, loaded through its ConnectionManager."""
+
+    def __init__(self, path=DB_FILE, max_pages=PAGE_CACHE_SIZE):
+        self.path = path
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # Bumped by every invalidation
+
+    def get(self, page_name):
+        """Return the page's model, loading it from the database on a miss."""
+        with self._lock:
+            model = self._pages.get(page_name)
+            if model is not None:
+                self._pages.move_to_end(page_name)
+                return model
+            generation = self._generation
+
+        model = self._load(page_name)
+        with self._lock:
+            # A write that invalidated pages while this one loaded may have made it stale
+            if generation == self._generation:
+                self._pages[page_name] = model
+                while len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+        return model
+
+    def _load(self, page_name):
+        read = get_manager(self.path).read
+        return PageModel(
+            page_name,
+            read("""
+                SELECT id, widget_type, widget_name, widget_index,
+                       widget_config_id, widget_id FROM widgets
+                WHERE page_name = ?
+            """, (page_name,)),
+            [row[0] for row in read("SELECT function_name FROM js_functions WHERE page_name = ?", (page_name,))],
+            [row[0] for row in read("SELECT function FROM navigations WHERE target_page = ?", (page_name,))],
+            read("SELECT tag, value FROM page_details WHERE page_name = ?", (page_name,)),
+        )
+
+    def invalidate(self, *page_names):
+        """Drop the given pages; they are reloaded on next use."""
+        with self._lock:
+            self._generation += 1
+            for page_name in page_names:
+                self._pages.pop(page_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._pages.clear()
+
+    def __contains__(self, page_name):
+        with self._lock:
+            return page_name in self._pages
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_page_cache(path=DB_FILE):
+    """Return the process-wide PageCache for path."""
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = PageCache(path)
+        return cache
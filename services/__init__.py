@@ -1,7 +1,19 @@
-
 # services/__init__.py
 
-from .mqtt_service import MQTTService
-from .ssh_service import SSHService
 from .custom_logger import CustomLogger
-from .parser_service import ParserService
\ No newline at end of file
+
+# Imported on first use: SSHService and ParserService need tkinter, and the MQTT
+# services paho, none of which the headless runner or parser workers should load
+_LAZY = {
+    "MQTTService": ".mqtt_service",
+    "AsyncMQTTService": ".async_mqtt_service",
+    "SSHService": ".ssh_service",
+    "ParserService": ".parser_service",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,117 @@
+# services/async_mqtt_service.py
+
+"""
+asyncio facade over MQTTService.
+
+The paho client keeps running on its own network thread (loop_start); results
+are handed to asyncio through futures and call_soon_threadsafe, so nothing on
+the event loop blocks on the network. Test sequences can be written as
+coroutines and run many device interactions concurrently:
+
+    service = AsyncMQTTService()
+    service.start()
+    service.run(service.connect())
+    replies = service.run(asyncio.gather(*(service.request(...) for ... in devices)))
+
+start() runs an event loop in a background thread for synchronous callers such
+as the Tk GUI; code already running inside an event loop can await the
+coroutines directly.
+"""
+
+import asyncio
+import threading
+
+from services.mqtt_service import get_client, DEFAULT_REQUEST_TIMEOUT
+
+
+class AsyncMQTTService:
+    """Coroutine API for an MQTTService; broker, TLS and credentials come from MQTTService."""
+
+    def __init__(self, service=None, **service_options):
+        """
+        :param service: Existing MQTTService to wrap; otherwise the shared client for
+                        service_options (broker, port, username, password, tls).
+        """
+        self.service = service or get_client(**service_options)
+        self.loop = None
+        self._thread = None
+
+    # ---------- Background event loop ----------
+    def start(self):
+        """Start the background event loop used by run() and submit()."""
+        if self._thread is None:
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name="async mqtt loop", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, coro):
+        """Schedule a coroutine on the background loop; returns a concurrent.futures.Future."""
+        if self._thread is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the background loop and block until it finishes."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """Stop the background loop (the MQTT connection is left as it is)."""
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = self._thread = None
+
+    # ---------- MQTT ----------
+    async def connect(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.service.connect)
+
+    async def disconnect(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.service.disconnect)
+
+    async def publish(self, topic: str, payload, qos: int = 0) -> bool:
+        """Publish without blocking the event loop. :return: True once published (acknowledged for QoS 1/2)."""
+        try:
+            return await asyncio.wrap_future(self.service.publish_tracked(topic, payload, qos=qos))
+        except ConnectionError:
+            return False
+
+    async def request(self, topic: str, payload, response_topic: str, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        """
+        Publish a correlated request and wait for its reply (see MQTTService.request).
+        :return: the reply payload. Raises TimeoutError or ConnectionError.
+        """
+        future = await asyncio.get_running_loop().run_in_executor(
+            None, self.service.request, topic, payload, response_topic, timeout)
+        return await asyncio.wrap_future(future)
+
+    async def subscribe(self, topic_filter: str, max_queued: int = 0):
+        """
+        Async iterator over messages matching topic_filter:
+
+            async for message in service.subscribe("device/+/status"):
+                print(message.topic, message.payload)
+
+        Each message is a services.mqtt_router.MQTTMessage; its payload is decoded on first access.
+        Messages are queued from the network thread (at most max_queued, 0 for no
+        limit; extra messages are dropped). Leaving the loop removes the listener and
+        unsubscribes topic_filter once no other listener uses it.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(max_queued)
+
+        def enqueue(message):
+            if not queue.full():
+                queue.put_nowait(message)
+
+        def deliver(message):
+            loop.call_soon_threadsafe(enqueue, message)
+
+        # route() subscribes without retry sleeps; on_connect restores routed filters after a reconnect
+        self.service.route([topic_filter], deliver)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.service.unroute([topic_filter], deliver)
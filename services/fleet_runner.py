@@ -0,0 +1,156 @@
+# services/fleet_runner.py
+
+"""
+Run one test queue template on many controllers at once.
+
+The inventory is a JSON list of devices:
+
+    [{"name": "ctrl07", "host": "10.0.3.7", "user": "pi", "prefix": "lab/ctrl07"}, ...]
+
+"prefix" is the device's MQTT topic prefix (exec commands go to
+"<prefix>/exec"); "port" and "password" are optional SSH settings. Each device
+gets its own StepScheduler, MQTT adapter and pooled SSH connection, and a
+bounded pool of worker threads runs up to FLEET_MAX_WORKERS devices at a time,
+so a fleet finishes in roughly the time of its slowest device.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.custom_logger import CustomLogger
+from services.results_sink import PASSING_STATUSES
+from services.step_plan import compile_steps
+from services.step_scheduler import StepScheduler
+from utils.ui_mapper_adapter import UIMQTTAdapter
+
+logger = CustomLogger.get_logger("fleet_runner")
+
+FLEET_MAX_WORKERS = int(os.getenv("FLEET_MAX_WORKERS", 16))  # Devices tested at the same time
+
+
+def load_inventory(path):
+    """Read a device inventory file. :return: list of device dicts, each with a name."""
+    with open(path, "r") as f:
+        devices = json.load(f)
+    names = set()
+    for device in devices:
+        if not device.get("host") or not device.get("user"):
+            raise ValueError(f"Inventory entry needs a host and user: {device}")
+        device.setdefault("name", device.get("prefix") or device["host"])
+        if device["name"] in names:
+            raise ValueError(f"Duplicate device name in inventory: {device['name']}")
+        names.add(device["name"])
+    return devices
+
+
+class FleetRunner:
+    """Runs a step list on every device in an inventory with a bounded worker pool."""
+
+    def __init__(self, devices, mqtt_creds=None, max_workers=FLEET_MAX_WORKERS, on_progress=None):
+        """
+        :param mqtt_creds: Broker settings shared by the whole fleet (see broker_options).
+        :param on_progress: Called from worker threads as on_progress(device_name, done, total, result);
+                            result is None when the device starts.
+        """
+        self.devices = devices
+        self.mqtt_creds = mqtt_creds
+        self.max_workers = max(1, min(max_workers, len(devices) or 1))
+        self.on_progress = on_progress
+        self._schedulers = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def stop(self):
+        """Stop every device after its current step; devices not yet started are skipped."""
+        with self._lock:
+            self._stopping = True
+            schedulers = list(self._schedulers.values())
+        for scheduler in schedulers:
+            scheduler.stop()
+
+    def run(self, steps, repeat_count=1, skip_post_wait=False, resume=None, keep_results=True):
+        """
+        Run steps on every device concurrently and wait for all of them.
+        :param steps: A StepPlan (shared read-only by every device), or a queue to compile first.
+        :param resume: {device name: point} from results_sink.resume_points(); devices continue from there.
+        :param keep_results: Include every result in the report; turn off when a ResultsSink records
+                             them through on_progress, so long runs do not hold them in memory.
+        :return: Report dict with per-device results (or counts) and a pass/fail summary.
+        """
+        plan = compile_steps(steps, db_path=None, skip_post_wait=skip_post_wait)
+        if plan.errors:
+            raise ValueError(f"Invalid steps:\n{plan.describe_issues()}")
+        resume = resume or {}
+        started = time.monotonic()
+        report = {"started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "devices": {}}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fleet") as pool:
+            futures = {device["name"]: pool.submit(self._run_device, device, plan, repeat_count,
+                                                   resume.get(device["name"]), keep_results)
+                       for device in self.devices}
+            for name, future in futures.items():
+                report["devices"][name] = future.result()
+
+        report["finished"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        report["duration_sec"] = round(time.monotonic() - started, 3)
+        statuses = [device["status"] for device in report["devices"].values()]
+        report["summary"] = {status: statuses.count(status) for status in ("passed", "failed", "error", "skipped")}
+        logger.info(f"Fleet run finished in {report['duration_sec']}s: {report['summary']}")
+        return report
+
+    def _run_device(self, device, plan, repeat_count, resume_point, keep_results):
+        name = device["name"]
+        total = len(plan) * repeat_count
+        point = resume_point or {"repeat": 0, "step": 0, "done": 0, "failures": 0}
+        entry = {"host": device["host"], "prefix": device.get("prefix"),
+                 "done": point["done"], "failures": point["failures"]}
+        if keep_results:
+            entry["results"] = []
+        with self._lock:
+            if self._stopping:
+                entry["status"] = "skipped"
+                return entry
+
+        started = time.monotonic()
+        adapter = UIMQTTAdapter(test_creds=device, mqtt_creds=self.mqtt_creds, topic_prefix=device.get("prefix"))
+        scheduler = StepScheduler(adapter, device)
+        with self._lock:
+            self._schedulers[name] = scheduler
+            if self._stopping:
+                scheduler.stop()  # stop() ran before this scheduler was registered
+        self._progress(name, entry["done"], total, None)
+
+        def step_done(result):
+            entry["done"] += 1
+            if result.get("status") not in PASSING_STATUSES:
+                entry["failures"] += 1
+            if keep_results:
+                entry["results"].append(result)
+            self._progress(name, entry["done"], total, result)
+
+        try:
+            scheduler.run(plan, repeat_count, on_result=step_done, start=(point["repeat"], point["step"]),
+                          keep_results=False)
+            entry["status"] = "passed" if entry["done"] == total and not entry["failures"] else "failed"
+        except Exception as e:
+            logger.error(f"Fleet run on {name} failed: {e}")
+            entry["status"] = "error"
+            entry["error"] = str(e)
+        finally:
+            with self._lock:
+                self._schedulers.pop(name, None)
+            adapter.close()
+        entry["duration_sec"] = round(time.monotonic() - started, 3)
+        return entry
+
+    def _progress(self, name, done, total, result):
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(name, done, total, result)
+        except Exception as e:
+            logger.warning(f"Fleet progress callback failed: {e}")
@@ -0,0 +1,425 @@
+# services/mqtt_publisher.py
+
+"""
+Outbound publish pipeline for MQTTService.
+
+Callers put messages on a bounded queue and get a Future back; one sender
+thread serialises them and hands them to paho, draining up to
+PUBLISH_BATCH_SIZE queued messages per wake-up. A Future completes when paho
+reports the message published (written to the socket for QoS 0, PUBACK or
+PUBCOMP for QoS 1 and 2), so QoS acknowledgements are tracked without anyone
+blocking on them.
+
+Messages published with a coalesce_key replace earlier queued messages with the
+same key that have not been sent yet (e.g. a burst of commands setting the same
+widget), and the replaced Futures complete with the one that was sent. Failed
+sends are retried by the sender thread with exponential backoff; the caller
+never sleeps.
+
+While the connection is down (pause() until resume()) nothing is handed to paho:
+messages wait in the queue, and once it is full they go to an optional on-disk
+spool (PublishSpool) that is replayed in order after reconnecting, including
+messages left in it by a previous run.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from paho.mqtt.client import MQTT_ERR_SUCCESS, MQTT_ERR_NO_CONN, error_string
+from services.custom_logger import CustomLogger
+
+logger = CustomLogger.get_logger("mqtt_publisher")
+
+PUBLISH_QUEUE_SIZE = 10000      # Messages waiting for the sender thread
+PUBLISH_QUEUE_TIMEOUT = 1       # Seconds a caller waits for room in a full queue while connected
+PUBLISH_BATCH_SIZE = 500        # Messages taken off the queue per wake-up
+RETRY_BASE_DELAY = 0.1          # Seconds before the first retry; doubles per attempt
+RETRY_MAX_DELAY = 5             # Upper bound on the retry delay
+LATENCY_SAMPLES = 1000          # Recent acknowledgements kept for the latency and rate stats
+
+_STOP = object()
+
+
+class _Outgoing:
+    __slots__ = ("topic", "payload", "qos", "retain", "retries", "coalesce_key", "future", "queued_at", "attempt",
+                 "merged")
+
+    def __init__(self, topic, payload, qos, retain, retries, coalesce_key):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.retries = retries
+        self.coalesce_key = coalesce_key
+        self.future = Future()
+        self.future.set_running_or_notify_cancel()
+        self.queued_at = time.monotonic()
+        self.attempt = 0
+        self.merged = []  # Futures of queued messages this one replaced
+
+
+def encode_payload(payload):
+    """Payloads are sent as JSON unless they are already str or bytes."""
+    if isinstance(payload, (str, bytes, bytearray)):
+        return payload
+    return json.dumps(payload)
+
+
+class PublishSpool:
+    """
+    Append-only JSON-lines file holding messages published while offline with a full queue.
+    Lines are read back in order and the file is emptied once everything has been read.
+    After close() the file is reopened on next use; unread lines are then replayed like
+    those left by a previous run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._offset = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "a+", encoding="utf-8")
+        self._file.seek(self._offset)
+        self._inherited = sum(1 for _ in self._file)  # Lines nobody in this process waits on
+        self._futures = deque()  # Futures of lines appended since opening, in file order
+        self.pending = self._inherited
+        if self.pending:
+            logger.info(f"Replaying {self.pending} spooled MQTT messages from {self.path} after connecting")
+
+    def close(self):
+        """Close the file. :return: futures of appended lines not yet read back (they stay in the file)."""
+        if self._file is None:
+            return []
+        self._file.close()
+        self._file = None
+        futures, self._futures = list(self._futures), deque()
+        return futures
+
+    def append(self, message):
+        if self._file is None:
+            self._open()
+        payload = encode_payload(message.payload)
+        binary = isinstance(payload, (bytes, bytearray))
+        self._file.write(json.dumps({
+            "topic": message.topic,
+            "payload": payload.decode("latin-1") if binary else payload,
+            "binary": binary,
+            "qos": message.qos,
+            "retain": message.retain,
+        }) + "\n")
+        self._file.flush()
+        self._futures.append(message.future)
+        self.pending += 1
+
+    def read(self, limit):
+        """:return: up to limit spooled messages as _Outgoing, oldest first."""
+        if self._file is None:
+            self._open()
+        self._file.seek(self._offset)
+        messages = []
+        while len(messages) < limit and self.pending:
+            entry = json.loads(self._file.readline())
+            payload = entry["payload"].encode("latin-1") if entry["binary"] else entry["payload"]
+            message = _Outgoing(entry["topic"], payload, entry["qos"], entry["retain"], 1, None)
+            if self._inherited:
+                self._inherited -= 1
+            else:
+                message.future = self._futures.popleft()
+            messages.append(message)
+            self.pending -= 1
+        self._offset = self._file.tell()
+        if not self.pending:
+            self._file.truncate(0)
+            self._offset = 0
+        return messages
+
+
+class PublishPipeline:
+    """Bounded publish queue, sender thread and acknowledgement tracking for one paho client."""
+
+    def __init__(self, client, queue_size=PUBLISH_QUEUE_SIZE, spool_path=None):
+        """
+        :param spool_path: File for messages that do not fit in the queue while offline;
+                           without one they fail with ConnectionError.
+        """
+        self.client = client
+        self._queue = queue.Queue(queue_size)
+        self._online = threading.Event()  # Cleared while the connection is down
+        self._spool = PublishSpool(spool_path) if spool_path else None
+        self._spool_lock = threading.Lock()
+        self._retries = []        # heap of (due time, sequence, _Outgoing)
+        self._sequence = itertools.count()
+        self._in_flight = {}      # paho mid -> _Outgoing waiting for on_publish
+        self._early_acks = set()  # mids acknowledged before the sender registered them
+        self._generation = 0      # Bumped on every lost connection
+        self._lock = threading.Lock()
+        self._sender = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)  # (ack time, seconds since queued)
+        self._counts = dict.fromkeys(("queued", "sent", "acked", "failed", "retried", "coalesced", "spooled"), 0)
+        if self._spool is not None and self._spool.pending:
+            self._start()
+
+    # ---------- Caller side ----------
+    def submit(self, topic, payload, qos=0, retain=False, retries=3, coalesce_key=None):
+        """
+        Queue a message for publishing.
+        :param retries: Attempts before the message fails.
+        :param coalesce_key: Replace any queued, unsent message with the same key.
+        :return: Future resolving to True once published; it fails with ConnectionError
+                 when the queue stays full or every attempt failed.
+        """
+        message = _Outgoing(topic, payload, qos, retain, max(1, retries), coalesce_key)
+        if self._sender is None:
+            self._start()
+        online = self._online.is_set()
+        if self._spool is not None:
+            with self._spool_lock:
+                # Once anything is spooled, later messages follow it there to keep their order
+                if self._spool.pending or (not online and self._queue.full()):
+                    self._spool.append(message)
+                    with self._lock:
+                        self._counts["spooled"] += 1
+                    return message.future
+        try:
+            if online:
+                self._queue.put(message, timeout=PUBLISH_QUEUE_TIMEOUT)
+            else:
+                self._queue.put_nowait(message)
+        except queue.Full:
+            self._fail(message, ConnectionError(f"Publish queue full, dropped message to {topic}"))
+        else:
+            with self._lock:
+                self._counts["queued"] += 1
+        return message.future
+
+    def pause(self):
+        """Hold outgoing messages while the connection is down."""
+        self._online.clear()
+
+    def connection_lost(self):
+        """
+        Pause, and take back QoS 0 messages paho accepted but never wrote: reconnecting
+        discards its packet queue, so they would otherwise never be published.
+        """
+        self.pause()
+        with self._lock:
+            self._generation += 1
+            for mid in [mid for mid, message in self._in_flight.items() if message.qos == 0]:
+                self._hold(self._in_flight.pop(mid))
+
+    def resume(self):
+        """Send held messages (queue and retries, then the spool) once the connection is back."""
+        self._online.set()
+
+    def on_publish(self, client, userdata, mid):
+        """paho on_publish callback: the message with this mid is out (QoS 0) or acknowledged."""
+        with self._lock:
+            message = self._in_flight.pop(mid, None)
+            if message is None:
+                self._early_acks.add(mid)
+                return
+        self._acked(message)
+
+    def fail_all(self, error):
+        """Fail every queued, retrying and unacknowledged message (e.g. on disconnect)."""
+        messages = []
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is not _STOP:
+                messages.append(message)
+        with self._lock:
+            messages += [entry[2] for entry in self._retries] + list(self._in_flight.values())
+            self._retries.clear()
+            self._in_flight.clear()
+            self._early_acks.clear()
+        for message in messages:
+            self._fail(message, error)
+
+    def close_spool(self):
+        """
+        Close the spool file (e.g. when the client is released). Messages still in it stay
+        there for the next connection or run; their futures fail, as nothing here will resolve them.
+        """
+        if self._spool is None:
+            return
+        with self._spool_lock:
+            futures = self._spool.close()
+        for future in futures:
+            if not future.done():
+                future.set_exception(ConnectionError("MQTT connection closed; message left in the spool"))
+
+    def stop(self):
+        """Stop the sender thread once the messages already queued have been handed to paho."""
+        if self._sender is not None:
+            self._queue.put(_STOP)
+            self._online.set()
+            self._sender.join()
+            self._sender = None
+
+    def stats(self):
+        """
+        :return: dict of message counts, queue depth and in-flight count, plus the recent
+                 acknowledgement rate (messages/s) and queue-to-ack latency (ms).
+        """
+        with self._lock:
+            stats = dict(self._counts, queue_depth=self._queue.qsize(), retrying=len(self._retries),
+                         in_flight=len(self._in_flight))
+            samples = list(self._latencies)
+        stats["rate_per_s"] = 0.0
+        stats["latency_ms"] = {}
+        if samples:
+            elapsed = samples[-1][0] - samples[0][0]
+            if elapsed > 0:
+                stats["rate_per_s"] = round((len(samples) - 1) / elapsed, 1)
+            latencies = sorted(latency for _, latency in samples)
+            stats["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2),
+            }
+        return stats
+
+    # ---------- Sender thread ----------
+    def _start(self):
+        with self._lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._run, name="mqtt publisher", daemon=True)
+                self._sender.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                wait = max(0, self._retries[0][0] - time.monotonic()) if self._retries else None
+            if self._spool is not None and self._spool.pending:
+                wait = 0
+            try:
+                batch = [self._queue.get(timeout=wait)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < PUBLISH_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = _STOP in batch
+            batch = [message for message in batch if message is not _STOP]
+            self._online.wait()
+            if not batch and self._spool is not None:
+                # The spool only holds messages newer than anything queued before it
+                with self._spool_lock:
+                    batch = self._spool.read(PUBLISH_BATCH_SIZE)
+            batch = self._due_retries() + batch
+            for message in self._coalesce(batch):
+                self._send(message)
+            if stopping:
+                return
+
+    def _due_retries(self):
+        due = []
+        now = time.monotonic()
+        with self._lock:
+            while self._retries and self._retries[0][0] <= now:
+                due.append(heapq.heappop(self._retries)[2])
+        return due
+
+    def _coalesce(self, batch):
+        """Keep the last message for each coalesce_key, in order of the messages kept."""
+        latest = {}
+        for message in batch:
+            if message.coalesce_key is not None:
+                replaced = latest.get(message.coalesce_key)
+                if replaced is not None:
+                    message.merged += [replaced.future] + replaced.merged
+                latest[message.coalesce_key] = message
+        if not latest:
+            return batch
+        kept = [message for message in batch
+                if message.coalesce_key is None or latest[message.coalesce_key] is message]
+        with self._lock:
+            self._counts["coalesced"] += len(batch) - len(kept)
+        return kept
+
+    def _send(self, message):
+        message.attempt += 1
+        generation = self._generation
+        try:
+            info = self.client.publish(message.topic, encode_payload(message.payload), message.qos, message.retain)
+        except (ValueError, TypeError) as e:
+            self._fail(message, e)  # Bad topic or payload; retrying will not help
+            return
+        except Exception as e:
+            self._retry(message, e)
+            return
+
+        # paho keeps QoS 1/2 messages while disconnected and sends them on reconnect,
+        # so only QoS 0 messages (and a full paho queue) need sending again.
+        if info.rc == MQTT_ERR_NO_CONN and message.qos == 0:
+            # The connection dropped before the supervisor paused us
+            with self._lock:
+                self._hold(message)
+            return
+        if info.rc != MQTT_ERR_SUCCESS and info.rc != MQTT_ERR_NO_CONN:
+            self._retry(message, ConnectionError(error_string(info.rc)))
+            return
+
+        with self._lock:
+            acked = info.mid in self._early_acks
+            if message.qos == 0 and generation != self._generation and not acked:
+                # Lost with paho's packet queue while we were handing it over
+                self._hold(message)
+                return
+            self._counts["sent"] += 1
+            if not acked:
+                self._in_flight[info.mid] = message
+                return
+            self._early_acks.discard(info.mid)
+        self._acked(message)
+
+    def _hold(self, message):
+        # Caller holds the lock. Send again once the connection is back, without using up an attempt.
+        message.attempt -= 1
+        heapq.heappush(self._retries, (time.monotonic() + RETRY_BASE_DELAY, next(self._sequence), message))
+
+    def _retry(self, message, error):
+        if message.attempt >= message.retries:
+            logger.error(f"All {message.attempt} attempts to publish to {message.topic} failed: {error}")
+            self._fail(message, error if isinstance(error, ConnectionError) else ConnectionError(str(error)))
+            return
+        delay = min(RETRY_BASE_DELAY * 2 ** (message.attempt - 1), RETRY_MAX_DELAY)
+        logger.warning(f"Publish to {message.topic} failed (attempt {message.attempt}): {error}; retrying in {delay:.1f}s")
+        with self._lock:
+            self._counts["retried"] += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), message))
+
+    # ---------- Completion ----------
+    def _acked(self, message):
+        now = time.monotonic()
+        with self._lock:
+            self._counts["acked"] += 1
+            self._latencies.append((now, now - message.queued_at))
+        for future in [message.future] + message.merged:
+            if not future.done():
+                future.set_result(True)
+
+    def _fail(self, message, error):
+        with self._lock:
+            self._counts["failed"] += 1
+        for future in [message.future] + message.merged:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,116 @@
+# services/mqtt_requests.py
+
+"""
+Table of in-flight MQTT requests for MQTTService.
+
+Each request is tagged with a correlation ID and waits on its own Future, so
+any number of commands can be outstanding at once. A reply resolves the request
+whose ID it echoes; replies without an ID resolve the oldest request waiting on
+that response topic. One background thread fails requests whose deadline passes.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+CORRELATION_KEY = "correlation_id"
+
+
+class PendingRequests:
+    """Pending request futures keyed by correlation ID and by response topic."""
+
+    def __init__(self):
+        self._by_id = {}        # correlation ID -> (future, response topic)
+        self._by_topic = {}     # response topic -> deque of correlation IDs, oldest first
+        self._deadlines = []    # heap of (deadline, sequence, correlation ID)
+        self._sequence = itertools.count()
+        self._lock = threading.Condition()
+        self._sweeper = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_id)
+
+    def waiting_on(self, topic):
+        """:return: True if any request expects a reply on topic (cheap; no lock taken)."""
+        return topic in self._by_topic
+
+    def add(self, response_topic, timeout):
+        """
+        Register a request expecting a reply on response_topic.
+        :return: (correlation_id, future); the future fails with TimeoutError after timeout seconds.
+        """
+        correlation_id = uuid.uuid4().hex
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self._by_id[correlation_id] = (future, response_topic)
+            self._by_topic.setdefault(response_topic, deque()).append(correlation_id)
+            heapq.heappush(self._deadlines, (time.monotonic() + timeout, next(self._sequence), correlation_id))
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, name="mqtt request timeouts", daemon=True)
+                self._sweeper.start()
+            self._lock.notify()
+        return correlation_id, future
+
+    def resolve(self, topic, payload):
+        """
+        Complete the request a reply belongs to.
+        :return: True if a pending request took the payload.
+        """
+        correlation_id = payload.get(CORRELATION_KEY) if isinstance(payload, dict) else None
+        with self._lock:
+            if correlation_id is None:
+                waiting = self._by_topic.get(topic)
+                if not waiting:
+                    return False
+                correlation_id = waiting[0]
+            entry = self._pop(correlation_id)
+        if entry is None:
+            return False
+        entry[0].set_result(payload)
+        return True
+
+    def fail(self, correlation_id, error):
+        """Fail one request, e.g. when its publish could not be sent."""
+        with self._lock:
+            entry = self._pop(correlation_id)
+        if entry is not None:
+            entry[0].set_exception(error)
+
+    def fail_all(self, error):
+        with self._lock:
+            entries = [self._pop(correlation_id) for correlation_id in list(self._by_id)]
+        for future, _ in entries:
+            future.set_exception(error)
+
+    def _pop(self, correlation_id):
+        # Caller holds the lock. Deadline heap entries are dropped lazily by _sweep.
+        entry = self._by_id.pop(correlation_id, None)
+        if entry is not None:
+            waiting = self._by_topic[entry[1]]
+            waiting.remove(correlation_id)
+            if not waiting:
+                del self._by_topic[entry[1]]
+        return entry
+
+    def _sweep(self):
+        while True:
+            expired = []
+            with self._lock:
+                while not self._deadlines:
+                    self._lock.wait()
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, _, correlation_id = heapq.heappop(self._deadlines)
+                    entry = self._pop(correlation_id)
+                    if entry is not None:
+                        expired.append(entry)
+                if not expired and self._deadlines:
+                    self._lock.wait(self._deadlines[0][0] - now)
+            for future, response_topic in expired:
+                future.set_exception(TimeoutError(f"Timeout waiting for response on {response_topic}"))
@@ -0,0 +1,139 @@
+# services/mqtt_router.py
+
+"""
+Topic routing for incoming MQTT messages.
+
+TopicRouter maps MQTT topic filters (with + and # wildcards) to handlers in a
+trie keyed by topic level, so finding the handlers for a topic costs one dict
+lookup per level no matter how many filters are registered. MQTTService only
+decodes a message once something wants it: unmatched traffic is dropped after
+the trie lookup, and MQTTMessage decodes its payload on first access.
+"""
+
+import threading
+
+from db_connection import DB_FILE, get_manager
+from utils.json_backend import json_loads
+
+
+class MQTTMessage:
+    """Incoming message whose payload is decoded on first access."""
+
+    __slots__ = ("topic", "raw", "_text", "_payload")
+    _UNSET = object()
+
+    def __init__(self, topic, raw):
+        self.topic = topic
+        self.raw = raw
+        self._text = None
+        self._payload = self._UNSET
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.raw.decode(errors="replace")
+        return self._text
+
+    @property
+    def payload(self):
+        """The decoded JSON payload, or the text if it is not JSON."""
+        if self._payload is self._UNSET:
+            try:
+                self._payload = json_loads(self.text)
+            except ValueError:
+                self._payload = self.text
+        return self._payload
+
+    def __repr__(self):
+        return f"MQTTMessage(topic={self.topic!r}, raw={self.raw!r})"
+
+
+class _Node:
+    __slots__ = ("children", "handlers", "wildcard_handlers")
+
+    def __init__(self):
+        self.children = {}            # topic level (or "+") -> _Node
+        self.handlers = []            # filters ending at this level
+        self.wildcard_handlers = []   # filters ending in "#" below this level
+
+
+class TopicRouter:
+    """Trie of MQTT topic filters to handler callables."""
+
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._filters = {}  # topic filter -> number of handlers
+
+    def add(self, topic_filter, handler):
+        """Route messages matching topic_filter to handler(message)."""
+        with self._lock:
+            node = self._root
+            levels = topic_filter.split("/")
+            for position, level in enumerate(levels):
+                if level == "#":
+                    if position != len(levels) - 1:
+                        raise ValueError(f"'#' must be the last level of a topic filter: {topic_filter}")
+                    # Handler lists are replaced rather than mutated so match() needs no lock
+                    node.wildcard_handlers = node.wildcard_handlers + [handler]
+                    break
+                node = node.children.setdefault(level, _Node())
+            else:
+                node.handlers = node.handlers + [handler]
+            self._filters[topic_filter] = self._filters.get(topic_filter, 0) + 1
+
+    def remove(self, topic_filter, handler):
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                if level == "#":
+                    node.wildcard_handlers = [h for h in node.wildcard_handlers if h != handler]
+                    break
+                node = node.children.get(level)
+                if node is None:
+                    return
+            else:
+                node.handlers = [h for h in node.handlers if h != handler]
+            remaining = self._filters.get(topic_filter, 1) - 1
+            if remaining > 0:
+                self._filters[topic_filter] = remaining
+            else:
+                self._filters.pop(topic_filter, None)
+
+    def filters(self):
+        """:return: the topic filters that currently have handlers."""
+        with self._lock:
+            return list(self._filters)
+
+    def match(self, topic):
+        """:return: list of handlers whose filter matches topic (empty when nothing does)."""
+        matched = []
+        nodes = [self._root]
+        levels = topic.split("/")
+        # Per the MQTT spec, wildcards at the first level do not match $SYS-style topics
+        system_topic = topic.startswith("$")
+        for position, level in enumerate(levels):
+            next_nodes = []
+            for node in nodes:
+                if node.wildcard_handlers and not (system_topic and position == 0):
+                    matched.extend(node.wildcard_handlers)
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+                child = node.children.get("+")
+                if child is not None and not (system_topic and position == 0):
+                    next_nodes.append(child)
+            if not next_nodes:
+                return matched
+            nodes = next_nodes
+        for node in nodes:
+            matched.extend(node.handlers)
+            # "a/#" also matches "a" itself
+            matched.extend(node.wildcard_handlers)
+        return matched
+
+
+def known_topics(db_path=DB_FILE):
+    """:return: the distinct topics the JS parser recorded in the mqtt_topics table."""
+    rows = get_manager(db_path).read("SELECT DISTINCT topic FROM mqtt_topics WHERE topic IS NOT NULL ORDER BY topic")
+    return [row[0] for row in rows]
@@ -1,51 +1,97 @@
+import hashlib
 import os
-import json
 import time
 import threading
 import socket
 from dotenv import load_dotenv
-from paho.mqtt.client import Client
+from paho.mqtt.client import Client, connack_string
 from services.custom_logger import CustomLogger
+from services.mqtt_requests import PendingRequests, CORRELATION_KEY
+from services.mqtt_router import MQTTMessage, TopicRouter
+from services.mqtt_publisher import PublishPipeline
+from services.mqtt_supervisor import ConnectionSupervisor
 
 # Load environment variables from .env
 load_dotenv()
 
-# Fetch MQTT broker details from .env
-MQTT_BROKER = os.getenv("MQTT_BROKER",  socket.gethostbyname(socket.gethostname()))
+# Fetch MQTT broker details from .env (without MQTT_BROKER, this machine's address; see default_broker)
+MQTT_BROKER = os.getenv("MQTT_BROKER") or None
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", None)
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", None)
 MQTT_TLS = os.getenv("MQTT_TLS", "False").lower() in ("true", "1")
+MQTT_EXEC_TOPIC = os.getenv("MQTT_EXEC_TOPIC", "exec")
+MQTT_EXEC_RESPONSE_TOPIC = os.getenv("MQTT_EXEC_RESPONSE_TOPIC", "exec/response")
+MQTT_MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", 100))  # Unacknowledged QoS 1/2 messages paho allows
+MQTT_COMMAND_QOS = int(os.getenv("MQTT_COMMAND_QOS", 1))  # QoS for exec commands, so a broker blip cannot drop them
+MQTT_SPOOL_FILE = os.getenv("MQTT_SPOOL_FILE") or None  # On-disk overflow for messages published while offline;
+                                                        # each broker and login gets its own file next to it
 
 # Initialize logger
 logger = CustomLogger.get_logger("mqtt_service")
 
 DEFAULT_RETRY_COUNT = 3
 DEFAULT_RETRY_DELAY = 2  # Seconds between retries
+DEFAULT_REQUEST_TIMEOUT = 5  # Seconds to wait for a response
+DEFAULT_CONNECT_TIMEOUT = 5  # Seconds connect() waits for the first connection attempt
+SUBSCRIBE_BATCH_SIZE = 100  # Topic filters per SUBSCRIBE packet
+
+
+def client_key(broker=MQTT_BROKER, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, tls=MQTT_TLS):
+    """Normalised (broker, port, username, password, tls); one shared client and spool per key."""
+    return broker or None, int(port or MQTT_PORT), username or None, password or None, bool(tls)
+
+
+def spool_path(spool_file, key):
+    """Spool file for one client key, so messages spooled for one broker are never replayed to another."""
+    if not spool_file:
+        return None
+    base, ext = os.path.splitext(spool_file)
+    # Hashed so the password never appears in a file name
+    return f"{base}-{hashlib.sha1(repr(key).encode()).hexdigest()[:12]}{ext}"
+
+
+def default_broker():
+    """MQTT_BROKER, or this machine's address; resolved when connecting rather than at import."""
+    return MQTT_BROKER or socket.gethostbyname(socket.gethostname())
 
 
 class MQTTService:
     """Enhanced MQTT Service for interacting with devices."""
 
-    def __init__(self, broker=MQTT_BROKER, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, tls=MQTT_TLS):
+    def __init__(self, broker=MQTT_BROKER, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, tls=MQTT_TLS,
+                 spool_file=MQTT_SPOOL_FILE):
         """
         Initialize the MQTT client.
 
-        :param broker: MQTT broker address.
+        :param broker: MQTT broker address (None for default_broker(), resolved on connect).
         :param port: MQTT broker port.
         :param username: Username for authentication (optional).
         :param password: Password for authentication (optional).
         :param tls: Enable TLS/SSL (default: False).
+        :param spool_file: File for messages published while offline once the outbound queue is full (optional);
+                           the client spools to its own file derived from it (see spool_path).
         """
         self.broker = broker
         self.port = port
         self.username = username
         self.password = password
         self.tls = tls
-        self.client = Client()
+        self.topic_exec = MQTT_EXEC_TOPIC
+        self.topic_exec_response = MQTT_EXEC_RESPONSE_TOPIC
+        # Reconnecting is left to the supervisor rather than paho's network loop
+        self.client = Client(reconnect_on_failure=False)
+        spool = spool_path(spool_file, client_key(broker, port, username, password, tls))
+        self.publisher = PublishPipeline(self.client, spool_path=spool)  # Sender thread behind publish()
+        self.supervisor = ConnectionSupervisor(self.client, self._set_state, prepare=self._prepare_connection)
+        self._state_listeners = []  # callback(state, detail), see add_state_listener
+        self._subscriptions = set()  # Topics passed to subscribe(), restored after reconnecting
         self._setup_client()
         self.response = None  # Store the response
         self.response_event = threading.Event()  # Event to synchronize request/response
+        self.pending = PendingRequests()  # In-flight requests by correlation ID (see request)
+        self._response_topics = set()  # Response topics already subscribed
+        self.router = TopicRouter()  # Topic filter -> handlers for incoming messages, see route
         self.connected = False    # track connection state
 
     def _setup_client(self):
@@ -58,68 +104,186 @@ class MQTTService:
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.publisher.on_publish
+        self.client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
 
     def on_connect(self, client, userdata, flags, rc):
         """Handle MQTT connection events."""
         if rc == 0:
             self.connected = True    #successful connection
-            logger.info(f"Connected to MQTT broker at {self.broker}:{self.port}")
+            self.supervisor.connection_made()
+            # A clean session loses subscriptions; pending requests and routes still need their messages
+            self.subscribe_many(self._subscriptions | self._response_topics | set(self.router.filters()))
+            self.publisher.resume()
+            self._set_state("connected", f"{self.broker}:{self.port}")
         else:
             self.connected = False
-            logger.error(f"Failed to connect to MQTT broker with code {rc}")
+            self._set_state("refused", connack_string(rc))
 
     def on_disconnect(self, client, userdata, rc):
-        """Handle MQTT disconnection events."""
+        """Handle MQTT disconnection events; the supervisor reconnects unless disconnect() was called."""
         self.connected = False    #disconnected
+        self.publisher.connection_lost()
+        self.supervisor.connection_lost()
         if rc != 0:
-            logger.warning(f"Unexpected disconnection from MQTT broker (code {rc}). Attempting to reconnect...")
-            self.connect()
+            self._set_state("disconnected", f"unexpected disconnection (code {rc}), reconnecting")
+
+    def add_state_listener(self, callback):
+        """
+        Call callback(state, detail) on connection state changes: "connected", "disconnected",
+        "reconnecting", "refused" or "closed". Called from the MQTT threads.
+        """
+        self._state_listeners = self._state_listeners + [callback]
+
+    def remove_state_listener(self, callback):
+        self._state_listeners = [listener for listener in self._state_listeners if listener != callback]
+
+    def _set_state(self, state, detail=""):
+        if state == "connected":
+            logger.info(f"Connected to MQTT broker at {detail}")
+        elif state == "closed":
+            logger.info(detail)
+        else:
+            logger.warning(f"MQTT {state}: {detail}")
+        for listener in self._state_listeners:
+            try:
+                listener(state, detail)
+            except Exception as e:
+                logger.error(f"MQTT state listener failed: {e}")
 
     def on_message(self, client, userdata, msg):
         """Handle incoming MQTT messages."""
+        handlers = self.router.match(msg.topic)
+        waiting = self.pending.waiting_on(msg.topic)
+        if not handlers and not waiting:
+            return  # Nobody wants it: no decoding, no logging
+
+        # The payload is only decoded if a pending request or a handler reads it
+        message = MQTTMessage(msg.topic, msg.payload)
+        logger.debug("Received message on %s (%d bytes)", msg.topic, len(msg.payload))
         try:
-            logger.info(f"Received message on {msg.topic}: {msg.payload.decode()}")
-            self.response = json.loads(msg.payload.decode())
-            self.response_event.set()  # Signal that a response was received
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON payload on topic {msg.topic}")
+            if waiting and self.pending.resolve(msg.topic, message.payload):
+                self.response = message.payload
+                self.response_event.set()  # Signal that a response was received
         except Exception as e:
-            logger.error(f"Failed to process message: {e}")
+            logger.error(f"Failed to process reply on {msg.topic}: {e}")
 
-    def connect(self):
-        """Connect to the MQTT broker."""
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Handler for {msg.topic} failed: {e}")
+
+    def add_listener(self, topic_filter: str, callback):
+        """
+        Call callback(message) from the network thread for every message whose topic
+        matches topic_filter (MQTT + and # wildcards allowed). message is an MQTTMessage
+        whose payload is decoded on first access. Subscribing is up to the caller; use
+        route() to do both.
+        """
+        self.router.add(topic_filter, callback)
+
+    def remove_listener(self, topic_filter: str, callback):
+        self.router.remove(topic_filter, callback)
+
+    def route(self, topic_filters, handler):
+        """Add handler for each topic filter and subscribe to them in batched SUBSCRIBE packets."""
+        topic_filters = list(topic_filters)
+        for topic_filter in topic_filters:
+            self.router.add(topic_filter, handler)
+        self._start_lazily()
+        self.subscribe_many(topic_filters)
+
+    def unroute(self, topic_filters, handler):
+        """Remove handler from each topic filter, unsubscribing filters nothing else uses."""
+        for topic_filter in topic_filters:
+            self.router.remove(topic_filter, handler)
+        # Filters also passed to subscribe() stay subscribed and are still restored on reconnect
+        still_used = set(self.router.filters()) | self._response_topics | self._subscriptions
+        unused = [topic_filter for topic_filter in topic_filters if topic_filter not in still_used]
+        if unused:
+            try:
+                self.client.unsubscribe(unused)
+            except Exception as e:
+                logger.error(f"Failed to unsubscribe from {len(unused)} topics: {e}")
+
+    def connect(self, timeout=DEFAULT_CONNECT_TIMEOUT):
+        """
+        Connect to the MQTT broker and keep reconnecting after failures (see ConnectionSupervisor).
+        Waits up to timeout seconds for the first attempt. :return: True if connected.
+        """
         try:
-            self.client.connect(self.broker, self.port, keepalive=60)
-            self.client.loop_start()
-            logger.info(f"Connected to MQTT broker at {self.broker}:{self.port}")
+            self.supervisor.start()
+            self.supervisor.wait_first_attempt(timeout)
         except Exception as e:
             self.connected = False
             logger.error(f"Error connecting to MQTT broker: {e}")
+        return self.connected
+
+    def ensure_connected(self, timeout=DEFAULT_CONNECT_TIMEOUT):
+        """
+        Connect on first use, waiting up to timeout seconds. Callers that arrive while another
+        thread's first attempt is still in progress wait for it too. :return: True if connected.
+        """
+        if not self.supervisor.started:
+            return self.connect(timeout)
+        if not self.connected:
+            self.supervisor.wait_first_attempt(timeout)
+        return self.connected
+
+    def _start_lazily(self):
+        # Publishing or subscribing starts the connection without waiting for it;
+        # messages are held by the publisher until it is up.
+        if not self.supervisor.started:
+            self.connect(timeout=0)
+
+    def _prepare_connection(self):
+        """Runs on the supervisor thread before each connection attempt."""
+        if self.broker is None:
+            self.broker = default_broker()
+        self.client.connect_async(self.broker, self.port, keepalive=60)
 
     def disconnect(self):
         """Disconnect from the MQTT broker."""
-        self.client.loop_stop()
-        self.client.disconnect()
+        self.supervisor.stop()
         self.connected = False    # we hit disconnect then disconnect state updates
-        logger.info("MQTT connection closed.")
+        self._response_topics.clear()
+        self.pending.fail_all(ConnectionError("MQTT connection closed"))
+        self.publisher.fail_all(ConnectionError("MQTT connection closed"))
+        self.publisher.close_spool()
+        self._set_state("closed", "MQTT connection closed")
 
-    def publish(self, topic: str, payload: dict, retries=DEFAULT_RETRY_COUNT):
-        """Publish a message to a specific MQTT topic."""
-        for attempt in range(retries):
-            try:
-                self.client.publish(topic, json.dumps(payload))
-                logger.info(f"Published to {topic}: {payload}")
-                return
-            except Exception as e:
-                logger.error(f"Failed to publish to {topic} on attempt {attempt + 1}: {e}")
-                time.sleep(DEFAULT_RETRY_DELAY)
-        logger.error(f"All attempts to publish to {topic} failed.")
+    def publish(self, topic: str, payload, retries=DEFAULT_RETRY_COUNT, qos=0, coalesce_key=None):
+        """
+        Queue a message for the publisher thread without waiting for it to be sent.
+        dict/list payloads are sent as JSON, str and bytes as they are.
+        :param coalesce_key: Replace any queued, unsent message with the same key (latest value wins).
+        :return: True once queued (False if the outbound queue stayed full).
+        """
+        future = self.publish_tracked(topic, payload, retries, qos, coalesce_key)
+        return not (future.done() and future.exception() is not None)
+
+    def publish_tracked(self, topic: str, payload, retries=DEFAULT_RETRY_COUNT, qos=0, coalesce_key=None):
+        """
+        Like publish(), but return a concurrent.futures.Future resolving to True once paho
+        reports the message published: written to the socket for QoS 0, acknowledged by
+        the broker for QoS 1 and 2. It fails with ConnectionError after `retries` attempts.
+        """
+        logger.debug("Publishing to %s", topic)
+        self._start_lazily()
+        return self.publisher.submit(topic, payload, qos=qos, retries=retries, coalesce_key=coalesce_key)
+
+    def publish_stats(self):
+        """:return: publisher counters, queue depth, ack rate and latency (see PublishPipeline.stats)."""
+        return self.publisher.stats()
 
     def subscribe(self, topic: str, retries=DEFAULT_RETRY_COUNT):
         """Subscribe to a specific MQTT topic."""
+        self._start_lazily()
         for attempt in range(retries):
             try:
                 self.client.subscribe(topic)
+                self._subscriptions.add(topic)
                 logger.info(f"Subscribed to {topic}")
                 return
             except Exception as e:
@@ -127,7 +291,44 @@ class MQTTService:
                 time.sleep(DEFAULT_RETRY_DELAY)
         logger.error(f"All attempts to subscribe to {topic} failed.")
 
-    def send_request(self, topic: str, payload: dict, response_topic: str, timeout: int = 5) -> dict:
+    def subscribe_many(self, topics):
+        """Subscribe to several topics, SUBSCRIBE_BATCH_SIZE per SUBSCRIBE packet."""
+        topics = sorted(topics)
+        for start in range(0, len(topics), SUBSCRIBE_BATCH_SIZE):
+            batch = topics[start:start + SUBSCRIBE_BATCH_SIZE]
+            try:
+                self.client.subscribe([(topic, 0) for topic in batch])
+            except Exception as e:
+                logger.error(f"Failed to subscribe to {len(batch)} topics: {e}")
+        if topics:
+            logger.info(f"Subscribed to {len(topics)} topics")
+
+    def request(self, topic: str, payload, response_topic: str, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        """
+        Publish a request tagged with a new correlation ID without waiting for the reply.
+
+        Any number of requests may be in flight at once. The reply is matched by the
+        correlation_id it echoes, or else to the oldest request waiting on response_topic.
+        :param payload: dict, or a command string sent as {"command": payload}.
+        :return: concurrent.futures.Future resolving to the reply payload; it fails with
+                 TimeoutError after timeout seconds, or ConnectionError on disconnect.
+        """
+        if response_topic not in self._response_topics:
+            # Never sleeps: callers include the Tk thread. A failed SUBSCRIBE is retried by
+            # on_connect, which restores every response topic after (re)connecting.
+            self._response_topics.add(response_topic)
+            self._start_lazily()
+            self.subscribe_many([response_topic])
+
+        correlation_id, future = self.pending.add(response_topic, timeout)
+        message = dict(payload) if isinstance(payload, dict) else {"command": payload}
+        message[CORRELATION_KEY] = correlation_id
+        published = self.publish_tracked(topic, message, qos=MQTT_COMMAND_QOS)
+        published.add_done_callback(lambda done: done.exception() is None or self.pending.fail(
+            correlation_id, ConnectionError(f"Could not publish to {topic}")))
+        return future
+
+    def send_request(self, topic: str, payload: dict, response_topic: str, timeout: int = DEFAULT_REQUEST_TIMEOUT) -> dict:
         """
         Send an MQTT request and wait for a response.
 
@@ -137,17 +338,13 @@ class MQTTService:
         :param timeout: Timeout for waiting for a response (in seconds).
         :return: The response payload or an error message if timed out.
         """
-        self.response = None
-        self.response_event.clear()
-
-        self.subscribe(response_topic)
-        self.publish(topic, payload)
-
-        if self.response_event.wait(timeout):
-            return {"success": True, "response": self.response}
-        else:
+        try:
+            return {"success": True, "response": self.request(topic, payload, response_topic, timeout).result()}
+        except TimeoutError:
             logger.warning(f"Timeout waiting for response on {response_topic}")
             return {"success": False, "error": "Timeout waiting for response"}
+        except ConnectionError as e:
+            return {"success": False, "error": str(e)}
 
     def list_topics(self):
         """List all topics the client is subscribed to."""
@@ -194,3 +391,37 @@ class MQTTService:
 
     def is_connected(self):
         return self.connected
+
+
+_clients = {}  # (broker, port, username, password, tls) -> [MQTTService, reference count]
+_clients_lock = threading.Lock()
+
+
+def get_client(broker=MQTT_BROKER, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, tls=MQTT_TLS):
+    """
+    Return the process-wide MQTTService for this broker and credentials, so every part of
+    the app shares one connection per broker. Each call takes a reference; give it back with
+    release_client(). The client connects lazily, on its first publish, request or subscription.
+    """
+    key = client_key(broker, port, username, password, tls)
+    with _clients_lock:
+        entry = _clients.get(key)
+        if entry is None:
+            entry = _clients[key] = [MQTTService(*key), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_client(service):
+    """Drop a reference taken by get_client(); the last one disconnects the client."""
+    with _clients_lock:
+        for key, entry in _clients.items():
+            if entry[0] is service:
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del _clients[key]
+                break
+        else:
+            return
+    service.disconnect()
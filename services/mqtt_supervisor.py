@@ -0,0 +1,132 @@
+# services/mqtt_supervisor.py
+
+"""
+Connection supervisor for MQTTService.
+
+paho's own reconnect logic is switched off (reconnect_on_failure=False) and one
+supervisor thread owns the connection instead: it connects, runs paho's network
+loop while the connection is up, and after a failure or a broker restart tries
+again with jittered exponential backoff. The backoff is only reset once a
+connection has stayed up for STABLE_CONNECTION_TIME, so a broker that accepts
+and immediately drops the client (ACL kick, client-id takeover) is retried at
+a growing interval rather than in a hot loop. Only this thread ever calls
+reconnect() or loop_start(), so a flapping broker cannot leave extra network
+loops behind, and nothing reconnects from inside a paho callback.
+"""
+
+import random
+import threading
+import time
+
+from services.custom_logger import CustomLogger
+
+logger = CustomLogger.get_logger("mqtt_supervisor")
+
+RECONNECT_BASE_DELAY = 0.5   # Seconds before the first reconnect attempt; doubles per failure
+RECONNECT_MAX_DELAY = 30     # Upper bound on the reconnect delay
+STABLE_CONNECTION_TIME = 30  # Seconds a connection must last before the backoff starts over
+
+
+def backoff_delay(attempt, base=RECONNECT_BASE_DELAY, maximum=RECONNECT_MAX_DELAY):
+    """Exponential backoff with equal jitter: half the delay is fixed, half is random."""
+    delay = min(maximum, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class ConnectionSupervisor:
+    """Keeps one paho client connected; state changes are reported through on_state(state, detail)."""
+
+    def __init__(self, client, on_state, prepare=None):
+        """
+        :param prepare: Called on the supervisor thread before each connection attempt, e.g. to
+                        resolve the broker address and call connect_async(), so that DNS lookups
+                        never block the caller.
+        """
+        self.client = client
+        self.on_state = on_state
+        self.prepare = prepare
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lost = threading.Event()       # Set by connection_lost() or stop()
+        self._connected = threading.Event()  # Set by connection_made() for the current connection
+        self._connected_at = None
+        self._first_attempt = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start supervising (connect_async() must have been called on the client, or by prepare)."""
+        with self._start_lock:
+            if not self.started:
+                self._stopping.clear()
+                self._lost.clear()
+                self._first_attempt.clear()
+                self._thread = threading.Thread(target=self._run, name="mqtt supervisor", daemon=True)
+                self._thread.start()
+
+    @property
+    def started(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait_first_attempt(self, timeout):
+        """Block until the first connection attempt succeeded or failed (or timeout passes)."""
+        self._first_attempt.wait(timeout)
+
+    def connection_made(self):
+        """Called from on_connect once the broker accepted the connection."""
+        self._connected_at = time.monotonic()
+        self._connected.set()
+        self._first_attempt.set()
+
+    def connection_lost(self):
+        """Called from on_disconnect; the supervisor takes it from there."""
+        self._lost.set()
+
+    def stop(self):
+        """Stop reconnecting and disconnect cleanly."""
+        self._stopping.set()
+        try:
+            self.client.disconnect()
+        except Exception as e:
+            logger.warning(f"Error during MQTT disconnect: {e}")
+        self._lost.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        attempt = 0
+        while not self._stopping.is_set():
+            self._connected.clear()
+            self._lost.clear()
+            try:
+                if self.prepare is not None:
+                    self.prepare()
+                self.client.reconnect()
+            except Exception as e:
+                self._first_attempt.set()
+                delay = backoff_delay(attempt)
+                attempt += 1
+                self.on_state("reconnecting", f"{e}; retrying in {delay:.1f}s (attempt {attempt})")
+                self._stopping.wait(delay)
+                continue
+
+            self.client.loop_start()
+            while not self._lost.wait(1) and not self._stopping.is_set():
+                pass
+            # paho's loop thread exits by itself once the connection is gone
+            self.client.loop_stop()
+
+            if self._stopping.is_set():
+                break
+            if self._connected.is_set():
+                if time.monotonic() - self._connected_at >= STABLE_CONNECTION_TIME:
+                    attempt = 0
+                reason = "connection dropped"
+            else:
+                # Socket opened but the broker never accepted the connection
+                self._first_attempt.set()
+                reason = "connection refused"
+            delay = backoff_delay(attempt)
+            attempt += 1
+            self.on_state("reconnecting", f"{reason}; retrying in {delay:.1f}s (attempt {attempt})")
+            self._stopping.wait(delay)
@@ -4,13 +4,17 @@ import re
 import json
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+from db_connection import get_manager
+from page_cache import get_page_cache
 
+DB_FILE = "ui_map.db"
 MQTT_TOPIC_REGEX = re.compile(r"[\"']([a-zA-Z0-9_/\\-]+)[\"']")
 
 class ParserService:
     def __init__(self, root, conn):
         self.root = root
         self.conn = conn
+        self.db = get_manager(DB_FILE)  # All writes go through its writer thread
         self.page_name = ""
         self.js_structure_by_file = {}
         self.mqtt_topics = set()
@@ -31,23 +35,24 @@ class ParserService:
         with open(js_path, 'r', encoding='utf-8') as f:
             content = f.read()
 
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM js_functions WHERE page_name = ?", (page_name,))
-
+        from db_bootstrap import refresh_widget_search
         matches = re.findall(r'(?:function|var)\s+([a-zA-Z0-9_]+)\s*=?\s*function\s*\((.*?)\)', content)
-        for fn_name, args in matches:
-            cur.execute(
-                "INSERT INTO js_functions (page_name, function_name, parameters) VALUES (?, ?, ?)",
-                (page_name, fn_name, args.strip())
-            )
-        self.conn.commit()
-
         topics_found = self.extract_mqtt_topics(content)
         self.mqtt_topics.update(topics_found)
 
-        for topic in topics_found:
-            cur.execute("INSERT INTO mqtt_topics (page_name, topic) VALUES (?, ?)", (page_name, topic))
-        self.conn.commit()
+        def assign(conn):
+            cur = conn.cursor()
+            cur.execute("DELETE FROM js_functions WHERE page_name = ?", (page_name,))
+            cur.executemany(
+                "INSERT INTO js_functions (page_name, function_name, parameters) VALUES (?, ?, ?)",
+                [(page_name, fn_name, args.strip()) for fn_name, args in matches]
+            )
+            refresh_widget_search(cur, [page_name])
+            cur.executemany("INSERT OR IGNORE INTO mqtt_topics (page_name, topic) VALUES (?, ?)",
+                            [(page_name, topic) for topic in topics_found])
+
+        self.db.write(assign)
+        get_page_cache(DB_FILE).invalidate(page_name)
 
         messagebox.showinfo(
             "Success",
@@ -93,8 +98,20 @@ class ParserService:
         return ask_user_for_folders()
 
     def load_sql_and_js(self, sql_path, js_path):
-        from db_bootstrap import parse_sql_and_js, init_db
-        init_db()
-        parse_sql_and_js(sql_path, js_path)
+        from db_bootstrap import sync_sources
+        stats = self.db.write(lambda conn: sync_sources(sql_path, js_path, conn=conn))
+        if stats["added"] or stats["changed"] or stats["removed"]:
+            # A JS file also changes the navigations shown on the pages it targets
+            get_page_cache(DB_FILE).clear()
+        return stats
+
+    def search(self, query, limit=20):
+        """
+        Ranked prefix/fuzzy search over widget names, types, pages, widget details
+        and page JS functions.
+        :return: list of (db_id, page_name, widget_name, widget_type), best match first.
+        """
+        from db_bootstrap import search_widgets
+        return search_widgets(self.conn, query, limit)
 
 
@@ -0,0 +1,196 @@
+# services/results_sink.py
+
+"""
+Streaming recorder for test run results.
+
+Instead of collecting every step result in memory and writing them once at the
+end, a ResultsSink appends each result to a JSON Lines file the moment it
+completes. The file starts with a header record describing the run:
+
+    {"run": {"template": ..., "plan": <fingerprint>, "repeat_count": 100, "started": ...}}
+    {"device": "ctrl07", "repeat": 1, "step": 0, "type": "mqtt", "status": "success", ...}
+    ...
+    {"summary": {...}}
+
+Every record is flushed immediately, so other processes can follow the run
+with tail_results(); the file is fsynced every RESULTS_FSYNC_INTERVAL seconds
+and on close, which bounds what a power loss can take. After a crash,
+resume_points() reads the file back and tells the runners where each device
+left off, and opening the sink with resume=True continues the same file.
+"""
+
+import json
+import os
+import threading
+import time
+
+from services.custom_logger import CustomLogger
+
+logger = CustomLogger.get_logger("results_sink")
+
+RESULTS_DIR = "results"
+RESULTS_FSYNC_INTERVAL = 2.0   # Seconds between fsyncs while results are being written
+PASSING_STATUSES = ("success", "waited")
+
+
+def default_results_path(prefix="test_results"):
+    """A new timestamped file under RESULTS_DIR."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    return os.path.join(RESULTS_DIR, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+
+def read_results(path):
+    """
+    Read every complete record of a results file.
+    A torn last line (the writer died mid-record) is skipped.
+    :return: (header dict or None, list of result records, summary dict or None)
+    """
+    header, results, summary = None, [], None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable line in {path}: {line[:80]!r}")
+                continue
+            if "run" in record:
+                header = record["run"]
+            elif "summary" in record:
+                summary = record["summary"]
+            else:
+                results.append(record)
+    return header, results, summary
+
+
+def resume_points(path):
+    """
+    Work out where each device stopped in an interrupted run.
+    :return: (header, {device: {"repeat": repeat index, "step": step index to run next,
+                                "done": steps completed, "failures": steps that did not pass}})
+    """
+    header, results, _ = read_results(path)
+    step_count = (header or {}).get("steps")
+    points = {}
+    for record in results:
+        point = points.setdefault(record.get("device"), {"repeat": 0, "step": 0, "done": 0, "failures": 0})
+        point["done"] += 1
+        if record.get("status") not in PASSING_STATUSES:
+            point["failures"] += 1
+        position = (record["repeat"] - 1, record["step"] + 1)
+        if position >= (point["repeat"], point["step"]):
+            point["repeat"], point["step"] = position
+    if step_count:
+        for point in points.values():
+            if point["step"] >= step_count:
+                point["repeat"], point["step"] = point["repeat"] + 1, 0
+    return header, points
+
+
+def tail_results(path, follow=True, poll_interval=0.5, stop_event=None):
+    """
+    Yield records from a results file as they are written, like `tail -f`.
+    Stops at the summary record, at end of file when follow is False, or when stop_event is set.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        partial = ""
+        while stop_event is None or not stop_event.is_set():
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(poll_interval)
+                continue
+            partial += line
+            if not partial.endswith("\n"):
+                continue  # The writer has not finished this record yet
+            try:
+                record = json.loads(partial)
+            except ValueError:
+                record = None
+            partial = ""
+            if record is not None:
+                yield record
+                if "summary" in record:
+                    return
+
+
+class ResultsSink:
+    """Thread-safe JSON Lines writer for one run's results."""
+
+    def __init__(self, path, run_info=None, resume=False, fsync_interval=RESULTS_FSYNC_INTERVAL):
+        """
+        :param run_info: Header written at the start of a new file (template, plan fingerprint, steps, ...).
+        :param resume: Continue an existing file instead of starting a new one.
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.count = 0
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if resume and os.path.exists(path):
+            self._drop_torn_line()
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._write({"run": dict(run_info or {}, started=time.strftime("%Y-%m-%d %H:%M:%S"))})
+
+    def record(self, result, device=None):
+        """Append one step result; called from any runner thread as each step completes."""
+        record = dict(result, device=device) if device is not None else result
+        with self._lock:
+            self._write(record)
+            self.count += 1
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def close(self, summary=None):
+        """Write the summary record (if any), fsync and close."""
+        with self._lock:
+            if self._file.closed:
+                return
+            if summary is not None:
+                self._write({"summary": summary})
+            self._sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()  # Visible to tail_results immediately
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def _drop_torn_line(self):
+        # A crash can leave half a record at the end; cut it so appended records start on a new line
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            position = end
+            while position > 0:
+                start = max(0, position - 65536)
+                f.seek(start)
+                chunk = f.read(position - start)
+                if position == end and chunk.endswith(b"\n"):
+                    return
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                    break
+                position = start
+            else:
+                f.truncate(0)
+            logger.warning(f"Dropped an incomplete last record from {self.path}")
@@ -0,0 +1,212 @@
+# services/ssh_pool.py
+
+"""
+Pool of long-lived SSH connections to test controllers.
+
+Running `ssh user@host '...'` through subprocess pays a full TCP and SSH
+handshake for every command. The pool keeps one paramiko transport per
+(host, user, port) and runs each command on its own channel, so any number of
+commands, including concurrent ones, share a single handshake. Transports send
+keepalives, are reopened if they die, and are closed after SSH_IDLE_TIMEOUT
+seconds without use. A connection made interactively by SSHService is adopted
+into the pool so later commands reuse it; the pool never closes an adopted
+connection, which stays owned by the service that made it.
+
+Authentication follows the ssh command line: agent and ~/.ssh keys, plus the
+SSH_PASS password when it is set.
+"""
+
+import os
+import socket
+import threading
+import time
+
+import paramiko
+
+from services.custom_logger import CustomLogger
+from services.ssh_stream import SSH_MAX_OUTPUT, stream_command
+
+logger = CustomLogger.get_logger("ssh_pool")
+
+SSH_PORT = 22
+SSH_PASSWORD = os.getenv("SSH_PASS") or None
+SSH_CONNECT_TIMEOUT = 10   # Seconds for the TCP connect and SSH handshake
+SSH_KEEPALIVE = 30         # Seconds between keepalive packets on idle transports
+SSH_IDLE_TIMEOUT = 300     # Seconds before an unused transport is closed
+
+
+class _Session:
+    __slots__ = ("client", "last_used", "channels", "owned")
+
+    def __init__(self, client, owned=True):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.channels = 0  # Commands currently running on this transport
+        self.owned = owned  # False for adopted clients, which the pool must not close
+
+    def alive(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+class SSHSessionPool:
+    """Shared paramiko transports keyed by (host, user, port)."""
+
+    def __init__(self, idle_timeout=SSH_IDLE_TIMEOUT, keepalive=SSH_KEEPALIVE):
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._sessions = {}     # (host, user, port) -> _Session
+        self._connecting = {}   # (host, user, port) -> Lock held while connecting
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def run(self, host, user, command, timeout=None, port=SSH_PORT, password=None,
+            subscribers=(), max_output=SSH_MAX_OUTPUT):
+        """
+        Run command on host over a pooled connection, streaming its output (see ssh_stream.stream_command).
+        :param timeout: Seconds the command may take before subprocess.TimeoutExpired is raised.
+        :param subscribers: Callables taking (stream, line), called as each line arrives.
+        :return: subprocess.CompletedProcess with text stdout/stderr and the exit status as returncode.
+        """
+        key = (host, user, port)
+        session, channel = self._open_channel(key, password)
+        try:
+            return stream_command(channel, command, subscribers, timeout, max_output)
+        finally:
+            self._checkin(session)
+
+    def adopt(self, host, user, client, port=SSH_PORT):
+        """Add an already connected paramiko.SSHClient (e.g. from SSHService) to the pool."""
+        self._tune(client)
+        with self._lock:
+            previous = self._sessions.get((host, user, port))
+            self._sessions[(host, user, port)] = _Session(client, owned=False)
+        if previous is not None and previous.client is not client and previous.channels == 0:
+            self._release(previous)
+        self._start_reaper()
+
+    def close(self, host=None, user=None, port=SSH_PORT):
+        """Close the connection to host (or every connection when host is None)."""
+        with self._lock:
+            if host is None:
+                sessions = list(self._sessions.values())
+                self._sessions.clear()
+            else:
+                session = self._sessions.pop((host, user, port), None)
+                sessions = [session] if session is not None else []
+        for session in sessions:
+            self._release(session)
+
+    def _open_channel(self, key, password):
+        # A transport can die between uses (controller reboot); reconnect once and retry.
+        for attempt in (1, 2):
+            session = self._checkout(key, password)
+            try:
+                return session, session.client.get_transport().open_session(timeout=SSH_CONNECT_TIMEOUT)
+            except (paramiko.SSHException, EOFError, OSError, AttributeError) as e:
+                self._checkin(session)
+                self._discard(key, session)
+                if attempt == 2:
+                    raise
+                logger.warning(f"SSH connection to {key[1]}@{key[0]} was lost ({e}); reconnecting")
+
+    def _checkout(self, key, password):
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.alive():
+                session.channels += 1
+                return session
+            connecting = self._connecting.setdefault(key, threading.Lock())
+
+        # One handshake per key, however many threads are waiting for it
+        with connecting:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is not None and session.alive():
+                    session.channels += 1
+                    return session
+
+            host, user, port = key
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(hostname=host, port=port, username=user, password=password or SSH_PASSWORD,
+                           timeout=SSH_CONNECT_TIMEOUT)
+            self._tune(client)
+            logger.info(f"Opened pooled SSH connection to {user}@{host}:{port}")
+
+            session = _Session(client)
+            session.channels = 1
+            with self._lock:
+                previous = self._sessions.get(key)
+                self._sessions[key] = session
+        if previous is not None:
+            self._release(previous)
+        self._start_reaper()
+        return session
+
+    def _tune(self, client):
+        transport = client.get_transport()
+        transport.set_keepalive(self.keepalive)
+        # Commands are small request/response exchanges; without TCP_NODELAY each one stalls
+        # on Nagle plus delayed ACK (~40ms per round trip). OpenSSH sets it for the same reason.
+        try:
+            transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError):
+            pass  # Proxy channels and other non-TCP sockets
+
+    def _checkin(self, session):
+        with self._lock:
+            session.channels -= 1
+            session.last_used = time.monotonic()
+
+    def _discard(self, key, session):
+        with self._lock:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+        self._release(session)
+
+    @staticmethod
+    def _release(session):
+        # Adopted clients belong to whoever connected them (e.g. SSHService's console)
+        if session.owned:
+            session.client.close()
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="ssh pool reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(min(60, self.idle_timeout / 2))
+            now = time.monotonic()
+            with self._lock:
+                idle = [(key, session) for key, session in self._sessions.items()
+                        if session.owned and session.channels == 0
+                        and now - session.last_used > self.idle_timeout]
+                for key, _ in idle:
+                    del self._sessions[key]
+            for (host, user, port), session in idle:
+                logger.info(f"Closing idle SSH connection to {user}@{host}:{port}")
+                session.client.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ssh_pool():
+    """Return the process-wide SSHSessionPool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHSessionPool()
+        return _pool
+
+
+def run_ssh(host, user, command, timeout=None, port=SSH_PORT, password=None,
+            subscribers=(), max_output=SSH_MAX_OUTPUT):
+    """Run command on user@host over the shared pool. :return: subprocess.CompletedProcess."""
+    return get_ssh_pool().run(host, user, command, timeout=timeout, port=port, password=password,
+                              subscribers=subscribers, max_output=max_output)
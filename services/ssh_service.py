@@ -6,6 +6,12 @@ import paramiko
 import threading
 import json
 from pathlib import Path
+from db_connection import DB_FILE, get_manager
+from services.custom_logger import CustomLogger
+from services.ssh_pool import get_ssh_pool
+from services.ssh_stream import SSH_MAX_OUTPUT, stream_command
+
+logger = CustomLogger.get_logger("ssh_service")
 
 CRED_FILE = Path("config/ssh_credentials.json")
 KEY_HISTORY_FILE = Path("config/ssh_keys.json")
@@ -139,6 +145,7 @@ class SSHService:
                                         self.session_passphrase = pw
 
                             self.ssh_client.connect(hostname=host, username=user, pkey=private_key)
+                            get_ssh_pool().adopt(host, user, self.ssh_client)  # Reused by pooled commands
                             save_key_to_history(key_path)
                             self.output_console.insert(tk.END, f"[SSH] Connected using key: {key_path}\n")
                             self.exec_command("echo Connected to $(hostname) as $(whoami); uname -a", log_prefix="[Remote Info]")
@@ -148,6 +155,7 @@ class SSHService:
                             messagebox.showerror("Key Auth Error", f"Could not connect using private key:\n{e}")
                     else:
                         self.ssh_client.connect(hostname=host, username=user, password=passwd)
+                        get_ssh_pool().adopt(host, user, self.ssh_client)
                         self.output_console.insert(tk.END, f"[SSH] Connected to {user}@{host}\n")
                         win.destroy()
 
@@ -158,29 +166,34 @@ class SSHService:
             host = host_entry.get().strip()
             user = user_entry.get().strip()
             if host and user:
-                cur.execute("INSERT INTO ssh_targets (host, user) VALUES (?, ?)", (host, user))
-                self.conn.commit()
+                get_manager(DB_FILE).write("INSERT INTO ssh_targets (host, user) VALUES (?, ?)", (host, user))
                 messagebox.showinfo("Saved", f"Saved {user}@{host} to DB.")
 
         ttk.Button(win, text="Connect", command=launch_ssh).pack(pady=5)
         ttk.Button(win, text="Save Connection", command=save_connection).pack(pady=5)
 
-    def exec_command(self, command, log_prefix="[SSH]"):
+    def exec_command(self, command, log_prefix="[SSH]", timeout=None, max_output=SSH_MAX_OUTPUT):
+        """Run command on the connected controller, showing its output line by line as it arrives."""
         if not self.ssh_client:
             messagebox.showwarning("Not Connected", "You must connect first.")
             return
 
+        def show(stream, line):
+            tag = "" if stream == "stdout" else " [stderr]"
+            self.root.after(0, self.output_console.insert, tk.END, f"{log_prefix}{tag} {line}\n")
+
+        def record(stream, line):
+            logger.debug(f"{command} {stream}: {line}")
+
         def run():
+            self.root.after(0, self.output_console.insert, tk.END, f"\n{log_prefix} $ {command}\n")
             try:
-                stdin, stdout, stderr = self.ssh_client.exec_command(command)
-                output = stdout.read().decode()
-                error = stderr.read().decode()
-                if output:
-                    self.output_console.insert(tk.END, f"\n{log_prefix} Output:\n{output}")
-                if error:
-                    self.output_console.insert(tk.END, f"\n{log_prefix} Error:\n{error}")
+                channel = self.ssh_client.get_transport().open_session()
+                result = stream_command(channel, command, (show, record), timeout, max_output)
+                status = "stopped: output limit reached" if result.truncated else f"exit status {result.returncode}"
+                self.root.after(0, self.output_console.insert, tk.END, f"{log_prefix} ({status})\n")
             except Exception as e:
-                self.output_console.insert(tk.END, f"\n{log_prefix} Exception:\n{str(e)}\n")
+                self.root.after(0, self.output_console.insert, tk.END, f"\n{log_prefix} Exception:\n{str(e)}\n")
 
         threading.Thread(target=run, daemon=True).start()
 
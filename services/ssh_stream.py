@@ -0,0 +1,129 @@
+# services/ssh_stream.py
+
+"""
+Incremental reader for remote command output.
+
+Reading stdout to EOF and then stderr buffers everything until the command
+exits, and deadlocks once the command fills the stderr window while stdout is
+still being read. stream_command() waits on the channel and drains both
+streams as data arrives, handing complete lines to subscribers (console, log,
+result recorder) immediately. It also enforces a deadline and a cap on how much
+output is kept, so `tail`-style or runaway commands cannot hang a step or
+exhaust memory.
+"""
+
+import codecs
+import select
+import subprocess
+import time
+
+from services.custom_logger import CustomLogger
+
+logger = CustomLogger.get_logger("ssh_stream")
+
+SSH_MAX_OUTPUT = 4 * 1024 * 1024   # Bytes of stdout+stderr kept per command before it is stopped
+READ_CHUNK = 32768
+POLL_INTERVAL = 0.5                # Seconds between checks for exit status without new output
+
+
+class _LineSplitter:
+    """Decodes one stream incrementally and passes complete lines to the subscribers."""
+
+    def __init__(self, name, subscribers):
+        self.name = name
+        self.subscribers = subscribers
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.chunks = []
+        self.partial = ""
+
+    def feed(self, data, final=False):
+        text = self.decoder.decode(data, final)
+        self.chunks.append(text)
+        if not self.subscribers:
+            return
+        lines = (self.partial + text).split("\n")
+        self.partial = "" if final else lines.pop()
+        for line in lines:
+            if final and not line:
+                continue
+            self._emit(line.rstrip("\r"))
+
+    def _emit(self, line):
+        for subscriber in self.subscribers:
+            try:
+                subscriber(self.name, line)
+            except Exception as e:
+                logger.warning(f"Output subscriber {subscriber!r} failed: {e}")
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+
+def stream_command(channel, command, subscribers=(), timeout=None, max_output=SSH_MAX_OUTPUT):
+    """
+    Run command on an open paramiko channel and read its output as it arrives.
+    :param subscribers: Callables taking (stream, line), stream being "stdout" or "stderr"; called from this thread.
+    :param timeout: Seconds the whole command may take; the channel is closed and
+                    subprocess.TimeoutExpired raised when it runs over.
+    :param max_output: Bytes of output to keep; past that the channel is closed and the result is marked truncated.
+    :return: subprocess.CompletedProcess with a truncated attribute; returncode is -1 when truncated.
+    """
+    subscribers = list(subscribers)
+    out = _LineSplitter("stdout", subscribers)
+    err = _LineSplitter("stderr", subscribers)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    received = 0
+    truncated = False
+
+    def drain(ready, recv, splitter):
+        # Checked per chunk: a command writing faster than we read never empties the channel
+        nonlocal received
+        while ready():
+            data = recv(READ_CHUNK)
+            if max_output is not None and received + len(data) > max_output:
+                splitter.feed(data[:max_output - received])  # Keep exactly max_output bytes
+                received = max_output
+                return False
+            received += len(data)
+            splitter.feed(data)
+        return True
+
+    channel.exec_command(command)
+    channel.setblocking(0)
+    try:
+        while True:
+            if not (drain(channel.recv_ready, channel.recv, out)
+                    and drain(channel.recv_stderr_ready, channel.recv_stderr, err)):
+                truncated = True
+                logger.warning(f"Stopped '{command}' at the output limit of {max_output} bytes")
+                break
+            if channel.eof_received or channel.exit_status_ready():
+                if not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+                continue
+
+            wait = POLL_INTERVAL
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                wait = min(wait, POLL_INTERVAL)
+            # The channel's fileno is signalled when either stream has data or the channel closes
+            select.select([channel], [], [], wait)
+
+        out.feed(b"", final=True)
+        err.feed(b"", final=True)
+        if truncated:
+            status = -1
+        else:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not channel.status_event.wait(remaining):
+                raise subprocess.TimeoutExpired(command, timeout, output=out.text, stderr=err.text)
+            status = channel.recv_exit_status()
+    finally:
+        channel.close()
+
+    result = subprocess.CompletedProcess(command, status, out.text, err.text)
+    result.truncated = truncated
+    return result
@@ -0,0 +1,233 @@
+# services/step_plan.py
+
+"""
+Compile test queue steps into a validated, immutable plan.
+
+Queues come in several shapes: TestQueueBuilder and saved templates use dicts
+({"type": "mqtt", "command": "Page.Widgets.Pump1.IsSet=1"}), CommandBuilder
+uses tuples (("wait", "5 seconds")), and older templates carry pre_wait and
+post_wait keys. compile_steps() parses each of them once into MQTTStep,
+SSHStep and WaitStep records, expands legacy waits into wait steps, and checks
+widget paths against the widgets and widget_details views. Problems are
+collected as PlanIssues instead of surfacing halfway through a run, and the
+resulting StepPlan can be executed any number of times (or on any number of
+devices at once) without parsing a string again.
+"""
+
+import hashlib
+import json
+import operator
+import sqlite3
+from collections import namedtuple
+
+from db_connection import DB_FILE, get_manager
+
+DEFAULT_STEP_TIMEOUT = 30  # Seconds a step's completion condition may take
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda actual, expected: actual in expected,
+    "contains": lambda actual, expected: expected in actual,
+}
+
+WIDGET_PATH_PREFIX = ("Page", "Widgets")
+
+# kind and label are shared by every step type; label is what results and logs show
+MQTTStep = namedtuple("MQTTStep", "kind label path value timeout until reply")  # reply: wait for exec/response
+SSHStep = namedtuple("SSHStep", "kind label command timeout until")
+WaitStep = namedtuple("WaitStep", "kind label seconds until")
+
+# MQTT message a step waits for; check is None when any message on topic will do
+Until = namedtuple("Until", "topic path op check expected timeout")
+
+PlanIssue = namedtuple("PlanIssue", "index level message")  # level is "error" or "warning"
+
+
+class StepPlan:
+    """Compiled steps plus the issues found while compiling them."""
+
+    __slots__ = ("steps", "issues")
+
+    def __init__(self, steps, issues):
+        self.steps = tuple(steps)
+        self.issues = tuple(issues)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue.level == "error"]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self.issues if issue.level == "warning"]
+
+    def fingerprint(self):
+        """Short hash of the compiled steps, used to check that a resumed run is the same queue."""
+        description = [(step.kind, step.label, step.until and step.until[:3] + step.until[4:]) for step in self.steps]
+        return hashlib.sha1(repr(description).encode()).hexdigest()[:16]
+
+    def describe_issues(self):
+        """One line per issue, numbered like the queue shown to the user."""
+        return "\n".join(f"Step {issue.index + 1}: {issue.level}: {issue.message}" for issue in self.issues)
+
+
+def load_template(path):
+    """Read a queue template saved by the test queue (a JSON list of step dicts)."""
+    with open(path, "r") as f:
+        steps = json.load(f)
+    if not isinstance(steps, list):
+        raise ValueError(f"{path} is not a test queue template (expected a list of steps)")
+    return steps
+
+
+def as_step_dict(step):
+    """Convert a CommandBuilder tuple such as ("wait", "5 seconds") to the dict form used by queues."""
+    if isinstance(step, dict):
+        return step
+    kind, text = step
+    if kind == "wait":
+        return {"type": "wait", "value": text.split()[0] if text.split() else text}
+    return {"type": kind, "command": text}
+
+
+def split_widget_path(path):
+    """Split "Page.Widgets.Pump1.IsSet" into ("Pump1", "IsSet"), or return None for other paths."""
+    parts = path.split(".")
+    if tuple(parts[:2]) != WIDGET_PATH_PREFIX or len(parts) < 4:
+        return None
+    return parts[2], ".".join(parts[3:])
+
+
+def compile_steps(steps, db_path=DB_FILE, skip_post_wait=False, default_timeout=DEFAULT_STEP_TIMEOUT):
+    """
+    Compile a queue into a StepPlan.
+    :param steps: Dicts, CommandBuilder tuples, or an already compiled StepPlan (returned as is).
+    :param db_path: Database whose widgets Page.Widgets paths are checked against; None skips the check.
+    :param skip_post_wait: Drop legacy post_wait delays instead of turning them into wait steps.
+    """
+    if isinstance(steps, StepPlan):
+        return steps
+
+    compiled, issues = [], []
+    for index, step in enumerate(steps):
+        try:
+            step = as_step_dict(step)
+            if step.get("pre_wait"):
+                compiled.append(_wait(step["pre_wait"], None))
+            compiled.append(_compile_step(step, default_timeout))
+            if step.get("post_wait") and not skip_post_wait:
+                compiled.append(_wait(step["post_wait"], None))
+        except (KeyError, TypeError, ValueError) as e:
+            message = f"missing {e}" if isinstance(e, KeyError) else str(e)
+            issues.append(PlanIssue(index, "error", message))
+
+    if db_path is not None and not issues:
+        issues.extend(_check_widget_paths(compiled, steps, db_path))
+    return StepPlan(compiled, issues)
+
+
+def _compile_step(step, default_timeout):
+    kind = step["type"]
+    timeout = float(step.get("timeout", default_timeout))
+    until = _compile_until(step["until"], timeout) if step.get("until") else None
+
+    if kind == "mqtt":
+        command = step["command"]
+        if "=" not in command:
+            raise ValueError(f"MQTT command needs path=value: {command!r}")
+        # Only the first "=" separates path and value; values may contain "=" themselves
+        path, value = (part.strip() for part in command.split("=", 1))
+        if not path:
+            raise ValueError(f"MQTT command has no widget path: {command!r}")
+        return MQTTStep("mqtt", f"{path}={value}", path, value, timeout, until, bool(step.get("wait_reply")))
+    if kind == "ssh":
+        command = step["command"].strip()
+        if not command:
+            raise ValueError("SSH step has no command")
+        return SSHStep("ssh", command, command, timeout, until)
+    if kind == "simin":
+        parts = step["command"].split()
+        if len(parts) != 2:
+            raise ValueError(f"Simulated input needs 'name value': {step['command']!r}")
+        command = f"ec -s simin {parts[0]} {parts[1]}"
+        return SSHStep("ssh", command, command, timeout, until)
+    if kind == "wait":
+        if "value" not in step and until is None:
+            raise ValueError("Wait step needs seconds or an until condition")
+        return _wait(step.get("value"), until)
+    raise ValueError(f"Unknown step type: {kind!r}")
+
+
+def _wait(seconds, until):
+    if seconds is None:
+        return WaitStep("wait", "", None, until)
+    try:
+        seconds = float(seconds)
+    except ValueError:
+        raise ValueError(f"Wait needs a number of seconds: {seconds!r}") from None
+    if seconds < 0:
+        raise ValueError(f"Wait cannot be negative: {seconds}")
+    label = f"{seconds:g}"
+    return WaitStep("wait", label, seconds, until)
+
+
+def _compile_until(spec, default_timeout):
+    if not spec.get("topic"):
+        raise ValueError("until condition needs a topic")
+    op = spec.get("op", "==")
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown until operator {op!r}; use one of {', '.join(OPERATORS)}")
+    check = OPERATORS[op] if "value" in spec else None
+    return Until(spec["topic"], spec.get("path"), op, check, spec.get("value"),
+                 float(spec.get("timeout", default_timeout)))
+
+
+def _check_widget_paths(compiled, steps, db_path):
+    """Flag Page.Widgets paths whose widget is unknown (error) or whose property is not a known tag (warning)."""
+    references = {}
+    for step in compiled:
+        if step.kind == "mqtt":
+            widget_property = split_widget_path(step.path)
+            if widget_property is not None:
+                references.setdefault(widget_property, []).append(step)
+    if not references:
+        return []
+
+    widgets = sorted({widget for widget, _ in references})
+    placeholders = ",".join("?" * len(widgets))
+    manager = get_manager(db_path)
+    try:
+        known = {row[0] for row in manager.read(
+            f"SELECT DISTINCT widget_name FROM widgets WHERE widget_name IN ({placeholders})", widgets)}
+        tags = set(manager.read(
+            f"""SELECT DISTINCT w.widget_name, d.tag FROM widgets w
+                JOIN widget_details d ON d.widget_id = w.id
+                WHERE w.widget_name IN ({placeholders})""", widgets))
+    except sqlite3.OperationalError as e:
+        return [PlanIssue(0, "warning", f"widget paths not checked: {e}")]
+
+    # Issues point at the queue entry the user wrote, not at expanded wait steps
+    positions = {}
+    for index, step in enumerate(steps):
+        step = as_step_dict(step)
+        if step.get("type") == "mqtt" and "=" in step.get("command", ""):
+            positions.setdefault(step["command"].split("=", 1)[0].strip(), index)
+
+    issues = []
+    for (widget, prop), referencing in references.items():
+        index = positions.get(referencing[0].path, 0)
+        if widget not in known:
+            issues.append(PlanIssue(index, "error", f"unknown widget {widget!r} in {referencing[0].path}"))
+        elif (widget, prop) not in tags:
+            issues.append(PlanIssue(index, "warning", f"{widget} has no {prop!r} property in the parsed UI"))
+    return sorted(issues)
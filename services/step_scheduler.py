@@ -0,0 +1,208 @@
+# services/step_scheduler.py
+
+"""
+Event-driven runner for test queue sequences.
+
+Each step finishes as soon as its completion condition is met rather than after
+fixed sleeps around it:
+
+- mqtt steps finish once the broker acknowledges the command; steps marked
+  {"wait_reply": true} instead finish when the device answers on the exec
+  response topic (not every firmware publishes one);
+- ssh steps finish when the remote command exits;
+- any step may add an "until" condition, a message on an MQTT topic that
+  optionally satisfies a predicate on its payload (telemetry), e.g.
+  {"topic": "telemetry/pump1", "path": "pressure", "op": ">=", "value": 50, "timeout": 20}.
+  The topic is relative to the adapter's device prefix, if it has one.
+  The condition is subscribed before the step's action runs, so a fast reply
+  cannot be missed.
+
+Fixed delays exist only as explicit wait steps: {"type": "wait", "value": 10}.
+A wait step with an "until" condition and no value waits for the condition alone.
+Steps are compiled into a StepPlan (see step_plan) before they run.
+"""
+
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from services.custom_logger import CustomLogger
+from services.ssh_pool import SSH_PORT, run_ssh
+from services.step_plan import DEFAULT_STEP_TIMEOUT, compile_steps
+
+logger = CustomLogger.get_logger("step_scheduler")
+
+
+def payload_value(payload, path):
+    """Look up a dotted path ("sensors.0.value") in a decoded payload. :return: the value, or None."""
+    value = payload
+    for key in path.split(".") if path else ():
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return None
+    return value
+
+
+class Condition:
+    """An MQTT topic match, optionally with a payload predicate, that a step waits for."""
+
+    def __init__(self, client, until, topic=None):
+        """
+        :param until: Compiled step_plan.Until.
+        :param topic: Topic to watch instead of until.topic, e.g. with a device prefix applied.
+        """
+        self.client = client
+        self.until = until
+        self.topic = topic or until.topic
+        self.timeout = until.timeout
+        self.matched = None
+        self._event = threading.Event()
+
+    def __str__(self):
+        if self.until.check is None:
+            return f"message on {self.topic}"
+        return f"{self.topic} {self.until.path or 'payload'} {self.until.op} {self.until.expected!r}"
+
+    def arm(self):
+        self.client.route([self.topic], self._on_message)
+
+    def disarm(self):
+        self.client.unroute([self.topic], self._on_message)
+
+    def _on_message(self, message):
+        if self._event.is_set():
+            return
+        until = self.until
+        if until.check is not None:
+            actual = payload_value(message.payload, until.path)
+            try:
+                if actual is None or not until.check(actual, until.expected):
+                    return
+            except TypeError:
+                return  # e.g. comparing a string reading with a number
+        self.matched = message
+        self._event.set()
+
+    def wait(self, stop_event, started):
+        """Block until the condition is met, it times out, or stop_event is set. :return: True if met."""
+        deadline = started + self.timeout
+        while not self._event.is_set() and not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._event.wait(min(remaining, 0.5))
+        return self._event.is_set()
+
+
+class StepScheduler:
+    """Runs test queue steps back to back, advancing on each step's completion condition."""
+
+    def __init__(self, mqtt_adapter, test_creds, default_timeout=DEFAULT_STEP_TIMEOUT):
+        self.mqtt_adapter = mqtt_adapter
+        self.test_creds = test_creds
+        self.default_timeout = default_timeout
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Abandon the running sequence after the current step's action; also stops a run not yet started."""
+        self._stop.set()
+
+    def reset(self):
+        """Allow runs again after stop()."""
+        self._stop.clear()
+
+    def run(self, steps, repeat_count=1, on_result=None, start=(0, 0), keep_results=True):
+        """
+        Run steps repeat_count times.
+        :param steps: A StepPlan, or a queue that is compiled (without widget checks) first.
+        :param on_result: Called with each step's result dict as soon as the step finishes.
+        :param start: (repeat index, step index) to begin at, e.g. from results_sink.resume_points().
+        :param keep_results: Collect results for the return value; turn off for long runs whose
+                             results go to a ResultsSink through on_result instead.
+        :return: List of result dicts (repeat, step, type, start, command, status, output, end, duration_sec).
+        """
+        plan = compile_steps(steps, db_path=None, default_timeout=self.default_timeout)
+        if plan.errors:
+            raise ValueError(f"Invalid steps:\n{plan.describe_issues()}")
+        results = []
+        first_repeat, first_step = start
+        for repeat_index in range(first_repeat, repeat_count):
+            for step_index in range(first_step if repeat_index == first_repeat else 0, len(plan.steps)):
+                if self._stop.is_set():
+                    return results
+                result = self.run_step(plan.steps[step_index], repeat_index)
+                result["step"] = step_index
+                if keep_results:
+                    results.append(result)
+                if on_result is not None:
+                    on_result(result)
+        return results
+
+    def run_step(self, step, repeat_index=0):
+        """Run one compiled step (MQTTStep, SSHStep or WaitStep). :return: its result dict."""
+        started = time.monotonic()
+        start_time = datetime.now()
+        result = {
+            "repeat": repeat_index + 1,
+            "type": step.kind,
+            "start": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "command": step.label
+        }
+
+        condition = None
+        if step.until is not None:
+            condition = Condition(self.mqtt_adapter.client, step.until,
+                                  topic=self.mqtt_adapter.device_topic(step.until.topic))
+            condition.arm()
+        try:
+            self._run_action(step, result, waits_for_reply=condition is None)
+            if condition is not None and result.get("status") in (None, "success", "waited"):
+                if condition.wait(self._stop, started):
+                    result["status"] = "success"
+                    result["condition"] = f"{condition} after {time.monotonic() - started:.2f}s"
+                    if condition.matched is not None:
+                        result["matched"] = condition.matched.payload
+                else:
+                    result["status"] = "stopped" if self._stop.is_set() else "timeout"
+                    result["condition"] = f"{condition} not met within {condition.timeout}s"
+                    logger.warning(f"Step {result['command']!r}: {result['condition']}")
+        except subprocess.TimeoutExpired as e:
+            result["status"] = "timeout"
+            result["output"] = f"No exit within {e.timeout}s\n{(e.output or '').strip()}"
+        except Exception as e:
+            result["status"] = "error"
+            result["output"] = str(e)
+        finally:
+            if condition is not None:
+                condition.disarm()
+
+        result["end"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        result["duration_sec"] = round(time.monotonic() - started, 3)
+        return result
+
+    def _run_action(self, step, result, waits_for_reply):
+        if step.kind == "wait":
+            if step.seconds is not None:
+                self._stop.wait(step.seconds)
+                result["status"] = "waited"
+                result["output"] = f"Waited {step.label} seconds"
+        elif step.kind == "mqtt":
+            if not waits_for_reply:
+                # The step's own condition decides when it is done
+                self.mqtt_adapter.publish_exec(step.path, step.value)
+                return
+            if step.reply:
+                reply = self.mqtt_adapter.send_command_and_wait(step.path, step.value, timeout=step.timeout)
+            else:
+                reply = self.mqtt_adapter.send_command(step.path, step.value, timeout=step.timeout)
+            result.update(reply)
+            result["status"] = "success" if reply.get("success") else "fail"
+        elif step.kind == "ssh":
+            proc = run_ssh(self.test_creds['host'], self.test_creds['user'], step.command, timeout=step.timeout,
+                           port=self.test_creds.get('port', SSH_PORT), password=self.test_creds.get('password'))
+            result["status"] = "success" if proc.returncode == 0 else "fail"
+            result["output"] = proc.stdout.strip() + proc.stderr.strip()
@@ -0,0 +1,34 @@
+"""EXPLAIN QUERY PLAN checks: none of db_bootstrap.HOT_QUERIES may scan a whole table."""
+
+import sqlite3
+
+import pytest
+
+from db_bootstrap import SCHEMA_VERSION, _create_legacy_tables, find_full_scans, init_db, migrate_db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "ui_map.db"))
+    yield conn
+    conn.close()
+
+
+def test_fresh_database_has_no_full_scans(conn):
+    init_db(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert find_full_scans(conn) == {}
+
+
+def test_migrated_legacy_database_has_no_full_scans(conn):
+    # A database written before any migration: original tables, user_version 0
+    cur = conn.cursor()
+    _create_legacy_tables(cur)
+    cur.execute("INSERT INTO widgets (page_name, widget_type, widget_name, widget_index, widget_config) "
+                "VALUES ('home', 'Button', 'Pump1', '1', '{}')")
+    cur.execute("INSERT INTO widget_details (widget_id, tag, value) VALUES (1, 'IsSet', '0')")
+    conn.commit()
+
+    assert migrate_db(conn) == 0
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert find_full_scans(conn) == {}
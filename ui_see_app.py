@@ -1,20 +1,12 @@
 import os
 import re
-import json
 import sqlite3
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from db_bootstrap import parse_sql_file
 
 DB_FILE = "ui_map.db"
 
-def extract_resources(config_str):
-    try:
-        config = json.loads(config_str)
-        resources = config.get("Resources", {}).get("resource", [])
-        return [(entry.get("tag"), entry.get("value")) for entry in resources if "tag" in entry]
-    except Exception:
-        return []
-
 def init_db():
     if os.path.exists(DB_FILE):
         os.remove(DB_FILE)
@@ -78,55 +70,23 @@ def parse_sql_and_js(sql_folder, js_folder):
         if not filename.endswith(".sql"):
             continue
 
-        page_name = os.path.splitext(filename)[0]
-        with open(os.path.join(sql_folder, filename), 'r', encoding='utf-8') as f:
-            content = f.read()
-
-            cur.execute("INSERT OR IGNORE INTO pages (name) VALUES (?)", (page_name,))
-
-            # PagesInstalled
-            for match in re.finditer(
-                r'INSERT INTO\s+"?PagesInstalled"?\s*\(\s*"PageName"\s*,\s*"PageID"\s*,\s*"PageConfig"\s*\)\s*VALUES\s*\(\s*\'(.*?)\'\s*,\s*(\d+)\s*,\s*\'(.*?)\'\s*\);?',
-                content, re.DOTALL | re.IGNORECASE):
-                page_name_sql, _, json_str = match.groups()
-                json_str = json_str.replace('""', '"')
-                for tag, value in extract_resources(json_str):
-                    cur.execute("INSERT INTO page_details (page_name, tag, value) VALUES (?, ?, ?)",
-                                (page_name_sql, tag, value))
-
-            # WidgetsInstalled
-            for match in re.finditer(
-                r'INSERT INTO\s+"?WidgetsInstalled"?\s*\(\s*"WidgetConfigID"\s*,\s*"WidgetID"\s*,\s*"WidgetConfig"\s*\)\s*VALUES\s*\(\s*(\d+)\s*,\s*(\d+)\s*,\s*\'(.*?)\'\s*\);?',
-                content, re.DOTALL | re.IGNORECASE):
-                widget_config_id, widget_id, config_str = match.groups()
-                config_str = config_str.replace('""', '"')
-                widget_type = widget_name = widget_index = ""
-
-                try:
-                    config_data = json.loads(config_str)
-                    for entry in config_data.get("Resources", {}).get("resource", []):
-                        tag = entry.get("tag")
-                        if tag == "Name":
-                            widget_name = entry.get("value")
-                        elif tag == "ButtonType":
-                            widget_type = entry.get("value")
-                        elif tag == "WidgetIndex":
-                            widget_index = entry.get("value")
-                except:
-                    pass
-
-                cur.execute("""INSERT INTO widgets (
-                    page_name, widget_type, widget_name, widget_index,
-                    widget_config, widget_config_id, widget_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)""", (
-                    page_name, widget_type, widget_name, widget_index,
-                    config_str, widget_config_id, widget_id
-                ))
-                db_widget_id = cur.lastrowid
-
-                for tag, value in extract_resources(config_str):
-                    cur.execute("INSERT INTO widget_details (widget_id, tag, value) VALUES (?, ?, ?)",
-                                (db_widget_id, tag, value))
+        page_name, page_rows, widget_rows = parse_sql_file(os.path.join(sql_folder, filename))
+
+        cur.execute("INSERT OR IGNORE INTO pages (name) VALUES (?)", (page_name,))
+
+        # PagesInstalled
+        cur.executemany("INSERT INTO page_details (page_name, tag, value) VALUES (?, ?, ?)", page_rows)
+
+        # WidgetsInstalled
+        for widget_row, tags in widget_rows:
+            cur.execute("""INSERT INTO widgets (
+                page_name, widget_type, widget_name, widget_index,
+                widget_config, widget_config_id, widget_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)""", widget_row)
+            db_widget_id = cur.lastrowid
+
+            cur.executemany("INSERT INTO widget_details (widget_id, tag, value) VALUES (?, ?, ?)",
+                            [(db_widget_id, tag, value) for tag, value in tags])
 
         # JS parsing: NavigateTo AND all functions
         for filename in os.listdir(js_folder):
@@ -0,0 +1,211 @@
+# uisee_cli.py
+
+"""
+Headless runner for saved test queue templates.
+
+    python uisee_cli.py run bvt.json --device pi@10.0.3.7 --repeat 100 --out results.jsonl
+    python uisee_cli.py run bvt.json --inventory lab.json --workers 8
+    python uisee_cli.py resume results.jsonl
+    python uisee_cli.py tail results.jsonl
+    python uisee_cli.py check bvt.json
+
+Templates are the JSON files written by the test queue's "Save as Template".
+Runs use the same engine as the GUI (step_plan, StepScheduler, FleetRunner)
+and never import tkinter, so they work over SSH and in nightly jobs. Each step
+result is appended to the --out JSON Lines file as soon as it completes (see
+results_sink), progress is printed to stderr, an interrupted run can be resumed
+from its results file, and `tail` follows a run from another terminal. The exit
+status is 0 when every device passed, 1 when any step failed and 2 when the
+template or arguments are invalid.
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+from db_connection import DB_FILE
+from services.fleet_runner import FLEET_MAX_WORKERS, FleetRunner, load_inventory
+from services.results_sink import ResultsSink, default_results_path, resume_points, tail_results
+from services.ssh_pool import SSH_PORT
+from services.step_plan import compile_steps, load_template
+
+
+def parse_device(spec):
+    """
+    Parse "[user@]host[:port][/mqtt/prefix]" into an inventory entry.
+    The user defaults to SSH_USER; the prefix is the device's MQTT topic prefix.
+    """
+    target, _, prefix = spec.partition("/")
+    user, _, host = target.rpartition("@")
+    host, _, port = host.partition(":")
+    user = user or os.getenv("SSH_USER")
+    if not host or not user:
+        raise argparse.ArgumentTypeError(f"expected [user@]host[:port][/prefix], got {spec!r} (or set SSH_USER)")
+    device = {"name": prefix or host, "host": host, "user": user, "port": int(port) if port else SSH_PORT}
+    if prefix:
+        device["prefix"] = prefix
+    return device
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="uisee", description="Run UISee test queue templates without the GUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_template_args(sub):
+        sub.add_argument("template", help="Test queue template saved from the GUI (JSON)")
+        sub.add_argument("--db", default=DB_FILE,
+                         help="UI map database to check widget paths against (default: %(default)s; 'none' skips)")
+        sub.add_argument("--skip-post-wait", action="store_true", help="Drop legacy post_wait delays")
+
+    check = commands.add_parser("check", help="Validate a template and list its problems")
+    add_template_args(check)
+
+    run = commands.add_parser("run", help="Run a template on one or more controllers")
+    add_template_args(run)
+    run.add_argument("--device", action="append", type=parse_device, default=[], metavar="[USER@]HOST[:PORT][/PREFIX]",
+                     help="Controller to test; repeat for several (default: SSH_HOST/SSH_USER)")
+    run.add_argument("--inventory", help="JSON device inventory, as used by Run on Fleet")
+    run.add_argument("--repeat", type=int, default=1, help="Times to run the template (default: %(default)s)")
+    run.add_argument("--out", help="JSON Lines file results are appended to (default: results_<time>.jsonl)")
+    run.add_argument("--workers", type=int, default=FLEET_MAX_WORKERS,
+                     help="Devices tested at the same time (default: %(default)s)")
+    run.add_argument("--broker", help="MQTT broker host (default: MQTT_BROKER)")
+    run.add_argument("--mqtt-port", type=int, help="MQTT broker port (default: MQTT_PORT)")
+    run.add_argument("--mqtt-user", help="MQTT username (default: MQTT_USERNAME)")
+    run.add_argument("--mqtt-password", help="MQTT password (default: MQTT_PASSWORD)")
+    run.add_argument("--quiet", action="store_true", help="Only print the summary")
+
+    resume = commands.add_parser("resume", help="Continue an interrupted run from its results file")
+    resume.add_argument("results", help="JSON Lines results file of the interrupted run")
+    resume.add_argument("--workers", type=int, default=FLEET_MAX_WORKERS,
+                        help="Devices tested at the same time (default: %(default)s)")
+    resume.add_argument("--mqtt-password", help="MQTT password (default: MQTT_PASSWORD)")
+    resume.add_argument("--quiet", action="store_true", help="Only print the summary")
+
+    tail = commands.add_parser("tail", help="Print a run's results as they are recorded")
+    tail.add_argument("results", help="JSON Lines results file")
+    tail.add_argument("--no-follow", action="store_true", help="Print what is there and exit")
+    return parser
+
+
+def compile_template(template, db, skip_post_wait):
+    """:return: StepPlan, or None after printing its errors."""
+    db_path = None if db is None or db.lower() == "none" or not os.path.exists(db) else db
+    plan = compile_steps(load_template(template), db_path, skip_post_wait=skip_post_wait)
+    if plan.issues:
+        print(plan.describe_issues(), file=sys.stderr)
+    return None if plan.errors else plan
+
+
+def run_template(args, plan):
+    devices = list(args.device)
+    if args.inventory:
+        devices.extend(load_inventory(args.inventory))
+    if not devices:
+        if not os.getenv("SSH_HOST"):
+            print("uisee: no devices; use --device, --inventory or set SSH_HOST/SSH_USER", file=sys.stderr)
+            return 2
+        devices.append(parse_device(os.getenv("SSH_HOST")))
+    mqtt = {"host": args.broker, "port": args.mqtt_port, "username": args.mqtt_user}
+
+    # Everything resume needs, except passwords
+    run_info = {"template": os.path.abspath(args.template), "plan": plan.fingerprint(), "steps": len(plan),
+                "repeat_count": args.repeat, "skip_post_wait": args.skip_post_wait, "mqtt": mqtt,
+                "devices": [{key: value for key, value in device.items() if key != "password"} for device in devices]}
+    sink = ResultsSink(args.out or default_results_path(), run_info)
+    return execute(plan, devices, dict(mqtt, password=args.mqtt_password), args.repeat, sink, None, args)
+
+
+def resume_run(args):
+    header, points = resume_points(args.results)
+    if header is None:
+        print(f"uisee: {args.results} has no run header; it was not written by a run", file=sys.stderr)
+        return 2
+    plan = compile_template(header["template"], None, header.get("skip_post_wait", False))
+    if plan is None:
+        return 2
+    if plan.fingerprint() != header["plan"]:
+        print(f"uisee: {header['template']} changed since the run started; cannot resume", file=sys.stderr)
+        return 2
+    done = sum(point["done"] for point in points.values())
+    print(f"Resuming {args.results}: {done} results already recorded", file=sys.stderr)
+    sink = ResultsSink(args.results, resume=True)
+    mqtt_creds = dict(header.get("mqtt") or {}, password=args.mqtt_password)
+    return execute(plan, header["devices"], mqtt_creds, header["repeat_count"], sink, points, args)
+
+
+def execute(plan, devices, mqtt_creds, repeat_count, sink, resume, args):
+    def on_progress(name, done, total, result):
+        if result is None:
+            return
+        sink.record(result, device=name)
+        if not args.quiet:
+            print(f"[{name}] {done}/{total} {result['type']} {result['command']}: "
+                  f"{result.get('status')} ({result['duration_sec']}s)", file=sys.stderr)
+
+    runner = FleetRunner(devices, mqtt_creds=mqtt_creds, max_workers=args.workers, on_progress=on_progress)
+    report = {}
+    worker = threading.Thread(target=lambda: report.update(
+        runner.run(plan, repeat_count, resume=resume, keep_results=False)), name="uisee run")
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        print("uisee: stopping after the current steps...", file=sys.stderr)
+        runner.stop()
+        worker.join()
+
+    if not report:
+        sink.close()
+        return 1
+    finished = all(entry["status"] != "skipped" and entry["done"] == len(plan) * repeat_count
+                   for entry in report["devices"].values())
+    # Without a summary record the file can still be resumed
+    sink.close(report if finished else None)
+    for name, entry in report["devices"].items():
+        print(f"{name}: {entry['status']} ({entry['done']} steps, {entry['failures']} failed)", file=sys.stderr)
+    summary = ", ".join(f"{count} {status}" for status, count in report["summary"].items() if count)
+    print(f"{summary} in {report['duration_sec']}s; results in {sink.path}", file=sys.stderr)
+    return 0 if report["summary"]["passed"] == len(devices) else 1
+
+
+def tail_run(args):
+    for record in tail_results(args.results, follow=not args.no_follow):
+        if "run" in record:
+            run = record["run"]
+            print(f"Run of {run.get('template')} started {run.get('started')}: "
+                  f"{len(run.get('devices', []))} devices x {run.get('repeat_count')} repeats")
+        elif "summary" in record:
+            print(f"Finished: {record['summary'].get('summary')}")
+        else:
+            print(f"[{record.get('device')}] repeat {record.get('repeat')} step {record.get('step', 0) + 1} "
+                  f"{record.get('type')} {record.get('command')}: {record.get('status')} ({record.get('duration_sec')}s)")
+        sys.stdout.flush()
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "tail":
+            return tail_run(args)
+        if args.command == "resume":
+            return resume_run(args)
+        plan = compile_template(args.template, args.db, args.skip_post_wait)
+        if plan is None:
+            return 2
+        if args.command == "check":
+            print(f"{args.template}: {len(plan)} steps OK", file=sys.stderr)
+            return 0
+        return run_template(args, plan)
+    except KeyboardInterrupt:
+        return 130
+    except (OSError, ValueError) as e:
+        print(f"uisee: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,11 @@
-
 # utils/__init__.py
 
-from .ui_mapper_adapter import UIMQTTAdapter
+from .sql_tokenizer import iter_insert_statements
+
 
+def __getattr__(name):
+    # Imported on first use so the parser workers do not pull in paramiko/MQTT
+    if name == "UIMQTTAdapter":
+        from .ui_mapper_adapter import UIMQTTAdapter
+        return UIMQTTAdapter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,23 @@
+# utils/json_backend.py
+
+"""
+Pick the fastest JSON decoder available: orjson, then ujson, then the stdlib.
+
+Only decoding goes through here; both accelerated libraries accept str input
+and return the same plain dict/list/str/number objects as json.loads.
+"""
+
+import json
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        json_loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        json_loads = json.loads
+        JSON_BACKEND = "json"
@@ -0,0 +1,246 @@
+# utils/sql_tokenizer.py
+
+"""
+Streaming tokenizer for the INSERT statements in UIPages .sql dumps.
+
+The file is read in fixed-size chunks and only the statement currently being
+tokenized is buffered, so memory stays flat no matter how large the dump is.
+Quoting follows SQL rules: '' inside a single-quoted string and "" inside a
+double-quoted identifier each stand for one quote character.
+"""
+
+import os
+import re
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+_BARE_WORD = re.compile(r"[^\s'\"(),;]+")
+_INTEGER = re.compile(r"[-+]?\d+\Z")
+_FLOAT = re.compile(r"[-+]?(\d+\.\d*|\.\d+|\d+)([eE][-+]?\d+)?\Z")
+
+
+class _Lexer:
+    """Turns a text stream into (kind, text) tokens: word, string, ident or punct."""
+
+    def __init__(self, stream, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _more(self):
+        """Append the next chunk, dropping everything already consumed. False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _quoted(self, quote):
+        parts = []
+        start = self.pos + 1
+        while True:
+            end = self.buf.find(quote, start)
+            if end == -1:
+                parts.append(self.buf[start:])
+                self.pos = len(self.buf)
+                if not self._more():
+                    return "".join(parts)  # Unterminated literal at EOF
+                start = 0
+                continue
+
+            if end + 1 == len(self.buf):
+                # One more character is needed to tell a closing quote from a doubled one
+                parts.append(self.buf[start:end])
+                self.pos = end
+                if not self._more():
+                    self.pos = end + 1
+                    return "".join(parts)
+                start = end = 0
+
+            if self.buf[end + 1] == quote:
+                parts.append(self.buf[start:end + 1])
+                start = end + 2
+                continue
+
+            parts.append(self.buf[start:end])
+            self.pos = end + 1
+            return "".join(parts)
+
+    def _skip_until(self, terminator):
+        while True:
+            end = self.buf.find(terminator, self.pos)
+            if end != -1:
+                self.pos = end + len(terminator)
+                return
+            # Keep a possible partial terminator at the end of the buffer
+            self.pos = max(self.pos, len(self.buf) - len(terminator) + 1)
+            if not self._more():
+                self.pos = len(self.buf)
+                return
+
+    def tokens(self):
+        while True:
+            if self.pos >= len(self.buf) and not self._more():
+                return
+            ch = self.buf[self.pos]
+
+            if ch.isspace():
+                self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            elif ch == "'":
+                yield "string", self._quoted("'")
+            elif ch == '"':
+                yield "ident", self._quoted('"')
+            elif ch in "(),;":
+                self.pos += 1
+                yield "punct", ch
+            elif ch in "-/" and self.pos + 1 >= len(self.buf) and self._more():
+                continue  # Comment markers are two characters long
+            elif self.buf.startswith("--", self.pos):
+                self._skip_until("\n")
+            elif self.buf.startswith("/*", self.pos):
+                self._skip_until("*/")
+            else:
+                match = _BARE_WORD.match(self.buf, self.pos)
+                if match.end() == len(self.buf) and self._more():
+                    continue  # The word may continue in the next chunk
+                self.pos = match.end()
+                yield "word", match.group()
+
+
+def _literal(kind, text):
+    if kind == "word":
+        if text.upper() == "NULL":
+            return None
+        if _INTEGER.match(text):
+            return int(text)
+        if _FLOAT.match(text):
+            return float(text)
+    return text
+
+
+def _value(parts):
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return _literal(*parts[0])
+    # Expressions such as CAST(... AS TEXT) are kept as raw source text
+    return " ".join(text for _, text in parts)
+
+
+def _read_values(tokens):
+    """Read one parenthesised VALUES tuple; the opening '(' is already consumed."""
+    values = []
+    parts = []
+    depth = 0
+    for kind, text in tokens:
+        if kind == "punct":
+            if text == ";":
+                return None
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                if not depth:
+                    if parts or values:
+                        values.append(_value(parts))
+                    return values
+                depth -= 1
+            elif text == "," and not depth:
+                values.append(_value(parts))
+                parts = []
+                continue
+        parts.append((kind, text))
+    return None
+
+
+def _skip_statement(tokens):
+    for kind, text in tokens:
+        if kind == "punct" and text == ";":
+            return
+
+
+def _parse_insert(tokens, tables):
+    """Parse the rest of an INSERT statement, yielding (table, columns, values) per row."""
+    table = None
+    for kind, text in tokens:
+        if kind == "word" and text.upper() == "INTO":
+            table = next(tokens, (None, None))[1]
+            # Schema-qualified names (main."Table") only keep the table part
+            while table and table.endswith("."):
+                table = next(tokens, (None, None))[1]
+            break
+        if kind == "punct" and text == ";":
+            return
+    if table is None:
+        return
+    table = table.rsplit(".", 1)[-1].strip('`[]')
+
+    if tables is not None and table.lower() not in tables:
+        _skip_statement(tokens)
+        return
+
+    columns = []
+    kind, text = next(tokens, (None, None))
+    if kind == "punct" and text == "(":
+        for kind, text in tokens:
+            if kind == "punct" and text == ")":
+                break
+            if kind != "punct":
+                columns.append(text.strip('`[]'))
+        kind, text = next(tokens, (None, None))
+
+    if kind != "word" or text.upper() != "VALUES":
+        if not (kind == "punct" and text == ";"):
+            _skip_statement(tokens)
+        return
+
+    columns = tuple(columns)
+    while True:
+        kind, text = next(tokens, (None, None))
+        if kind != "punct" or text != "(":
+            if not (kind == "punct" and text == ";") and kind is not None:
+                _skip_statement(tokens)
+            return
+        values = _read_values(tokens)
+        if values is None:
+            return
+        yield table, columns, tuple(values)
+
+        kind, text = next(tokens, (None, None))
+        if kind == "punct" and text == ",":
+            continue
+        if not (kind == "punct" and text == ";") and kind is not None:
+            _skip_statement(tokens)
+        return
+
+
+def iter_insert_statements(source, tables=None, chunk_size=DEFAULT_CHUNK_SIZE, encoding="utf-8"):
+    """
+    Stream the INSERT statements of a SQL dump.
+
+    :param source: Path to the .sql file, or an open text stream.
+    :param tables: Optional iterable of table names to keep (case-insensitive);
+                   other statements are skipped.
+    :param chunk_size: Number of characters read per chunk.
+    :return: Generator of (table, columns, values) tuples, one per inserted row.
+             columns is empty when the statement has no column list. Quoted values
+             are str, bare numbers int/float and NULL None.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding=encoding) as stream:
+            yield from iter_insert_statements(stream, tables, chunk_size)
+        return
+
+    if tables is not None:
+        tables = {name.lower() for name in tables}
+
+    tokens = _Lexer(source, chunk_size).tokens()
+    for kind, text in tokens:
+        if kind == "word" and text.upper() == "INSERT":
+            yield from _parse_insert(tokens, tables)
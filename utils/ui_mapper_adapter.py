@@ -1,37 +1,96 @@
 import os
-import paramiko
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
-from services.mqtt_service import MQTTService
+from services.ssh_pool import SSH_PORT, run_ssh
+from services.mqtt_service import get_client, release_client, DEFAULT_REQUEST_TIMEOUT, MQTT_COMMAND_QOS
 
 # Load environment variables from .env file
 load_dotenv()
 
+def broker_options(mqtt_creds):
+    """Map the GUI's MQTT settings (host, port, username, password) to get_client() arguments."""
+    if not mqtt_creds:
+        return {}
+    options = {key: mqtt_creds.get(name) for key, name in
+               (("broker", "host"), ("port", "port"), ("username", "username"), ("password", "password"))}
+    return {key: value for key, value in options.items() if value}
+
+
 class UIMQTTAdapter:
-    def __init__(self, test_creds=None):
-        self.client = MQTTService()
-        self.client.connect()
+    def __init__(self, test_creds=None, mqtt_creds=None, topic_prefix=None):
+        """
+        :param topic_prefix: Device prefix for fleets sharing one broker, e.g. "lab/ctrl07"; exec commands
+                             then go to "lab/ctrl07/exec" and replies are read from "lab/ctrl07/exec/response".
+        """
+        # Shared with every other user of the same broker; connects on the first command
+        self.client = get_client(**broker_options(mqtt_creds))
+        self.topic_prefix = topic_prefix.strip("/") if topic_prefix else None
 
         # Pull fallback SSH info from environment
         self.ssh_host = test_creds.get("host") if test_creds else os.getenv("SSH_HOST")
         self.ssh_user = test_creds.get("user") if test_creds else os.getenv("SSH_USER")
-        self.ssh_pass = os.getenv("SSH_PASS")
-        
-    def send_command_and_wait(self, path, value):
+        self.ssh_pass = (test_creds or {}).get("password") or os.getenv("SSH_PASS")
+        self.ssh_port = (test_creds or {}).get("port", SSH_PORT)
+
+    def device_topic(self, topic):
+        """Topic as seen by this adapter's device (prefixed when a topic_prefix is set)."""
+        return f"{self.topic_prefix}/{topic}" if self.topic_prefix else topic
+
+    def send_command_and_wait(self, path, value, timeout=DEFAULT_REQUEST_TIMEOUT):
+        """
+        Send an exec command and wait for the device's reply on the exec response topic.
+        Falls back to SSH if MQTT is not connected.
+        :return: {"success": True, "response": ...} or {"success": False, "error": ...}.
+        """
+        command = f"{path}={value}"
+        if not self.client.ensure_connected():
+            return self.send_via_ssh(command)
+        return self.client.send_request(self.device_topic(self.client.topic_exec), {"command": command},
+                                        self.device_topic(self.client.topic_exec_response), timeout)
+
+    def send_command(self, path, value, timeout=DEFAULT_REQUEST_TIMEOUT):
+        """
+        Send an exec command and wait until the broker has acknowledged it, without waiting for a reply.
+        Falls back to SSH if MQTT is not connected.
+        :return: {"success": True, "response": ...} or {"success": False, "error": ...}.
+        """
         command = f"{path}={value}"
-        self.client.publish("exec", command)
-        return {"status": "sent", "output": f"Published to exec: {command}"}
+        if not self.client.ensure_connected():
+            return self.send_via_ssh(command)
+        published = self.client.publish_tracked(self.device_topic(self.client.topic_exec), {"command": command},
+                                                qos=MQTT_COMMAND_QOS, coalesce_key=self.device_topic(path))
+        try:
+            published.result(timeout)
+        except FutureTimeoutError:
+            return {"success": False, "error": f"Not published within {timeout}s"}
+        except ConnectionError as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "response": "Published"}
 
     def publish_exec(self, widget_path, value):
         """
         Sends an exec-style MQTT command without waiting for a response.
+        A newer value for the same widget replaces one still waiting to be sent.
         Falls back to SSH if MQTT is not connected.
         """
-        if self.client.connected:
+        if self.client.ensure_connected():
             payload = {"command": f"{widget_path}={value}"}
-            self.client.publish(self.client.topic_exec, payload)
+            self.client.publish(self.device_topic(self.client.topic_exec), payload, qos=MQTT_COMMAND_QOS,
+                                coalesce_key=self.device_topic(widget_path))
         else:
             return self.send_via_ssh(f"{widget_path}={value}")
 
+    def set_broker(self, mqtt_creds):
+        """Switch to the shared client for another broker or credentials. :return: the new client."""
+        client = get_client(**broker_options(mqtt_creds))
+        release_client(self.client)
+        self.client = client
+        return client
+
+    def close(self):
+        """Give the shared MQTT client back; the last user disconnects it."""
+        release_client(self.client)
+
     def send_via_ssh(self, command):
         """
         Fallback method to send command over SSH if MQTT is not available.
@@ -40,15 +99,11 @@ class UIMQTTAdapter:
             return {"success": False, "error": "SSH credentials not fully set in environment variables."}
 
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(self.ssh_host, username=self.ssh_user, password=self.ssh_pass)
-
-            stdin, stdout, stderr = ssh.exec_command(f"ec {command}")
-            out = stdout.read().decode().strip()
-            err = stderr.read().decode().strip()
-
-            ssh.close()
+            # Pooled connection: only the first fallback command pays for the handshake
+            result = run_ssh(self.ssh_host, self.ssh_user, f"ec {command}", port=self.ssh_port,
+                             password=self.ssh_pass)
+            out = result.stdout.strip()
+            err = result.stderr.strip()
 
             if err:
                 return {"success": False, "error": err}